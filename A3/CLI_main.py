@@ -43,6 +43,8 @@ How to use:
         - One xxx_ARCH.ifc file containing spaces (and furniture for occupancy estimation)
 - Run main.py and follow the instructions in the CLI
 - Enjoy BCF files of failing checks and terminal output :)
+- Run "python A3/CLI_main.py --profile" to time each step (table in the terminal, trace in A3/outputFiles/profile)
+  ("--profile-memory" also records the peak memory of each step, but makes the run a lot slower)
 
 Future Work:
     small(er) stuff
@@ -70,6 +72,7 @@ from Modules.BcfGenerator import *
 from Modules.setupFunctions import *
 
 import os
+import sys
 from datetime import datetime
 import ifcopenshell
 from rich.console import Console
@@ -80,11 +83,14 @@ from rich.panel import Panel
 from rich.console import Console
 from datetime import datetime
 from Modules.menu import bigMenu
+from Modules.Profiler import reportProfile, startProfiling, stopProfiling
 from rich.panel import Panel
 
 if __name__ == "__main__":
     console = Console()
     start_time = datetime.now()
+    if "--profile" in sys.argv or "--profile-memory" in sys.argv:
+        startProfiling(memory="--profile-memory" in sys.argv)
 
     console.print("\n")
     console.print(
@@ -99,6 +105,10 @@ if __name__ == "__main__":
 
     bigMenu(console)
 
+    prof = stopProfiling()
+    if prof is not None:
+        reportProfile(console, prof, "A3/outputFiles/profile")
+
     end_time = datetime.now()
     console.print(
         f"[bold cyan]\nSession closed. Total time: {round((end_time - start_time).total_seconds(), 2)} seconds[/bold cyan]"
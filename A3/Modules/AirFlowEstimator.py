@@ -6,6 +6,11 @@ import ifcopenshell.util.pset
 import ifcopenshell.util.element
 import ifcopenshell.api.pset
 
+from .PsetWriter import writePsets
+from .PropertyIndex import getPropertyIndex
+from .OccupancyIndex import getOccupancyIndex
+from .Profiler import profiled
+
 from rich.console import Console
 
 from rich.table import Table
@@ -13,7 +18,151 @@ from rich.table import Table
 from rich import inspect
 import numpy as np
 
+BUILDING_CATEGORIES = ["I", "II", "III", "IV"]
+
+# According to DS_EN 16798-1:2019
+airFlowDict = {
+    "I": {
+        "l/s per person": 10,  # l/s per person
+        "l/s per area": 1.0,  # l/s per m²
+        "l/s backup": 2,  # l/s per m² (if person density is unknown)
+    },
+    "II": {
+        "l/s per person": 7,  # l/s per person
+        "l/s per area": 0.7,  # l/s per m²
+        "l/s backup": 1.4,  # l/s per m² (if person density is unknown)
+    },
+    "III": {
+        "l/s per person": 4,  # l/s per person
+        "l/s per area": 0.4,  # l/s per m²
+        "l/s backup": 0.8,  # l/s per m² (if person density is unknown)
+    },
+    "IV": {
+        "l/s per person": 2.5,  # l/s per person
+        "l/s per area": 0.3,  # l/s per m²
+        "l/s backup": 0.55,  # l/s per m² (if person density is unknown)
+    },
+}
+# backup person densities, if person density is unknown. (From DS_EN 16798-1:2019 Appendix B)
+assumedPersonDensityDict = {
+    "Open Office": 17,  # m² per person
+    "Closed Office": 10,  # m² per person
+    "Classroom": 2,  # m² per person
+    "Meeting Room": 2,  # m² per person
+    "Auditorium": 5,  # m² per person
+    "Backup": 10,  # m² per person
+}
+
+
+@profiled()
+def spaceAirFlowColumns(space_file: ifcopenshell.file) -> dict:
+    """
+    The inputs of the air flow estimation of all spaces, as columns.
+
+    input:
+        space_file: ifcopenshell.file
+            Architectural IFC file with spaces.
+
+    Returns: A dictionary with:
+        "spaces": list of the IfcSpace entities,
+        "area": GrossFloorArea of each space (0 if missing),
+        "chairs": number of chairs in each space (from the occupancy index, see OccupancyIndex.py),
+        "density": assumed m² per person of each space (from the LongName, or the backup density),
+        "knownType": True if the LongName is in assumedPersonDensityDict.
+    """
+    spaces = space_file.by_type("IfcSpace")
+    properties = getPropertyIndex(space_file)
+    seats = getOccupancyIndex(space_file)["seats"]
+
+    area = [
+        properties.get(space, "Qto_SpaceBaseQuantities", "GrossFloorArea") or 0
+        for space in spaces
+    ]
+    knownType = [space.LongName in assumedPersonDensityDict for space in spaces]
+    return {
+        "spaces": spaces,
+        "area": np.array(area, dtype=float),
+        "chairs": np.array([seats.get(space.id(), 0) for space in spaces], dtype=int),
+        "density": np.array(
+            [
+                assumedPersonDensityDict[space.LongName if known else "Backup"]
+                for space, known in zip(spaces, knownType)
+            ],
+            dtype=float,
+        ),
+        "knownType": np.array(knownType, dtype=bool),
+    }
+
+
+def estimateAirFlows(columns: dict) -> dict:
+    """
+    Assumed occupancy and required air flow of all spaces, for all building categories at once.
+
+    Spaces with chairs get one person per chair. Spaces without chairs get the person density of their
+    type (or the backup density, with the backup air flow per area).
+
+    input:
+        columns: dict
+            Output from spaceAirFlowColumns().
+
+    Returns: A dictionary with the building category as key and a dictionary as value:
+        {"occupancy": np.ndarray, "airFlow": np.ndarray (l/s)} with one (unrounded) value per space.
+    """
+    area = columns["area"]
+    chairs = columns["chairs"]
+    persons = (
+        area / columns["density"]
+    )  # persons from the density, if there are no chairs
+    hasChairs = chairs > 0
+    occupancy = np.where(hasChairs, chairs, persons)
+
+    # one row per building category
+    perPerson = np.array(
+        [[airFlowDict[category]["l/s per person"]] for category in BUILDING_CATEGORIES],
+        dtype=float,
+    )
+    perArea = np.array(
+        [[airFlowDict[category]["l/s per area"]] for category in BUILDING_CATEGORIES],
+        dtype=float,
+    )
+    backup = np.array(
+        [[airFlowDict[category]["l/s backup"]] for category in BUILDING_CATEGORIES],
+        dtype=float,
+    )
+
+    airFlow = np.where(
+        hasChairs,
+        perPerson * chairs + perArea * area,
+        persons * np.where(columns["knownType"], perPerson, backup) + area * perArea,
+    )
+
+    return {
+        category: {"occupancy": occupancy, "airFlow": airFlow[i]}
+        for i, category in enumerate(BUILDING_CATEGORIES)
+    }
+
+
+def airFlowScenarioTable(columns: dict, scenarios: dict) -> Table:
+    """Table with the total occupancy and required air flow of all spaces for each building category."""
+    table_scenarios = Table(
+        title="Required Air Flows per Building Category", show_lines=True
+    )
+    table_scenarios.add_column("Category", style="green")
+    table_scenarios.add_column("Spaces", style="cyan")
+    table_scenarios.add_column("Assumed Occupancy", style="cyan")
+    table_scenarios.add_column("Required Air Flow (l/s)", style="magenta")
+
+    for category, scenario in scenarios.items():
+        table_scenarios.add_row(
+            category,
+            str(len(columns["spaces"])),
+            str(round(float(scenario["occupancy"].sum()), 2)),
+            str(round(float(scenario["airFlow"].sum()), 2)),
+        )
+    return table_scenarios
+
 
+@profiled()
 def spaceAirFlowCalculator(
     console: Console,
     space_file: ifcopenshell.file,
@@ -22,27 +171,33 @@ def spaceAirFlowCalculator(
     """
     AIR FLOW ESTIMATOR
 
-    Version: 17/11/25
+    Version: 17/10/26
 
     This tool takes architectural IFC-files (files containing spaces and possibly furniture) and estimates the required air flow needed to comply with the IEQ categories from DS_EN 16798-1:2019.
 
+    The air flows of all spaces are estimated for all building categories at once (estimateAirFlows()),
+    and the values of the chosen category are written to the spaces.
+
     Returns:
         airFlowFile: ifcopenshell.file
-            New copy of the architectural IFC file with assigned Psets.
-            If the file already contains spaces with defined Pset_SpaceOccupancyRequirements and Pset_SpaceAirHandlingDimensioning, the original file is returned.
+            The architectural IFC file with assigned Psets.
+            Spaces that already have Pset_SpaceOccupancyRequirements and Pset_SpaceAirHandlingDimensioning get their values updated.
 
 
     Author: s201348
 
     """
+    columns = spaceAirFlowColumns(space_file)
+    scenarios = estimateAirFlows(columns)
 
     if building_category == None:
-        # ask for user input for which category the building is (cat I, II, III, IV)
+        # show the air flows of each category, and ask for user input for which category the building is (cat I, II, III, IV)
+        console.print(airFlowScenarioTable(columns, scenarios))
         building_category = console.input(
             "[bold blue]Enter the building category (I, II, III, IV): [/bold blue]"
         )
         building_category = building_category.strip().upper()
-        if building_category not in ["I", "II", "III", "IV"]:
+        if building_category not in BUILDING_CATEGORIES:
             console.print(
                 "[bold red]Invalid building category. Defaulting to II.[/bold red]"
             )
@@ -52,149 +207,31 @@ def spaceAirFlowCalculator(
                 f"[bold green]Building category set to {building_category}.[/bold green]"
             )
 
-    else:
+    elif building_category not in BUILDING_CATEGORIES:
         building_category = "II"  # default if needed
 
-    # According to DS_EN 16798-1:2019
-    airFlowDict = {
-        "I": {
-            "l/s per person": 10,  # l/s per person
-            "l/s per area": 1.0,  # l/s per m²
-            "l/s backup": 2,  # l/s per m² (if person density is unknown)
-        },
-        "II": {
-            "l/s per person": 7,  # l/s per person
-            "l/s per area": 0.7,  # l/s per m²
-            "l/s backup": 1.4,  # l/s per m² (if person density is unknown)
-        },
-        "III": {
-            "l/s per person": 4,  # l/s per person
-            "l/s per area": 0.4,  # l/s per m²
-            "l/s backup": 0.8,  # l/s per m² (if person density is unknown)
-        },
-        "IV": {
-            "l/s per person": 2.5,  # l/s per person
-            "l/s per area": 0.3,  # l/s per m²
-            "l/s backup": 0.55,  # l/s per m² (if person density is unknown)
-        },
-    }
-    # backup person densities, if person density is unknown. (From DS_EN 16798-1:2019 Appendix B)
-    assumedPersonDensityDict = {
-        "Open Office": 17,  # m² per person
-        "Closed Office": 10,  # m² per person
-        "Classroom": 2,  # m² per person
-        "Meeting Room": 2,  # m² per person
-        "Auditorium": 5,  # m² per person
-        "Backup": 10,  # m² per person
-    }
-
-    allSpaces = space_file.by_type("IfcSpace")
-
-    for space in allSpaces:
-        # first, check if the pset is already defined.
-        for rel in getattr(space, "IsDefinedBy", []):
-            if rel.RelatingPropertyDefinition.Name in [
-                "Pset_SpaceOccupancyRequirements",
-                "Pset_SpaceAirHandlingDimensioning",
-            ]:
-                pass
-
-        occupancyPset = ifcopenshell.api.pset.add_pset(
-            file=space_file,
-            product=space,
-            name="Pset_SpaceOccupancyRequirements",
-        )
-        airFlowPset = ifcopenshell.api.pset.add_pset(
-            file=space_file,
-            product=space,
-            name="Pset_SpaceAirHandlingDimensioning",
-        )
-
-        spaceType = space.LongName
-
-        area = ifcopenshell.util.element.get_pset(
-            element=space, name="Qto_SpaceBaseQuantities", prop="GrossFloorArea"
-        )
-        if area is None:
-            area = 0
-
-        spaceElements = space.ContainsElements
-        elementsInSpace = [
-            spaceElements[element].RelatedElements
-            for element in range(len(spaceElements))
-        ]
-        if elementsInSpace:
-            assumedOccupancy = len(
-                [
-                    el
-                    for el in elementsInSpace[0]
-                    if el.is_a("IfcFurniture") and "Chair" in el.Name
-                ]
-            )
-        else:
-            assumedOccupancy = 0
-        # console.print(f'{len(chairsInSpace)=} in space {space_file.by_id(spaceID).LongName}')
-
-        if assumedOccupancy > 0:
-            requiredAirFlow = (
-                airFlowDict[building_category]["l/s per person"] * assumedOccupancy
-            ) + (airFlowDict[building_category]["l/s per area"] * area)
-
-            ifcopenshell.api.pset.edit_pset(
-                file=space_file,
-                pset=occupancyPset,
-                properties={"OccupancyNumber": assumedOccupancy},
-            )
-
-            ifcopenshell.api.pset.edit_pset(
-                file=space_file,
-                pset=airFlowPset,
-                properties={"DesignAirFlow": round(requiredAirFlow, 2)},
-            )
-            pass
-
-        elif assumedOccupancy == 0:
-            # console.print(f"[yellow]No chairs found in space {space.id()}[/yellow]")
-            if spaceType in assumedPersonDensityDict:
-                assumedOccupancy = round(
-                    area / assumedPersonDensityDict[spaceType],
-                    2,
-                )
-                requiredAirFlow = (
-                    area / assumedPersonDensityDict[spaceType]
-                ) * airFlowDict[building_category]["l/s per person"] + (
-                    area * airFlowDict[building_category]["l/s per area"]
+    # Psets of all spaces, written at once (existing Psets are updated)
+    occupancy = scenarios[building_category]["occupancy"]
+    airFlow = scenarios[building_category]["airFlow"]
+    spacePsets = {}
+    for i, space in enumerate(columns["spaces"]):
+        spacePsets[space] = {
+            "Pset_SpaceOccupancyRequirements": {
+                # one person per chair, or the rounded number of persons from the density
+                "OccupancyNumber": (
+                    float(columns["chairs"][i])
+                    if columns["chairs"][i] > 0
+                    else round(float(occupancy[i]), 2)
                 )
+            },
+            "Pset_SpaceAirHandlingDimensioning": {
+                "DesignAirFlow": round(float(airFlow[i]), 2)
+            },
+        }
+    writePsets(space_file, spacePsets)
 
-            else:
-                # use backup values
-                assumedOccupancy = round(
-                    area / assumedPersonDensityDict["Backup"],
-                    2,
-                )
-                # assumedOccupancy = 0
-                # area = 0
-                # requiredAirFlow = 0
-                requiredAirFlow = (
-                    area / assumedPersonDensityDict["Backup"]
-                ) * airFlowDict[building_category]["l/s backup"] + (
-                    area * airFlowDict[building_category]["l/s per area"]
-                )
-
-            ifcopenshell.api.pset.edit_pset(
-                file=space_file,
-                pset=occupancyPset,
-                properties={"OccupancyNumber": float(assumedOccupancy)},
-            )
-
-            ifcopenshell.api.pset.edit_pset(
-                file=space_file,
-                pset=airFlowPset,
-                properties={"DesignAirFlow": round(requiredAirFlow, 2)},
-            )
-
-        else:
-            raise ValueError(f"Invalid assumed occupancy: {assumedOccupancy}")
+    allSpaces = columns["spaces"]
+    properties = getPropertyIndex(space_file)
 
     # table with required air flows per active space
     table_airflows = Table(title="Required Air Flows per Space", show_lines=True)
@@ -205,20 +242,9 @@ def spaceAirFlowCalculator(
     table_airflows.add_column("Required Air Flow (l/s)", style="magenta")
 
     for space in allSpaces:
-        if ifcopenshell.util.element.get_pset(
-            element=space,
-            name="Qto_SpaceBaseQuantities",
-            prop="GrossFloorArea",
-        ):
-            spaceArea = round(
-                ifcopenshell.util.element.get_pset(
-                    element=space,
-                    name="Qto_SpaceBaseQuantities",
-                    prop="GrossFloorArea",
-                ),
-                2,
-            )
-
+        spaceArea = properties.get(space, "Qto_SpaceBaseQuantities", "GrossFloorArea")
+        if spaceArea:
+            spaceArea = round(spaceArea, 2)
         else:
             spaceArea = 0
 
@@ -227,18 +253,18 @@ def spaceAirFlowCalculator(
             str(space.id()),
             str(spaceArea),
             str(
-                ifcopenshell.util.element.get_pset(
-                    element=space,
-                    name="Pset_SpaceOccupancyRequirements",
+                properties.get(
+                    space,
+                    "Pset_SpaceOccupancyRequirements",
+                    "OccupancyNumber",
                     psets_only=True,
-                    prop="OccupancyNumber",
                 )
             ),
             str(
-                ifcopenshell.util.element.get_pset(
-                    element=space,
-                    name="Pset_SpaceAirHandlingDimensioning",
-                    prop="DesignAirFlow",
+                properties.get(
+                    space,
+                    "Pset_SpaceAirHandlingDimensioning",
+                    "DesignAirFlow",
                     psets_only=True,
                 )
             ),
@@ -0,0 +1,440 @@
+"""
+Headless batch analysis of many MEP/ARCH file pairs (no interactive menu).
+
+Version: 17/10/26
+
+Every -MEP/-ARCH pair in a directory tree is run through the same steps as main.py:
+    AirFlowEstimator -> VentilationSystemAnalyzer -> BcfGenerator
+
+The pairs are analysed in a pool of worker processes. Each worker process analyses ONE pair and is then
+replaced by a new process, so the memory of the opened IFC files is freed after each pair.
+
+Output (in outputDir):
+    <project>/HVAC_Issues.bcfzip
+    <project>/Analyzed_MEP_File.ifc
+    <project>/Analyzed_Space_File.ifc
+    <project>/analysis.log
+    summary.json / summary.csv - status, results and timings (s) of each pair
+"""
+
+import csv
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ifcopenshell
+from rich.console import Console
+from rich.table import Table
+
+from .AirFlowEstimator import spaceAirFlowCalculator
+from .BcfGenerator import old_generate_bcf_from_errors
+from .GeometryEngine import useGeometryCache
+from .IncrementalAnalysis import incrementalPipeline
+from .Profiler import reportProfile, startProfiling, stopProfiling
+from .setupFunctions import group_ifc_files
+from .VentilationSystemAnalyzer import (
+    ahuFinder,
+    airTerminalSpaceClashAnalyzer,
+    buildTerminalSpaceIndex,
+    getSystemTrees,
+)
+
+# steps of the analysis, in the order they are timed
+BATCH_STEPS = [
+    "openFiles",
+    "airFlows",
+    "ahuFinder",
+    "clashAnalysis",
+    "systemTrees",
+    "bcf",
+    "incrementalAnalysis",
+    "writeFiles",
+]
+
+# columns of summary.csv (before the timings)
+BATCH_FIELDS = [
+    "project",
+    "MEP",
+    "ARCH",
+    "status",
+    "error",
+    "systems",
+    "missingAHUSystems",
+    "spacesWithTerminals",
+    "unassignedSupply",
+    "unassignedReturn",
+    "treeElements",
+    "changedSystems",
+    "reusedSystems",
+]
+
+
+def findIfcPairs(directory: str, extension=".ifc") -> tuple[list[dict], list[dict]]:
+    """
+    Find all -MEP/-ARCH file pairs in a directory and its subdirectories.
+
+    Returns: (pairs, incomplete)
+        pairs: list of {"project", "MEP", "ARCH"} with full paths, sorted by project.
+        incomplete: prefixes where the MEP or ARCH file is missing (same keys, None for the missing file).
+    The project name is the path of the folder (relative to directory) + the prefix.
+    """
+    pairs, incomplete = [], []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        files = sorted(f for f in filenames if f.lower().endswith(extension.lower()))
+        for prefix, group in group_ifc_files(files, extension).items():
+            if not group:
+                continue  # not a -MEP or -ARCH file
+
+            relativeDir = os.path.relpath(dirpath, directory)
+            pair = {
+                "project": (
+                    prefix if relativeDir == "." else os.path.join(relativeDir, prefix)
+                ),
+                "MEP": os.path.join(dirpath, group["MEP"]) if "MEP" in group else None,
+                "ARCH": (
+                    os.path.join(dirpath, group["ARCH"]) if "ARCH" in group else None
+                ),
+            }
+            if pair["MEP"] and pair["ARCH"]:
+                pairs.append(pair)
+            else:
+                incomplete.append(pair)
+
+    pairs.sort(key=lambda pair: pair["project"])
+    return pairs, incomplete
+
+
+def analyseIfcPair(
+    pair: dict,
+    outputDir: str,
+    writeIfc: bool = True,
+    incremental: bool = False,
+    profile: bool = False,
+    profileMemory: bool = False,
+    snapshots: bool = False,
+    snapshotWorkers: int = 1,
+) -> dict:
+    """
+    Run the full analysis of one MEP/ARCH pair without user input.
+
+    input:
+        pair: dict
+            Output from findIfcPairs().
+        outputDir: str
+            Output folder of the batch - the files of the pair are written to outputDir/<project>/.
+        writeIfc: bool
+            Write the analyzed IFC files (with the new Psets).
+        incremental: bool
+            Only build the systems that changed since the previous run (see IncrementalAnalysis.py).
+            All steps after openFiles are then timed as one step, "incrementalAnalysis".
+        profile: bool
+            Time the functions inside the steps (Profiler.py): the table is written to the log, and
+            profile_trace.json/profile.json to the folder of the pair.
+        profileMemory: bool
+            Profile (like profile) and also record the peak memory of each function (with tracemalloc, slower).
+        snapshots: bool
+            Add a PNG snapshot of each viewpoint to the BCF file (see SnapshotRenderer.py).
+        snapshotWorkers: int
+            Number of processes the snapshots of the pair are rendered in (1: in the process of the pair,
+            as the pairs are already analysed in parallel).
+
+    Returns: A dictionary with the status, the results and the timings of each step (see BATCH_STEPS).
+    Errors are caught and returned as status "failed", so one broken pair does not stop the batch.
+    """
+    projectDir = os.path.join(outputDir, pair["project"])
+    os.makedirs(projectDir, exist_ok=True)
+
+    summary = {
+        "project": pair["project"],
+        "MEP": pair["MEP"],
+        "ARCH": pair["ARCH"],
+        "status": "ok",
+        "error": None,
+        "timings": {},
+    }
+    timings = summary["timings"]
+
+    with open(os.path.join(projectDir, "analysis.log"), "w") as log:
+        console = Console(file=log, width=160)
+        prof = (
+            startProfiling(memory=profileMemory) if profile or profileMemory else None
+        )
+        start = time.perf_counter()
+
+        def step(name: str):
+            nonlocal start
+            now = time.perf_counter()
+            timings[name] = round(now - start, 3)
+            start = now
+
+        try:
+            MEP_file = ifcopenshell.open(pair["MEP"])
+            space_file = ifcopenshell.open(pair["ARCH"])
+            useGeometryCache(MEP_file, pair["MEP"])
+            useGeometryCache(space_file, pair["ARCH"])
+            step("openFiles")
+
+            if incremental:
+                (
+                    identifiedSystems,
+                    missingAHUsystems,
+                    table_AHUs,
+                    spaceTerminals,
+                    unassignedTerminals,
+                    table_Spaces,
+                    systemsTree,
+                    ifc_file_new,
+                    changes,
+                ) = incrementalPipeline(
+                    console=console,
+                    MEP_file=MEP_file,
+                    MEP_path=pair["MEP"],
+                    space_file=space_file,
+                    output_bcf=os.path.join(projectDir, "HVAC_Issues.bcfzip"),
+                    space_file_name=os.path.basename(pair["ARCH"]),
+                    workers=1,
+                    bcfSnapshots=snapshots,
+                    bcfSnapshotWorkers=snapshotWorkers,
+                )
+                ifc_file_Spaces = space_file
+                summary["changedSystems"] = len(changes["changedSystems"])
+                summary["reusedSystems"] = len(changes["reusedSystems"])
+                step("incrementalAnalysis")
+
+            else:
+                ifc_file_Spaces, table_AirFlows = spaceAirFlowCalculator(
+                    console=console, space_file=space_file, building_category="II"
+                )
+                step("airFlows")
+
+                identifiedSystems, missingAHUsystems, table_AHUs = ahuFinder(
+                    console=console,
+                    ifc_file=MEP_file,
+                    targetSystems="IfcDistributionSystem",
+                )
+                step("ahuFinder")
+
+                spaceTerminals, unassignedTerminals, table_Spaces = (
+                    airTerminalSpaceClashAnalyzer(
+                        console=console,
+                        MEP_file=MEP_file,
+                        space_file=ifc_file_Spaces,
+                        identifiedSystems=identifiedSystems,
+                        space_file_name=os.path.basename(pair["ARCH"]),
+                    )
+                )
+                terminalSpaces = buildTerminalSpaceIndex(
+                    ifc_file_Spaces, spaceTerminals
+                )
+                step("clashAnalysis")
+
+                # the pairs are already analysed in parallel, so the systems are built in this process
+                systemsTree, ifc_file_new = getSystemTrees(
+                    console=console,
+                    identifiedSystems=identifiedSystems,
+                    ifc_file=MEP_file,
+                    space_file=ifc_file_Spaces,
+                    spaceTerminals=spaceTerminals,
+                    terminalSpaces=terminalSpaces,
+                    showChoice="n",
+                    workers=1,
+                )
+                step("systemTrees")
+
+                old_generate_bcf_from_errors(
+                    console=console,
+                    ifc_file=MEP_file,
+                    ifc_file_path=pair["MEP"],
+                    missingAHUsystems=missingAHUsystems,
+                    unassignedTerminals=unassignedTerminals,
+                    output_bcf=os.path.join(projectDir, "HVAC_Issues.bcfzip"),
+                    snapshots=snapshots,
+                    snapshotWorkers=snapshotWorkers,
+                )
+                step("bcf")
+
+            if writeIfc:
+                ifc_file_new.write(os.path.join(projectDir, "Analyzed_MEP_File.ifc"))
+                ifc_file_Spaces.write(
+                    os.path.join(projectDir, "Analyzed_Space_File.ifc")
+                )
+            step("writeFiles")
+
+            summary.update(
+                {
+                    "systems": len(identifiedSystems),
+                    "missingAHUSystems": len(missingAHUsystems),
+                    "spacesWithTerminals": len(spaceTerminals),
+                    "unassignedSupply": len(unassignedTerminals.get("Supply", [])),
+                    "unassignedReturn": len(unassignedTerminals.get("Return", [])),
+                    "treeElements": systemsTree.size(),
+                }
+            )
+
+        except Exception as e:
+            summary["status"] = "failed"
+            summary["error"] = f"{type(e).__name__}: {e}"
+            console.print(traceback.format_exc())
+
+        if prof is not None:
+            stopProfiling()
+            reportProfile(console, prof, projectDir)
+
+    summary["timings"]["total"] = round(sum(timings.values()), 3)
+    return summary
+
+
+def writeBatchSummary(summaries: list[dict], outputDir: str) -> tuple[str, str]:
+    """Write summary.json and summary.csv (one row per pair, one column per timing). Returns both paths."""
+    jsonPath = os.path.join(outputDir, "summary.json")
+    csvPath = os.path.join(outputDir, "summary.csv")
+
+    with open(jsonPath, "w") as f:
+        json.dump(summaries, f, indent=2)
+
+    fields = list(BATCH_FIELDS) + [f"time_{name}" for name in BATCH_STEPS + ["total"]]
+    rows = []
+    for summary in summaries:
+        row = {key: value for key, value in summary.items() if key != "timings"}
+        row.update(
+            {f"time_{name}": value for name, value in summary["timings"].items()}
+        )
+        rows.append(row)
+
+    with open(csvPath, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return jsonPath, csvPath
+
+
+def runBatch(
+    console: Console,
+    directory: str,
+    outputDir: str,
+    workers: int | None = None,
+    writeIfc: bool = True,
+    incremental: bool = False,
+    profile: bool = False,
+    profileMemory: bool = False,
+    snapshots: bool = False,
+    snapshotWorkers: int = 1,
+) -> tuple[list[dict], Table]:
+    """
+    Analyse all MEP/ARCH pairs in a directory tree in a pool of worker processes.
+
+    input:
+        console: rich.console.Console
+            For progress and the summary table.
+        directory: str
+            Folder that is searched (recursively) for -MEP.ifc/-ARCH.ifc pairs.
+        outputDir: str
+            Folder the results and summary.json/summary.csv are written to.
+        workers: int | None
+            Number of pairs analysed at the same time (defaults to the number of CPUs).
+        writeIfc: bool
+            Write the analyzed IFC files of each pair.
+        incremental: bool
+            Reuse the systems that have not changed since the previous run of each pair.
+        profile: bool
+            Profile each pair (see analyseIfcPair()).
+        profileMemory: bool
+            Profile each pair and record the peak memory (see analyseIfcPair()).
+        snapshots: bool
+            Add PNG snapshots to the BCF file of each pair (see analyseIfcPair()).
+        snapshotWorkers: int
+            Number of processes the snapshots of each pair are rendered in.
+
+    Returns: (summaries, table) - one summary per pair (in project order) and a Rich table of them.
+    Pairs with a missing MEP or ARCH file are included with status "skipped".
+    """
+    pairs, incomplete = findIfcPairs(directory)
+    os.makedirs(outputDir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pairs) or 1))
+
+    console.print(
+        f"Found [bold]{len(pairs)}[/bold] MEP/ARCH pairs in '{directory}' "
+        f"([yellow]{len(incomplete)} incomplete[/yellow]), analysing with {workers} workers"
+    )
+
+    summaries = {}
+    # one pair per worker process: the process (and its memory) is replaced after each pair
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as executor:
+        futures = {
+            executor.submit(
+                analyseIfcPair,
+                pair,
+                outputDir,
+                writeIfc,
+                incremental,
+                profile,
+                profileMemory,
+                snapshots,
+                snapshotWorkers,
+            ): pair
+            for pair in pairs
+        }
+        for future in as_completed(futures):
+            pair = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                # the worker process itself died (e.g. out of memory)
+                summary = {
+                    **pair,
+                    "status": "failed",
+                    "error": f"{type(e).__name__}: {e}",
+                    "timings": {},
+                }
+            summaries[pair["project"]] = summary
+            status = (
+                "[green]ok[/green]"
+                if summary["status"] == "ok"
+                else f"[red]{summary['status']}[/red]"
+            )
+            console.print(
+                f"{status} {pair['project']} ({summary['timings'].get('total', '-')} s)"
+            )
+
+    for pair in incomplete:
+        summaries[pair["project"]] = {
+            **pair,
+            "status": "skipped",
+            "error": "MEP or ARCH file missing",
+            "timings": {},
+        }
+
+    summaries = [summaries[project] for project in sorted(summaries)]
+    jsonPath, csvPath = writeBatchSummary(summaries, outputDir)
+
+    table = Table(title="Batch Analysis", show_lines=True)
+    table.add_column("Project", style="green", no_wrap=True)
+    table.add_column("Status")
+    table.add_column("Systems", justify="right")
+    table.add_column("Missing AHU", justify="right", style="red")
+    table.add_column("Unassigned Terminals", justify="right", style="red")
+    table.add_column("Time (s)", justify="right", style="cyan")
+    for summary in summaries:
+        table.add_row(
+            summary["project"],
+            (
+                summary["status"]
+                if summary["status"] == "ok"
+                else f"[red]{summary['status']}[/red]"
+            ),
+            str(summary.get("systems", "")),
+            str(summary.get("missingAHUSystems", "")),
+            str(
+                summary.get("unassignedSupply", 0) + summary.get("unassignedReturn", 0)
+                if summary["status"] == "ok"
+                else ""
+            ),
+            str(summary["timings"].get("total", "")),
+        )
+
+    console.print(f"Summary written to {jsonPath} and {csvPath}")
+    return summaries, table
@@ -1,41 +1,42 @@
 from datetime import datetime, timezone
+import os
+import struct
 import uuid
+import zipfile
+import zlib
 import ifcopenshell
 from bcf.v3.bcfxml import BcfXml
 import bcf.v3.visinfo
 import bcf.v3.model
+from bcf.v3.topic import TopicHandler
+from bcf.v3.visinfo import VisualizationInfoHandler, build_components
+from bcf.xml_parser import XmlParserSerializer
 from ifcopenshell.util.file import IfcHeaderExtractor
 import numpy as np
 from rich.console import Console
 
+from .GeometryEngine import bboxTable, get_element_bbox, getElementBBoxes
+from .IssueClustering import clusterIssues
+from .SnapshotRenderer import renderSnapshots
+from .Profiler import profiled, span
+
 
 def iso_now() -> str:
     """Return current UTC time in ISO format with 'Z' suffix."""
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat() + "Z"
 
 
-def get_element_bbox(element: ifcopenshell.entity_instance) -> dict:
-    """Return min/max XYZ coordinates of an IFC element in world coordinates.
-    I WANT TO CHANGE THIS TO USE ifcopenshell.util.shape.get_bbox(element) insead!
-    """
-    settings = ifcopenshell.geom.settings()
-    settings.set(settings.USE_WORLD_COORDS, True)
-
-    shape = ifcopenshell.geom.create_shape(settings, element)
-    verts = np.array(shape.geometry.verts).reshape(-1, 3)
-
-    bbox_min = verts.min(axis=0)
-    bbox_max = verts.max(axis=0)
-
-    return {"min": bbox_min, "max": bbox_max}
-
-
 def cameraSetup(
-    element: ifcopenshell.entity_instance, ifc_file: ifcopenshell.file
+    element: ifcopenshell.entity_instance,
+    ifc_file: ifcopenshell.file | None = None,
+    bboxes: bboxTable | None = None,
 ) -> tuple[list[float], list[float], list[float]]:
+    """Camera looking at the element. Uses the precomputed bounding box from bboxes if available."""
     if isinstance(element, list):
         element = element[0]
-    bbox = get_element_bbox(element)
+    bbox = bboxes.get(element) if bboxes is not None else None
+    if bbox is None:
+        bbox = get_element_bbox(element)
     center = [(bbox["min"][i] + bbox["max"][i]) / 2 for i in range(3)]
 
     camera_view_point = [
@@ -53,12 +54,87 @@ def cameraSetup(
     return camera_view_point, camera_direction, camera_up_vector
 
 
+def cameraVectors(
+    mins: np.ndarray, maxs: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cameras looking at many bounding boxes at once (the same cameras as cameraSetup()).
+
+    input:
+        mins, maxs: np.ndarray
+            (n, 3) arrays with the min/max XYZ coordinates of the bounding boxes.
+
+    Returns: (n, 3) arrays with the camera view points, directions and up vectors.
+    """
+    mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+    maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+    center = (mins + maxs) / 2
+    camera_view_point = maxs * 1.04
+    camera_direction = center - camera_view_point
+    camera_up_vector = np.tile([0.0, 0.0, 1.0], (len(mins), 1))
+    return camera_view_point, camera_direction, camera_up_vector
+
+
+def framingCameraVectors(
+    mins: np.ndarray, maxs: np.ndarray, field_of_view: float = 60.0
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cameras that show the whole bounding boxes (i.e. of a cluster of issues), looking down at the center
+    from the max corner side, far enough away that the bounding sphere fits in the field of view.
+
+    input:
+        mins, maxs: np.ndarray
+            (n, 3) arrays with the min/max XYZ coordinates of the bounding boxes.
+        field_of_view: float
+            Field of view of the BCF camera (degrees).
+
+    Returns: (n, 3) arrays with the camera view points, directions and up vectors.
+    """
+    mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+    maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+    center = (mins + maxs) / 2
+    radius = np.maximum(np.linalg.norm(maxs - mins, axis=1) / 2, 0.5)
+    distance = radius / np.sin(np.radians(field_of_view) / 2)
+    camera_view_point = center + distance[:, None] * (np.ones(3) / np.sqrt(3))
+    camera_direction = center - camera_view_point
+    camera_up_vector = np.tile([0.0, 0.0, 1.0], (len(mins), 1))
+    return camera_view_point, camera_direction, camera_up_vector
+
+
+@profiled()
+def issueBBoxes(
+    ifc_file: ifcopenshell.file,
+    elements: list,
+    bboxes: bboxTable | None = None,
+) -> bboxTable:
+    """
+    Bounding boxes of the elements the BCF cameras look at.
+
+    input:
+        bboxes: bboxTable | None
+            Precomputed bounding boxes (i.e. from the clash analysis). Only the elements that are not
+            in it are tessellated (in one pass).
+    """
+    if bboxes is None:
+        return getElementBBoxes(ifc_file, elements)
+    missing = [element for element in elements if element not in bboxes]
+    if not missing:
+        return bboxes
+    extra = getElementBBoxes(ifc_file, missing)
+    return bboxTable(
+        np.concatenate([bboxes.ids, extra.ids]),
+        np.concatenate([bboxes.mins, extra.mins]),
+        np.concatenate([bboxes.maxs, extra.maxs]),
+    )
+
+
 def add_bcf_issue(
     bcf_project: BcfXml,
     title: str,
     message: str,
     author: str,
     elements: list | ifcopenshell.entity_instance,
+    bboxes: bboxTable | None = None,
 ):
     """Add a BCF topic for one or more IFC elements."""
     if not isinstance(elements, list):
@@ -68,7 +144,7 @@ def add_bcf_issue(
     vp = topic.add_viewpoint(elements[0])
     vp.set_selected_elements(elements)
 
-    cam_pos, cam_dir, cam_up = cameraSetup(elements[0])
+    cam_pos, cam_dir, cam_up = cameraSetup(elements[0], bboxes=bboxes)
     vp.visualization_info.perspective_camera = bcf.v3.visinfo.build_camera_from_vectors(
         camera_position=cam_pos,
         camera_dir=cam_dir,
@@ -86,16 +162,392 @@ def add_bcf_issue(
     ]
 
 
+def issueCameras(
+    issues: list[dict], bboxes: bboxTable
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cameras of many issues (see build_bcf_topics()): looking at the first element, or framing "bbox" if the issue has one.
+
+    Returns: (n, 3) arrays with the camera view points, directions and up vectors.
+    """
+    targets = [issue["elements"][0] for issue in issues]
+    found, mins, maxs = bboxes.take(targets)
+    targetMins = np.empty((len(targets), 3))
+    targetMaxs = np.empty((len(targets), 3))
+    targetMins[found], targetMaxs[found] = mins, maxs
+    for i in np.flatnonzero(~found).tolist():
+        bbox = get_element_bbox(targets[i])
+        targetMins[i], targetMaxs[i] = bbox["min"], bbox["max"]
+
+    positions, directions, ups = cameraVectors(targetMins, targetMaxs)
+    framed = [i for i, issue in enumerate(issues) if "bbox" in issue]
+    if framed:
+        (
+            positions[framed],
+            directions[framed],
+            ups[framed],
+        ) = framingCameraVectors(
+            [issues[i]["bbox"][0] for i in framed],
+            [issues[i]["bbox"][1] for i in framed],
+        )
+    return positions, directions, ups
+
+
+def build_bcf_topics(
+    issues: list[dict],
+    author: str,
+    bboxes: bboxTable,
+    topic_type: str = "Parameter Validation",
+    xml_handler=None,
+    snapshots=None,
+):
+    """
+    Build the BCF topics of many issues (one topic, viewpoint and comment per issue), one at a time.
+
+    The cameras of all issues are computed in one step from the precomputed bounding boxes (cameraVectors()),
+    and the viewpoints are built directly, so no geometry or placement is read per topic.
+
+    input:
+        issues: list[dict]
+            [{"title": str, "message": str, "elements": [ifcopenshell.entity_instance, ...]}, ...]
+            The camera looks at the first element, and all elements are selected.
+            Issues with "bbox": (min, max) (i.e. clusters, see clusterIssues()) get a camera framing the bbox.
+        author: str
+            Author of the topics and comments.
+        bboxes: bboxTable
+            Bounding boxes of (at least) the first element of each issue, see issueBBoxes().
+            Elements without a bounding box fall back to get_element_bbox().
+        snapshots: Iterable[bytes] | None
+            PNG snapshot of each issue (in the order of the issues, see renderSnapshots()), or None.
+
+    Yields: The TopicHandler of each issue (in the order of the issues).
+    """
+    if not issues:
+        return
+
+    positions, directions, ups = issueCameras(issues, bboxes)
+    positions, directions, ups = positions.tolist(), directions.tolist(), ups.tolist()
+    snapshots = iter(snapshots) if snapshots is not None else None
+
+    date = iso_now()
+    for i, issue in enumerate(issues):
+        topic = TopicHandler.create_new(
+            issue["title"],
+            issue["message"],
+            author,
+            topic_type=topic_type,
+            xml_handler=xml_handler,
+        )
+        visinfo_handler = VisualizationInfoHandler(
+            visualization_info=bcf.v3.model.VisualizationInfo(
+                guid=str(uuid.uuid4()),
+                components=build_components(
+                    *[element.GlobalId for element in issue["elements"]]
+                ),
+                perspective_camera=bcf.v3.visinfo.build_camera_from_vectors(
+                    camera_position=positions[i],
+                    camera_dir=directions[i],
+                    camera_up=ups[i],
+                ),
+            ),
+            xml_handler=xml_handler,
+        )
+        if snapshots is not None:
+            visinfo_handler.snapshot = next(snapshots)
+            topic.add_visinfo_handler(
+                visinfo_handler, snapshot_filename=f"{visinfo_handler.guid}.png"
+            )
+        else:
+            topic.add_visinfo_handler(visinfo_handler)
+        topic.comments = [
+            bcf.v3.model.Comment(
+                guid=str(uuid.uuid4()),
+                date=date,
+                author=author,
+                comment=issue["message"],
+                viewpoint=bcf.v3.model.CommentViewpoint(guid=visinfo_handler.guid),
+            )
+        ]
+        yield topic
+
+
+def add_bcf_issues(
+    bcf_project: BcfXml,
+    issues: list[dict],
+    author: str,
+    bboxes: bboxTable,
+    topic_type: str = "Parameter Validation",
+) -> list:
+    """
+    Add many BCF topics to a BCF project at once, see build_bcf_topics().
+    Nothing is written to disk - save the project once when all topics are added
+    (or use bcfStreamWriter to write the topics as they are built).
+
+    Returns: A list with the TopicHandler of each issue.
+    """
+    topics = []
+    for topic in build_bcf_topics(
+        issues, author, bboxes, topic_type, xml_handler=bcf_project._xml_handler
+    ):
+        bcf_project.topics[topic.guid] = topic
+        topics.append(topic)
+    return topics
+
+
+#######################################
+#        Streaming BCF writer
+#######################################
+
+# local file header of a zip entry (see recoverBcfZip())
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_ZIP_LOCAL_SIGNATURE = b"PK\x03\x04"
+
+
+def recoverBcfZip(path: str) -> int:
+    """
+    Repair a bcfzip that was not closed (i.e. the run crashed while topics were streamed to it).
+
+    The zip entries are read one by one from the start of the file, until the first incomplete entry.
+    Topics are only kept if their markup.bcf was written (bcfStreamWriter writes it last).
+
+    Returns: The number of recovered topics.
+    """
+    entries = []  # (name, data)
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_ZIP_LOCAL_HEADER.size)
+            if len(header) < _ZIP_LOCAL_HEADER.size:
+                break
+            (
+                signature,
+                _,
+                flags,
+                method,
+                _,
+                _,
+                crc,
+                compressedSize,
+                _,
+                nameLength,
+                extraLength,
+            ) = _ZIP_LOCAL_HEADER.unpack(header)
+            # sizes are unknown if they are written after the data (not done for seekable files)
+            if signature != _ZIP_LOCAL_SIGNATURE or flags & 0x08:
+                break
+            name = f.read(nameLength).decode("utf-8")
+            f.read(extraLength)
+            data = f.read(compressedSize)
+            if len(data) < compressedSize:
+                break
+            try:
+                if method == zipfile.ZIP_DEFLATED:
+                    data = zlib.decompress(data, -15)
+                elif method != zipfile.ZIP_STORED:
+                    break
+            except zlib.error:
+                break
+            if zlib.crc32(data) != crc:
+                break
+            entries.append((name, data))
+
+    completeTopics = {
+        name.split("/")[0] for name, _ in entries if name.endswith("/markup.bcf")
+    }
+    tmpPath = path + ".tmp"
+    with zipfile.ZipFile(tmpPath, "w", zipfile.ZIP_DEFLATED) as bcf_zip:
+        for name, data in entries:
+            if "/" in name and name.split("/")[0] not in completeTopics:
+                continue
+            bcf_zip.writestr(_zipInfo(name), data)
+    os.replace(tmpPath, path)
+    return len(completeTopics)
+
+
+def _zipInfo(name: str) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    # created on "Windows", so Unix permissions are not inferred as 0000 (same as bcf.inmemory_zipfile)
+    info.create_system = 0
+    return info
+
+
+class bcfStreamWriter:
+    def __init__(
+        self,
+        path: str,
+        project_name: str | None = None,
+        append: bool = False,
+        flushEvery: int = 100,
+    ):
+        """
+        BCF 3.0 writer that writes each topic to the bcfzip as soon as it is added, so memory use does not
+        grow with the number of topics.
+
+        The zip is closed and reopened every flushEvery topics, so the file on disk is a valid bcfzip with all
+        topics written so far. A file that was not closed (a crash between two flushes) is repaired with
+        recoverBcfZip() when it is opened with append=True.
+
+        input:
+            path: str
+                Path of the .bcfzip file.
+            project_name: str | None
+                Name of the BCF project (only used for new files).
+            append: bool
+                Add the topics to an existing file (a new file is created if it does not exist).
+                The titles of the existing topics are read, see hasTopic().
+            flushEvery: int
+                Number of topics between two flushes.
+        """
+        self.path = path
+        self.flushEvery = max(1, int(flushEvery))
+        self.xml_handler = XmlParserSerializer()
+        self.titles = set()  # titles of all topics in the file
+        self.written = 0  # topics written by this writer
+        self.pending = 0  # topics written since the last flush
+
+        if append and os.path.exists(path):
+            try:
+                zipfile.ZipFile(path).close()
+            except zipfile.BadZipFile:
+                recoverBcfZip(path)
+            self.zip = zipfile.ZipFile(path, "a", zipfile.ZIP_DEFLATED)
+            for name in self.zip.namelist():
+                if name.endswith("/markup.bcf"):
+                    markup = self.xml_handler.parse(
+                        self.zip.read(name), bcf.v3.model.Markup
+                    )
+                    self.titles.add(markup.topic.title)
+        else:
+            self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+            self._writeXml(
+                "project.bcfp",
+                bcf.v3.model.ProjectInfo(
+                    project=bcf.v3.model.Project(
+                        name=project_name, project_id=str(uuid.uuid4())
+                    )
+                ),
+            )
+            self._writeXml("bcf.version", bcf.v3.model.Version(version_id="3.0"))
+            self._writeXml("extensions.xml", bcf.v3.model.Extensions())
+            self.flush()
+
+    def _writeXml(self, name: str, xml_obj):
+        self.zip.writestr(_zipInfo(name), self.xml_handler.serialize(xml_obj))
+
+    def hasTopic(self, title: str) -> bool:
+        """True if a topic with the title is already in the file."""
+        return title in self.titles
+
+    def writeTopic(self, topic: TopicHandler):
+        """Write a topic (markup, viewpoints and snapshots) to the file. The topic is not kept in memory."""
+        topic_dir = topic.guid
+        for vpt in topic.topic.viewpoints.view_point if topic.topic.viewpoints else []:
+            visinfo_handler = topic.viewpoints[vpt.viewpoint]
+            self._writeXml(
+                f"{topic_dir}/{vpt.viewpoint}", visinfo_handler.visualization_info
+            )
+            if vpt.snapshot and visinfo_handler.snapshot:
+                self.zip.writestr(
+                    _zipInfo(f"{topic_dir}/{vpt.snapshot}"), visinfo_handler.snapshot
+                )
+        # the markup is written last, so a topic with a markup is complete (see recoverBcfZip())
+        self._writeXml(f"{topic_dir}/markup.bcf", topic.markup)
+
+        self.titles.add(topic.topic.title)
+        self.written += 1
+        self.pending += 1
+        if self.pending >= self.flushEvery:
+            self.flush()
+
+    def flush(self):
+        """Write the zip directory, so the file on disk is complete, and continue appending."""
+        self.zip.close()
+        self.zip = zipfile.ZipFile(self.path, "a", zipfile.ZIP_DEFLATED)
+        self.pending = 0
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+@profiled()
+def write_bcf_issues(
+    output_bcf: str,
+    project_name: str | None,
+    issues: list[dict],
+    author: str,
+    bboxes: bboxTable,
+    append: bool = False,
+    flushEvery: int = 100,
+    snapshotFile: ifcopenshell.file | None = None,
+    snapshotWorkers: int | None = None,
+) -> int:
+    """
+    Stream the topics of many issues to a bcfzip (see build_bcf_topics() and bcfStreamWriter).
+
+    With append=True the topics are added to an existing file, and issues with a title that is already
+    in the file are skipped, so an interrupted run can be resumed.
+    With snapshotFile, a PNG snapshot of each viewpoint is rendered from the elements of the file
+    (SnapshotRenderer.py, in snapshotWorkers processes) and written with the topic.
+
+    Returns: The number of topics written.
+    """
+    with bcfStreamWriter(
+        output_bcf, project_name=project_name, append=append, flushEvery=flushEvery
+    ) as writer:
+        if append:
+            issues = [issue for issue in issues if not writer.hasTopic(issue["title"])]
+        snapshots = None
+        if snapshotFile is not None and issues:
+            snapshots = renderSnapshots(
+                snapshotFile,
+                issueCameras(issues, bboxes),
+                [issue["elements"] for issue in issues],
+                workers=snapshotWorkers,
+            )
+        # building the topics (and rendering the snapshots) is the time of the loop minus writeTopic
+        with span("write_bcf_issues.topics", topics=len(issues)):
+            for topic in build_bcf_topics(
+                issues,
+                author,
+                bboxes,
+                xml_handler=writer.xml_handler,
+                snapshots=snapshots,
+            ):
+                with span("write_bcf_issues.writeTopic"):
+                    writer.writeTopic(topic)
+        return writer.written
+
+
+@profiled()
 def generate_bcf_from_ifc_elements(
     ifc_file: ifcopenshell.file,
     ifc_file_path: str,
     error_dict: dict,
     output_bcf: str = "issues.bcfzip",
     author: str = "HVAC-Checker",
+    bboxes: bboxTable | None = None,
+    append: bool = False,
+    clustering: dict | bool = True,
+    snapshots: bool = False,
+    snapshotWorkers: int | None = None,
 ):
     """
     Generate a BCF file from a dictionary of IFC elements and template messages.
 
+    bboxes (optional) are precomputed bounding boxes of the elements (i.e. from the clash analysis).
+    append: add the topics to an existing BCF file (topics with the same title are not added again).
+    clustering: collapse issues of the same category close to each other into one topic per cluster
+        (see clusterIssues()). True uses the default thresholds, a dict sets them
+        (i.e. {"cellSize": 10.0, "minClusterSize": 3}), False writes one topic per element.
+    snapshots: add a PNG snapshot of each viewpoint, rendered on the CPU in parallel (see SnapshotRenderer.py).
+    snapshotWorkers: number of processes the snapshots are rendered in (defaults to the number of CPUs).
+
     elements_dict format:
         {
             "Issue Category 1": [
@@ -109,24 +561,44 @@ def generate_bcf_from_ifc_elements(
     """
     extractor = IfcHeaderExtractor(ifc_file_path)
     header_info = extractor.extract()
-    bcf_project = BcfXml.create_new(project_name=header_info.get("name"))
-    bcf_project.save(filename=output_bcf, keep_open=True)
-    bcf_zip = bcf_project._zip_file  # keep reference if needed
 
+    issues = []
     for category, items in error_dict.items():
         for item in items:
             element = item["element"]
             if isinstance(element, int):
                 element = ifc_file.by_id(element)
-            add_bcf_issue(
-                bcf_project=bcf_project,
-                title=f"{category} - {element.GlobalId if hasattr(element, 'GlobalId') else 'Unknown'}",
-                message=item.get("message", "No description provided"),
-                author=author,
-                elements=element,
+            issues.append(
+                {
+                    "category": category,
+                    "title": f"{category} - {element.GlobalId if hasattr(element, 'GlobalId') else 'Unknown'}",
+                    "message": item.get("message", "No description provided"),
+                    "elements": element if isinstance(element, list) else [element],
+                }
             )
 
-    bcf_project.save(filename=output_bcf)
+    # bounding boxes of all elements the cameras look at, tessellated in one pass
+    bboxes = issueBBoxes(
+        ifc_file, [issue["elements"][0] for issue in issues], bboxes=bboxes
+    )
+    if clustering:
+        issues = clusterIssues(
+            ifc_file,
+            issues,
+            bboxes,
+            **(clustering if isinstance(clustering, dict) else {}),
+        )
+    # the topics are written to the file as they are built
+    write_bcf_issues(
+        output_bcf,
+        header_info.get("name"),
+        issues,
+        author=author,
+        bboxes=bboxes,
+        append=append,
+        snapshotFile=ifc_file if snapshots else None,
+        snapshotWorkers=snapshotWorkers,
+    )
 
 
 def old_add_issue(
@@ -138,6 +610,7 @@ def old_add_issue(
     ifc_file: ifcopenshell.file,
     bcf_path: str,
     bcf_zip: bcf.v3.visinfo.ZipFileInterface,
+    bboxes: bboxTable | None = None,
 ) -> None:
     th = bcf_obj.add_topic(
         title,
@@ -155,7 +628,7 @@ def old_add_issue(
         visinfo_handler.set_selected_elements([element])
 
     camera_view_point, camera_direction, camera_up_vector = cameraSetup(
-        element=element, ifc_file=ifc_file
+        element=element, ifc_file=ifc_file, bboxes=bboxes
     )
     visinfo_handler.visualization_info.perspective_camera = (
         bcf.v3.visinfo.build_camera_from_vectors(
@@ -177,6 +650,7 @@ def old_add_issue(
     ]
 
 
+@profiled()
 def old_generate_bcf_from_errors(
     console: Console,
     ifc_file: ifcopenshell.file,
@@ -185,21 +659,31 @@ def old_generate_bcf_from_errors(
     missingAHUsystems: dict,
     unassignedTerminals: dict,
     output_bcf: str = "hvac_issues.bcfzip",
+    bboxes: bboxTable | None = None,
+    append: bool = False,
+    clustering: dict | bool = True,
+    snapshots: bool = False,
+    snapshotWorkers: int | None = None,
 ) -> None:
     """
     Automatically writes a BCF file listing coordination issues:
       - misplacedElements: list of dicts with keys ['elementID', 'elementType', 'originalLevel', 'newLevel', ...]
       - missingAHUsystems: dict keyed by system name with ['ElementCount', 'ElementTypes', 'ElementIDs']
       - unassignedTerminals: dict keyed by flow direction, each containing list of GUIDs
+    bboxes (optional) are precomputed bounding boxes of the elements (i.e. from the clash analysis).
+    append: add the topics to an existing BCF file (topics with the same title are not added again).
+    clustering: collapse the unassigned terminals close to each other (same flow direction, storey and system)
+        into one topic per cluster (see clusterIssues()). True uses the default thresholds, a dict sets them
+        (i.e. {"cellSize": 10.0, "minClusterSize": 3}), False writes one topic per terminal.
+    snapshots: add a PNG snapshot of each viewpoint, rendered on the CPU in parallel (see SnapshotRenderer.py).
+    snapshotWorkers: number of processes the snapshots are rendered in (defaults to the number of CPUs).
     """
 
     console.print("🔧 Opening IFC file...")
     extractor = IfcHeaderExtractor(ifc_file_path)
     header_info = extractor.extract()
-    console.print("📦 Creating new BCF project...")
-    bcf_project = BcfXml.create_new(project_name=header_info.get("name"))
-    bcf_project.save(filename=output_bcf, keep_open=True)
-    bcf_zip = bcf_project._zip_file
+    issues = []
+
     # # misplaced elements
     # console.print("🧱 Adding misplaced element topics...")
     # for error_category, elements in misplacedElements.items():
@@ -244,22 +728,17 @@ def old_generate_bcf_from_errors(
             f"Types: {info.get('ElementTypes', 'Unknown')}."
         )
 
-        # this one does not work, and needs to be fixed!!!!!!
-        # inspect(info)
         systemElements = [ifc_file.by_id(el) for el in info["ElementIDs"]]
 
         if systemElements:
-            old_add_issue(
-                bcf_obj=bcf_project,
-                title=title,
-                message=desc,
-                author="HVAC-Checker",
-                element=systemElements,
-                ifc_file=ifc_file,
-                bcf_path=output_bcf,
-                bcf_zip=bcf_zip,
+            issues.append(
+                {
+                    "category": "Missing Air Handling Unit",
+                    "title": title,
+                    "message": desc,
+                    "elements": systemElements,
+                }
             )
-            # viewpoint.save()
 
     # unassigned air terminals
     console.print("🌬️ Adding unassigned terminal topics...")
@@ -268,17 +747,37 @@ def old_generate_bcf_from_errors(
             title = f"Air terminal not placed inside a space - ({element})"
             desc = f"Air terminal {element} - {flow_dir} is not located inside an IfcSpace."
 
-            old_add_issue(
-                bcf_obj=bcf_project,
-                title=title,
-                message=desc,
-                author="HVAC-Checker",
-                element=ifc_file.by_id(element),
-                ifc_file=ifc_file,
-                bcf_path=output_bcf,
-                bcf_zip=bcf_zip,
+            issues.append(
+                {
+                    "category": f"Air terminals not placed inside a space - {flow_dir}",
+                    "title": title,
+                    "message": desc,
+                    "elements": [ifc_file.by_id(element)],
+                }
             )
 
-    # save the BCF file
-    bcf_project.save(filename=output_bcf)
+    # cameras of all topics from the bounding boxes of the elements (tessellated in one pass, if not given)
+    bboxes = issueBBoxes(
+        ifc_file, [issue["elements"][0] for issue in issues], bboxes=bboxes
+    )
+    if clustering:
+        console.print("🗺️ Clustering topics...")
+        issues = clusterIssues(
+            ifc_file,
+            issues,
+            bboxes,
+            **(clustering if isinstance(clustering, dict) else {}),
+        )
+    # stream the topics to the BCF file
+    console.print("📦 Writing BCF topics...")
+    write_bcf_issues(
+        output_bcf,
+        header_info.get("name"),
+        issues,
+        author="HVAC-Checker",
+        bboxes=bboxes,
+        append=append,
+        snapshotFile=ifc_file if snapshots else None,
+        snapshotWorkers=snapshotWorkers,
+    )
     console.print(f"✅ BCF file successfully written: {output_bcf}")
@@ -3,7 +3,8 @@ import ifcopenshell.geom
 import ifcopenshell.api.spatial
 import os
 from datetime import datetime
-from .functions import getLevelElevation, get_element_bbox
+from .GeometryEngine import getElementBBoxes
+from .setupFunctions import getLevelElevation
 from rich.console import Console
 from rich.table import Table
 from rich.prompt import Prompt
@@ -37,9 +38,15 @@ def ElementLevelChecker(console: Console, ifc_file: ifcopenshell.file,
 
 
 
+    # bounding boxes of all target elements, tessellated in one pass
+    bboxes = getElementBBoxes(ifc_file, targetElements)
+
     elementCounter = 0
     for element in targetElements:
-        bbox = get_element_bbox(element=element)
+        bbox = bboxes.get(element)
+        if bbox is None:
+            # element has no geometry
+            continue
         minZ = bbox["min"][2]
         maxZ = bbox["max"][2]
         level, levelName = getLevelElevation(ifc_file= ifc_file, element=element)
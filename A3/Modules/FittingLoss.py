@@ -0,0 +1,187 @@
+"""
+Pressure loss of duct fittings from the zeta (ζ) tables in pressureLossDB.py (Danvak "Climatic Systems").
+
+Version: 17/10/26
+
+The tables are compiled once into sorted NumPy grids, and all fittings are looked up in one go
+with bilinear interpolation (values outside a table are clamped to its edge).
+
+The pressure loss of a fitting is Δp = ζ · ½ρv², where v is the velocity in the reference cross section:
+    - bends: the connected duct
+    - expansions: the inlet (ζ1)
+    - reductions: the outlet
+    - T-pieces: the outlet of the through and branch flow
+
+The IFC files do not contain the bend radius or the angle of transitions, so DEFAULT_BEND_RADIUS_RATIO and
+DEFAULT_TRANSITION_ANGLE are used.
+"""
+
+import numpy as np
+
+from .pressureLossDB import pressure_loss_db
+
+DEFAULT_BEND_RADIUS_RATIO = 1.0  # r/d (round) and r/h (rectangular)
+DEFAULT_TRANSITION_ANGLE = 30  # degrees
+
+RHO_AIR = 1.2041  # kg/m3 (air at 20°C)
+
+
+class zetaTable:
+    def __init__(self, rows: list, xKey: str, yKey: str):
+        """
+        Zeta values of one table on a sorted (x, y) grid.
+
+        input:
+            rows: list
+                Table rows from pressure_loss_db, i.e. {"r_d": 1.0, "diameter_mm": 75, "zeta": 0.44}.
+            xKey, yKey: str
+                The two parameters of the table.
+
+        Grid points missing in the table are filled with the nearest known value along y.
+        """
+        self.xKey, self.yKey = xKey, yKey
+        self.xs = np.array(sorted({row[xKey] for row in rows}), dtype=float)
+        self.ys = np.array(sorted({row[yKey] for row in rows}), dtype=float)
+
+        self.grid = np.full((len(self.xs), len(self.ys)), np.nan)
+        for row in rows:
+            self.grid[
+                np.searchsorted(self.xs, row[xKey]), np.searchsorted(self.ys, row[yKey])
+            ] = row["zeta"]
+
+        # fill missing grid points with the nearest known value along y (the tables are missing extreme combinations)
+        for i, values in enumerate(self.grid):
+            known = ~np.isnan(values)
+            if known.any():
+                nearest = np.abs(self.ys[:, None] - self.ys[known][None, :]).argmin(
+                    axis=1
+                )
+                self.grid[i] = values[known][nearest]
+
+    def _axis(self, axis: np.ndarray, values: np.ndarray):
+        """Indices of the grid points on each side of the values and the weight of the upper one."""
+        values = np.clip(values, axis[0], axis[-1])
+        if len(axis) == 1:
+            zeros = np.zeros(len(values), dtype=np.int64)
+            return zeros, zeros, np.zeros(len(values))
+
+        upper = np.clip(np.searchsorted(axis, values, side="right"), 1, len(axis) - 1)
+        lower = upper - 1
+        weight = (values - axis[lower]) / (axis[upper] - axis[lower])
+        return lower, upper, weight
+
+    def __call__(self, x, y) -> np.ndarray:
+        """Bilinear interpolation of zeta for all (x, y) pairs. NaN where x or y is NaN."""
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        x, y = np.broadcast_arrays(x, y)
+        unknown = np.isnan(x) | np.isnan(y)
+        x = np.where(unknown, self.xs[0], x)
+        y = np.where(unknown, self.ys[0], y)
+
+        x0, x1, tx = self._axis(self.xs, x)
+        y0, y1, ty = self._axis(self.ys, y)
+
+        corners = np.stack(
+            [
+                self.grid[x0, y0],
+                self.grid[x0, y1],
+                self.grid[x1, y0],
+                self.grid[x1, y1],
+            ]
+        )
+        weights = np.stack(
+            [
+                (1 - tx) * (1 - ty),
+                (1 - tx) * ty,
+                tx * (1 - ty),
+                tx * ty,
+            ]
+        )
+
+        # leave missing grid points out (and scale the weights of the others up)
+        weights = np.where(np.isnan(corners), 0, weights)
+        weightSum = weights.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            zeta = (np.nan_to_num(corners) * weights).sum(axis=0) / weightSum
+        zeta[(weightSum == 0) | unknown] = np.nan
+        return zeta
+
+
+ZETA_TABLES = {
+    "bend_round": zetaTable(pressure_loss_db["bend_round"], "r_d", "diameter_mm"),
+    "bend_rectangular": zetaTable(pressure_loss_db["bend_rectangular"], "r_h", "b_h"),
+    "expansion": zetaTable(pressure_loss_db["expansion"], "angle_deg", "A2_A1"),
+    "reduction": zetaTable(pressure_loss_db["reduction"], "angle_deg", "A1_A2"),
+    "t_through": zetaTable(pressure_loss_db["t_through"], "A1_A2", "qv1_qv"),
+    "t_branch_90": zetaTable(pressure_loss_db["t_branch_90"], "A2_Atot", "qv2_qv"),
+}
+
+
+def dynamicPressure(airFlow: np.ndarray, crossArea: np.ndarray) -> np.ndarray:
+    """½ρv² in Pa, for air flows in l/s and cross areas in m2."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        v = (np.asarray(airFlow, dtype=float) / 1000) / np.asarray(
+            crossArea, dtype=float
+        )
+    return 0.5 * RHO_AIR * v**2
+
+
+def bendZeta(diameter: np.ndarray, width: np.ndarray, height: np.ndarray) -> np.ndarray:
+    """Zeta of bends in round ducts (diameter in m) or rectangular ducts (width/height in m)."""
+    diameter = np.asarray(diameter, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        b_h = np.asarray(width, dtype=float) / np.asarray(height, dtype=float)
+
+    return np.where(
+        ~np.isnan(diameter),
+        ZETA_TABLES["bend_round"](DEFAULT_BEND_RADIUS_RATIO, diameter * 1000),
+        ZETA_TABLES["bend_rectangular"](DEFAULT_BEND_RADIUS_RATIO, b_h),
+    )
+
+
+def transitionZeta(inletArea: np.ndarray, outletArea: np.ndarray) -> tuple:
+    """
+    Zeta of expansions and reductions.
+
+    Returns: (zeta, referenceArea) - no loss if the areas are equal.
+    """
+    inletArea = np.asarray(inletArea, dtype=float)
+    outletArea = np.asarray(outletArea, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = outletArea / inletArea
+
+    zeta = np.where(
+        ratio > 1,
+        ZETA_TABLES["expansion"](DEFAULT_TRANSITION_ANGLE, ratio),
+        ZETA_TABLES["reduction"](DEFAULT_TRANSITION_ANGLE, ratio),
+    )
+    zeta = np.where(ratio == 1, 0.0, zeta)
+    referenceArea = np.where(ratio > 1, inletArea, outletArea)
+    return zeta, referenceArea
+
+
+def teeZeta(
+    inletArea: np.ndarray,
+    throughArea: np.ndarray,
+    branchArea: np.ndarray,
+    airFlow: np.ndarray,
+    throughAirFlow: np.ndarray,
+    branchAirFlow: np.ndarray,
+) -> tuple:
+    """
+    Zeta of T-pieces (90° branch) for the through flow and the branch flow.
+
+    Returns: (zetaThrough, zetaBranch)
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        airFlow = np.asarray(airFlow, dtype=float)
+        zetaThrough = ZETA_TABLES["t_through"](
+            np.asarray(throughArea) / np.asarray(inletArea),
+            np.asarray(throughAirFlow) / airFlow,
+        )
+        zetaBranch = ZETA_TABLES["t_branch_90"](
+            np.asarray(branchArea) / np.asarray(inletArea),
+            np.asarray(branchAirFlow) / airFlow,
+        )
+    return zetaThrough, zetaBranch
@@ -1,6 +1,7 @@
 import ifcopenshell
 import ifcopenshell.geom
-from .functions import getLevelElevation, get_element_bbox
+from .GeometryEngine import getElementBBoxes
+from .setupFunctions import getLevelElevation
 from rich.console import Console
 from rich.table import Table
 from rich.prompt import Prompt
@@ -13,9 +14,12 @@ def FreeHeightChecker(ifc_file: ifcopenshell.file, targetElements: list[ifcopens
     FreeHeights = {}
 
     targetElements = targetElements
+
+    # bounding boxes of all target elements, tessellated in one pass
+    bboxes = getElementBBoxes(ifc_file, targetElements)
     
     for element in targetElements:
-        bbox = get_element_bbox(element=element)
+        bbox = bboxes.get(element)
         level, name = getLevelElevation(ifc_file=ifc_file,element=element)
         if level is False:
             # element is assigned to building, not a storey
@@ -0,0 +1,506 @@
+"""
+GEOMETRY ENGINE
+
+Version: 17/10/26
+
+Shared geometry functions for the modules (clash detection, BCF camera setup, ElementLeveler and FreeHeightChecker).
+
+Instead of calling ifcopenshell.geom.create_shape() for one element at a time, all requested elements are
+tessellated in one pass with the multi-threaded ifcopenshell.geom.iterator, and their world-space
+axis aligned bounding boxes (AABBs) are stored in dense NumPy arrays.
+
+Bounding boxes and port placements can be stored in a geometryCache (.npz file in outputFiles/geometryCache),
+so a run on an unchanged IFC file does not tessellate anything.
+
+Returns:
+    bboxTable
+        AABBs of the tessellated elements, keyed by element id (ifcopenshell step id).
+"""
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import weakref
+import zipfile
+
+import ifcopenshell
+import ifcopenshell.geom
+import numpy as np
+
+from .Profiler import profiled
+
+
+def geometrySettings() -> ifcopenshell.geom.settings:
+    """Geometry settings used for all bounding boxes (world coordinates)."""
+    settings = ifcopenshell.geom.settings()
+    settings.set(settings.USE_WORLD_COORDS, True)
+    return settings
+
+
+def geometrySettingsKey() -> str:
+    """Text describing the geometry settings (and ifcopenshell version) - cached geometry is only reused if it matches."""
+    settings = geometrySettings()
+    values = []
+    for name in settings.setting_names():
+        try:
+            values.append(f"{name}={settings.get(name)}")
+        except RuntimeError:
+            # setting has no value
+            continue
+    return f"ifcopenshell {ifcopenshell.version}; " + "; ".join(values)
+
+
+@profiled()
+def get_element_bbox(element: ifcopenshell.entity_instance) -> dict:
+    """Return min/max XYZ coordinates of ONE IFC element in world coordinates.
+
+    Use getElementBBoxes() when bounding boxes are needed for more than a handful of elements.
+    """
+    shape = ifcopenshell.geom.create_shape(geometrySettings(), element)
+    verts = np.array(shape.geometry.verts).reshape(-1, 3)
+
+    bbox_min = verts.min(axis=0)
+    bbox_max = verts.max(axis=0)
+
+    return {"min": bbox_min, "max": bbox_max}
+
+
+def elementID(element: ifcopenshell.entity_instance | int) -> int:
+    """Step id of an element (elements can be given as entity instances or step ids)."""
+    if isinstance(element, ifcopenshell.entity_instance):
+        return element.id()
+    return int(element)
+
+
+#######################################
+#        The following functions (and class)
+#        are for caching geometry on disk
+#        between runs.
+#######################################
+
+
+# arrays stored in a geometry cache file
+CACHE_ARRAYS = (
+    "settingsKey",
+    "fileHash",
+    "fileStat",
+    "bboxGuids",
+    "bboxSignatures",
+    "bboxMins",
+    "bboxMaxs",
+    "portGuids",
+    "portSignatures",
+    "portPositions",
+)
+
+
+def cacheFileName(ifc_path: str, suffix: str) -> str:
+    """
+    Name of a cache file of an IFC file: the file name and a hash of its absolute path, so files with the same
+    name in different folders (i.e. one project per folder in batch_main.py) get their own cache.
+    """
+    pathHash = hashlib.blake2b(
+        os.path.abspath(ifc_path).encode(), digest_size=6
+    ).hexdigest()
+    return f"{os.path.basename(ifc_path)}.{pathHash}{suffix}"
+
+
+def writeFileAtomically(path: str, write, mode: str = "wb"):
+    """
+    Write a file with write(f) through a unique temporary file in the same folder, and move it into place.
+    An interrupted run leaves the old file, and processes writing the same file at the same time do not
+    overwrite each other's temporary file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmpPath = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".",
+        prefix=os.path.basename(path) + ".",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmpPath, path)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+
+def fileHash(path: str) -> str:
+    """Content hash of a file."""
+    fileHasher = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(8 * 1024 * 1024):
+            fileHasher.update(chunk)
+    return fileHasher.hexdigest()
+
+
+def elementSignature(
+    ifc_file: ifcopenshell.file, element: ifcopenshell.entity_instance
+) -> str:
+    """Hash of the STEP lines that define the geometry of an element.
+
+    That is the element itself plus its placement and representation (including the entities they reference),
+    so moving a placement or editing a profile also invalidates the cached geometry.
+    """
+    elementHasher = hashlib.blake2b(digest_size=16)
+    elementHasher.update(str(element).encode())
+    for attribute in ("ObjectPlacement", "Representation"):
+        value = getattr(element, attribute, None)
+        if value is not None:
+            for inst in ifc_file.traverse(value):
+                elementHasher.update(str(inst).encode())
+    return elementHasher.hexdigest()
+
+
+class geometryCache:
+    def __init__(
+        self,
+        ifc_path: str,
+        cacheDir: str = os.path.join("A3", "outputFiles", "geometryCache"),
+    ):
+        """
+        Bounding boxes and port placements of one IFC file, stored per GlobalId in a .npz file.
+
+        input:
+            ifc_path: str
+                Path to the IFC file on disk.
+            cacheDir: str
+                Folder with the cache files.
+
+        The cache is keyed by the content hash of the IFC file and the geometry settings:
+            - Same file hash: all cached elements are reused without checking them.
+            - Different file hash: each cached element is only reused if elementSignature() is unchanged.
+            - Different geometry settings: the cache is discarded.
+        """
+        self.ifc_path = ifc_path
+        self.cachePath = os.path.join(cacheDir, cacheFileName(ifc_path, ".npz"))
+        self.settingsKey = geometrySettingsKey()
+        stat = os.stat(ifc_path)
+        self.fileStat = f"{stat.st_size}:{stat.st_mtime_ns}"
+        self.fileHash = None
+
+        # entries valid for the current file: GlobalId -> (signature, values)
+        self.bboxEntries = {}
+        self.portEntries = {}
+        # entries from a previous version of the file, only reused if the element signature is unchanged
+        self.bboxCandidates = {}
+        self.portCandidates = {}
+        self.changed = False
+
+        self.load()
+
+    def load(self):
+        data = None
+        if os.path.isfile(self.cachePath):
+            try:
+                with np.load(self.cachePath, allow_pickle=False) as npz:
+                    data = {key: npz[key] for key in CACHE_ARRAYS}
+                settingsKey = str(data["settingsKey"])
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                # unreadable or incomplete cache file: tessellate again and overwrite it
+                data = None
+
+        if data is None or settingsKey != self.settingsKey:
+            self.fileHash = fileHash(self.ifc_path)
+            self.changed = data is not None
+            return
+
+        # only hash the file again if size or modification time has changed
+        if str(data["fileStat"]) == self.fileStat:
+            self.fileHash = str(data["fileHash"])
+        else:
+            self.fileHash = fileHash(self.ifc_path)
+
+        bboxEntries = {
+            guid: (signature, (bboxMin, bboxMax))
+            for guid, signature, bboxMin, bboxMax in zip(
+                data["bboxGuids"].tolist(),
+                data["bboxSignatures"].tolist(),
+                data["bboxMins"],
+                data["bboxMaxs"],
+            )
+        }
+        portEntries = {
+            guid: (signature, position)
+            for guid, signature, position in zip(
+                data["portGuids"].tolist(),
+                data["portSignatures"].tolist(),
+                data["portPositions"].tolist(),
+            )
+        }
+
+        if str(data["fileHash"]) == self.fileHash:
+            self.bboxEntries, self.portEntries = bboxEntries, portEntries
+        else:
+            self.bboxCandidates, self.portCandidates = bboxEntries, portEntries
+            self.changed = True
+
+    def _lookup(self, entries, candidates, ifc_file, element):
+        entry = entries.get(element.GlobalId)
+        if entry is not None:
+            return entry[1]
+
+        entry = candidates.pop(element.GlobalId, None)
+        if entry is not None and entry[0] == elementSignature(ifc_file, element):
+            entries[element.GlobalId] = entry
+            return entry[1]
+        return None
+
+    def lookupBBox(
+        self, ifc_file: ifcopenshell.file, element: ifcopenshell.entity_instance
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """Cached (min, max) of an element (NaN if it has no geometry), or None if it is not cached."""
+        return self._lookup(self.bboxEntries, self.bboxCandidates, ifc_file, element)
+
+    def storeBBox(
+        self,
+        ifc_file: ifcopenshell.file,
+        element: ifcopenshell.entity_instance,
+        bboxMin: np.ndarray,
+        bboxMax: np.ndarray,
+    ):
+        self.bboxEntries[element.GlobalId] = (
+            elementSignature(ifc_file, element),
+            (np.asarray(bboxMin, dtype=float), np.asarray(bboxMax, dtype=float)),
+        )
+        self.changed = True
+
+    def lookupPort(
+        self, ifc_file: ifcopenshell.file, port: ifcopenshell.entity_instance
+    ) -> list[float] | None:
+        """Cached XYZ position of a port, or None if it is not cached."""
+        return self._lookup(self.portEntries, self.portCandidates, ifc_file, port)
+
+    def storePort(
+        self,
+        ifc_file: ifcopenshell.file,
+        port: ifcopenshell.entity_instance,
+        position: list[float],
+    ):
+        self.portEntries[port.GlobalId] = (
+            elementSignature(ifc_file, port),
+            [float(v) for v in position],
+        )
+        self.changed = True
+
+    def save(self):
+        """Write the cache to disk (only the entries that are valid for the current file)."""
+        if not self.changed:
+            return
+
+        bboxGuids = list(self.bboxEntries.keys())
+        portGuids = list(self.portEntries.keys())
+
+        def write(f):
+            np.savez(
+                f,
+                settingsKey=np.array(self.settingsKey),
+                fileHash=np.array(self.fileHash),
+                fileStat=np.array(self.fileStat),
+                bboxGuids=np.array(bboxGuids, dtype=str),
+                bboxSignatures=np.array(
+                    [self.bboxEntries[g][0] for g in bboxGuids], dtype=str
+                ),
+                bboxMins=np.array(
+                    [self.bboxEntries[g][1][0] for g in bboxGuids], dtype=float
+                ).reshape(-1, 3),
+                bboxMaxs=np.array(
+                    [self.bboxEntries[g][1][1] for g in bboxGuids], dtype=float
+                ).reshape(-1, 3),
+                portGuids=np.array(portGuids, dtype=str),
+                portSignatures=np.array(
+                    [self.portEntries[g][0] for g in portGuids], dtype=str
+                ),
+                portPositions=np.array(
+                    [self.portEntries[g][1] for g in portGuids], dtype=float
+                ).reshape(-1, 3),
+            )
+
+        # write to a temporary file first, so an interrupted run does not leave a broken cache
+        writeFileAtomically(self.cachePath, write)
+        self.changed = False
+
+
+# geometry caches attached to opened ifc files (see useGeometryCache())
+_fileCaches = weakref.WeakKeyDictionary()
+
+
+def useGeometryCache(
+    ifc_file: ifcopenshell.file,
+    ifc_path: str,
+    cacheDir: str = os.path.join("A3", "outputFiles", "geometryCache"),
+) -> geometryCache:
+    """Attach a disk cache to an opened IFC file. getElementBBoxes() and getPortPositions() use it automatically."""
+    cache = geometryCache(ifc_path=ifc_path, cacheDir=cacheDir)
+    _fileCaches[ifc_file] = cache
+    return cache
+
+
+def getGeometryCache(ifc_file: ifcopenshell.file) -> geometryCache | None:
+    return _fileCaches.get(ifc_file)
+
+
+#######################################
+#        Batched geometry
+#######################################
+
+
+class bboxTable:
+    def __init__(self, ids, mins, maxs):
+        """
+        input:
+            ids: list[int]
+                Step ids of the elements.
+            mins, maxs: np.ndarray
+                (n, 3) arrays with the min/max XYZ coordinates of each element.
+        """
+        self.ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        self.mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+        self.maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+        self.rows = {elID: row for row, elID in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, element):
+        return elementID(element) in self.rows
+
+    def get(self, element: ifcopenshell.entity_instance | int) -> dict | None:
+        """Bounding box of an element in the same format as get_element_bbox(), or None if it has no geometry."""
+        row = self.rows.get(elementID(element))
+        if row is None:
+            return None
+        return {"min": self.mins[row].copy(), "max": self.maxs[row].copy()}
+
+    def take(self, elements: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Bounding boxes for a list of elements as arrays.
+
+        Returns:
+            found: np.ndarray
+                Boolean mask of the elements that have a bounding box.
+            mins, maxs: np.ndarray
+                (found.sum(), 3) arrays of the found elements (in the given order).
+        """
+        rows = np.array(
+            [self.rows.get(elementID(el), -1) for el in elements], dtype=np.int64
+        )
+        found = rows >= 0
+        return found, self.mins[rows[found]], self.maxs[rows[found]]
+
+
+@profiled()
+def getElementBBoxes(
+    ifc_file: ifcopenshell.file,
+    elements: list,
+    threads: int | None = None,
+) -> bboxTable:
+    """
+    Tessellate all elements in one pass and return their world-space bounding boxes.
+
+    input:
+        ifc_file: ifcopenshell.file
+            File containing the elements.
+        elements: list[ifcopenshell.entity_instance | int]
+            Elements (or step ids) to get bounding boxes for. Elements without geometry are left out.
+        threads: int | None
+            Number of threads used by the geometry iterator (defaults to the number of CPUs).
+
+    Returns: bboxTable with the bounding boxes keyed by step id.
+    """
+    products = {}
+    for element in elements:
+        if not isinstance(element, ifcopenshell.entity_instance):
+            element = ifc_file.by_id(element)
+        if element.is_a("IfcProduct") and element.Representation is not None:
+            products[element.id()] = element
+
+    ids, mins, maxs = [], [], []
+
+    # reuse cached bounding boxes
+    cache = getGeometryCache(ifc_file)
+    if cache is not None:
+        for elID, element in list(products.items()):
+            cached = cache.lookupBBox(ifc_file, element)
+            if cached is None:
+                continue
+            del products[elID]
+            if not np.isnan(cached[0]).any():
+                ids.append(elID)
+                mins.append(cached[0])
+                maxs.append(cached[1])
+
+    if not products:
+        return bboxTable(ids, mins, maxs)
+
+    iterator = ifcopenshell.geom.iterator(
+        geometrySettings(),
+        ifc_file,
+        threads or multiprocessing.cpu_count(),
+        include=list(products.values()),
+    )
+    tessellated = set()
+    if iterator.initialize():
+        while True:
+            shape = iterator.get()
+            verts = np.frombuffer(shape.geometry.verts_buffer, dtype=np.float64)
+            if len(verts):
+                verts = verts.reshape(-1, 3)
+                ids.append(shape.id)
+                mins.append(verts.min(axis=0))
+                maxs.append(verts.max(axis=0))
+                tessellated.add(shape.id)
+                if cache is not None:
+                    cache.storeBBox(ifc_file, products[shape.id], mins[-1], maxs[-1])
+            if not iterator.next():
+                break
+
+    if cache is not None:
+        # also remember the elements without geometry, so they are not tessellated again
+        for elID, element in products.items():
+            if elID not in tessellated:
+                cache.storeBBox(
+                    ifc_file, element, np.full(3, np.nan), np.full(3, np.nan)
+                )
+        cache.save()
+
+    return bboxTable(ids, mins, maxs)
+
+
+@profiled()
+def getPortPositions(
+    ifc_file: ifcopenshell.file,
+    ports: list[ifcopenshell.entity_instance],
+) -> dict[int, list[float]]:
+    """
+    XYZ positions of IfcDistributionPorts (placement of the port, same as ifcopenshell.geom.map_shape()).
+
+    Returns: A dictionary with port step id as key and [x, y, z] as value.
+    """
+    cache = getGeometryCache(ifc_file)
+    settings = ifcopenshell.geom.settings()
+
+    positions = {}
+    for port in ports:
+        if port.id() in positions:
+            continue
+        if cache is not None:
+            cached = cache.lookupPort(ifc_file, port)
+            if cached is not None:
+                positions[port.id()] = cached
+                continue
+
+        port_matrix = ifcopenshell.geom.map_shape(
+            settings=settings, inst=port
+        ).matrix.components
+        positions[port.id()] = [port_matrix[0][3], port_matrix[1][3], port_matrix[2][3]]
+        if cache is not None:
+            cache.storePort(ifc_file, port, positions[port.id()])
+
+    if cache is not None:
+        cache.save()
+
+    return positions
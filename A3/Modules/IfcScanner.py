@@ -0,0 +1,173 @@
+"""
+Fast scan of IFC files: header and entity counts, without opening the file with ifcopenshell.
+
+Version: 17/10/26
+
+The header is read with IfcHeaderExtractor, and the DATA section is streamed line by line to count
+the entities of each type (SCAN_ENTITY_TYPES, including their subtypes). No model is built, so this is
+fast enough to show what each file in a folder contains before the user picks one.
+
+The scans are cached in one JSON file (SCAN_CACHE_FILE), keyed by path, file size and modification time.
+"""
+
+import json
+import os
+import zipfile
+
+import ifcopenshell.ifcopenshell_wrapper
+from ifcopenshell.util.file import IfcHeaderExtractor
+
+# entity types counted by scanIfcFile()
+SCAN_ENTITY_TYPES = [
+    "IfcSpace",
+    "IfcDistributionSystem",
+    "IfcAirTerminal",
+    "IfcDuctSegment",
+    "IfcDuctFitting",
+    "IfcUnitaryEquipment",
+    "IfcFurniture",
+]
+
+SCAN_CACHE_FILE = os.path.join("A3", "outputFiles", "geometryCache", "ifcScans.json")
+
+
+def countEntityTypes(lines) -> dict[bytes, int]:
+    """
+    Count the entities of each type in the DATA section of a STEP file.
+
+    input:
+        lines: iterable of bytes
+            Lines of the file, i.e. an open file in binary mode.
+
+    Returns: A dictionary with the upper case type name (i.e. b"IFCSPACE") as key and the count as value.
+    """
+    counts = {}
+    for line in lines:
+        # instances look like: #12=IFCSPACE('2b...',...);
+        if not line.startswith(b"#"):
+            continue
+        equals = line.find(b"=")
+        parenthesis = line.find(b"(", equals)
+        if equals < 0 or parenthesis < 0:
+            continue
+        typeName = line[equals + 1 : parenthesis].strip().upper()
+        counts[typeName] = counts.get(typeName, 0) + 1
+    return counts
+
+
+def subtypeNames(schemaName: str, IfcType: str) -> set[bytes]:
+    """Upper case names of an entity type and all its subtypes in the schema (just the type if the schema is unknown)."""
+    try:
+        schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schemaName)
+        declarations = [schema.declaration_by_name(IfcType)]
+    except Exception:
+        return {IfcType.upper().encode()}
+
+    names = set()
+    while declarations:
+        declaration = declarations.pop()
+        names.add(declaration.name().upper().encode())
+        declarations.extend(declaration.subtypes())
+    return names
+
+
+def _openData(path: str):
+    """Binary stream of the STEP data of a .ifc or .ifczip file."""
+    if path.lower().endswith(".ifczip"):
+        archive = zipfile.ZipFile(path)
+        member = next(
+            name for name in archive.namelist() if name.lower().endswith(".ifc")
+        )
+        return archive.open(member)
+    return open(path, "rb")
+
+
+def _fileStat(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _scan(path: str) -> dict:
+    header = dict(IfcHeaderExtractor(path).extract())
+    with _openData(path) as stream:
+        counts = countEntityTypes(stream)
+
+    schemaName = header.get("schema_name") or "IFC4"
+    return {
+        "header": header,
+        "entityCount": sum(counts.values()),
+        "entityCounts": {
+            IfcType: sum(
+                counts.get(name, 0) for name in subtypeNames(schemaName, IfcType)
+            )
+            for IfcType in SCAN_ENTITY_TYPES
+        },
+    }
+
+
+def scanIfcFiles(paths: list[str], cacheFile: str | None = SCAN_CACHE_FILE) -> dict:
+    """
+    Header and entity counts of IFC files (only files that changed since the last scan are read).
+
+    input:
+        paths: list[str]
+            Paths of .ifc/.ifczip files.
+        cacheFile: str | None
+            JSON file the scans are cached in (None: no cache).
+
+    Returns: A dictionary with the path as key and a dictionary as value:
+        {"header": IfcHeaderExtractor output, "entityCount": int, "entityCounts": {IfcType: count}}
+    Files that can not be read get None.
+    """
+    cache = {}
+    if cacheFile and os.path.exists(cacheFile):
+        try:
+            with open(cacheFile) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    scans = {}
+    changed = False
+    for path in paths:
+        key = os.path.abspath(path)
+        try:
+            fileStat = _fileStat(path)
+        except OSError:
+            scans[path] = None
+            continue
+
+        entry = cache.get(key)
+        if (
+            entry
+            and entry["fileStat"] == fileStat
+            and entry["scanTypes"] == SCAN_ENTITY_TYPES
+        ):
+            scans[path] = entry["scan"]
+            continue
+
+        try:
+            scans[path] = _scan(path)
+        except Exception:
+            scans[path] = None
+            continue
+        cache[key] = {
+            "fileStat": fileStat,
+            "scanTypes": SCAN_ENTITY_TYPES,
+            "scan": scans[path],
+        }
+        changed = True
+
+    if cacheFile and changed:
+        os.makedirs(os.path.dirname(cacheFile) or ".", exist_ok=True)
+        tmpFile = cacheFile + ".tmp"
+        with open(tmpFile, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmpFile, cacheFile)
+
+    return scans
+
+
+def scanIfcFile(path: str, cacheFile: str | None = SCAN_CACHE_FILE) -> dict | None:
+    """Header and entity counts of one IFC file, see scanIfcFiles()."""
+    return scanIfcFiles([path], cacheFile)[path]
@@ -0,0 +1,371 @@
+"""
+Incremental re-analysis: only the ventilation systems that changed since the previous run are built again.
+
+Version: 17/10/26
+
+After each run a snapshot is stored next to the geometry cache (<MEP file>.snapshot.pkl) with:
+    - a signature of each system: the STEP content (step ids left out) of its elements, their ports and
+      placements/representations, and which elements the ports are connected to.
+    - the built system trees (networkStore payloads, with GlobalIds instead of step ids).
+    - a signature of each space in the ARCH file, and the issues written to the BCF file.
+
+The next run compares the new files with the snapshot by GlobalId and STEP content:
+    - Systems with the same signature are reused from the snapshot, the rest are built again.
+    - Air flows and pressure losses are recalculated for all systems (the air terminals may be in changed spaces).
+    - The BCF file is only written again if the issues (missing AHUs, unassigned terminals) have changed.
+ahuFinder and the clash analysis are always run, but unchanged elements are not tessellated again (geometry cache).
+"""
+
+import hashlib
+import os
+import pickle
+import re
+
+import ifcopenshell
+import ifcopenshell.util.system
+import numpy as np
+from rich.console import Console
+from treelib.tree import Tree
+
+from .AirFlowEstimator import spaceAirFlowCalculator
+from .BcfGenerator import old_generate_bcf_from_errors
+from .GeometryEngine import cacheFileName, getGeometryCache, writeFileAtomically
+from .VentilationSystemAnalyzer import (
+    ahuFinder,
+    airTerminalSpaceClashAnalyzer,
+    buildTerminalSpaceIndex,
+    getSystemTrees,
+)
+from .Profiler import profiled
+
+SNAPSHOT_VERSION = 1
+
+_STEP_REFERENCE = re.compile(r"#(\d+)")
+
+
+def contentLines(ifc_file: ifcopenshell.file, roots: list) -> list[str]:
+    """
+    STEP lines of the roots and all entities they reference, without step ids.
+
+    References are replaced by the position of the entity in the traversal, so the lines only change
+    when the content changes (not when the file is exported again with other step ids).
+    """
+    instances = []
+    for root in roots:
+        if root is not None:
+            instances.extend(ifc_file.traverse(root))
+
+    positions = {}
+    for inst in instances:
+        positions.setdefault(inst.id(), len(positions))
+
+    def reference(match) -> str:
+        return f"#{positions.get(int(match.group(1)), '?')}"
+
+    return [_STEP_REFERENCE.sub(reference, str(inst)) for inst in instances]
+
+
+def elementContent(
+    ifc_file: ifcopenshell.file, element: ifcopenshell.entity_instance
+) -> list[str]:
+    """STEP content of an element: its own attributes (references left out), placement and representation."""
+    return [
+        element.is_a(),
+        _STEP_REFERENCE.sub("#", str(element).split("=", 1)[1]),
+        *contentLines(
+            ifc_file,
+            [
+                getattr(element, "ObjectPlacement", None),
+                getattr(element, "Representation", None),
+            ],
+        ),
+    ]
+
+
+def systemSignatures(
+    ifc_file: ifcopenshell.file, identifiedSystems: dict
+) -> dict[str, str]:
+    """
+    Signature of each system (output from ahuFinder()), used to find the systems that changed.
+
+    Covers everything build_downstream_tree() and networkStore.addElement() read: the elements of the system,
+    their ports (with placements) and the GlobalIds of the elements the ports are connected to.
+    """
+    signatures = {}
+    elementSignatures = {}  # elements can be in several systems
+
+    for systemName, info in identifiedSystems.items():
+        systemHasher = hashlib.blake2b(digest_size=16)
+        systemHasher.update(systemName.encode())
+
+        for globalId in sorted(info.get("ElementIDs", [])):
+            if globalId not in elementSignatures:
+                element = ifc_file.by_guid(globalId)
+                elementHasher = hashlib.blake2b(digest_size=16)
+                elementHasher.update(globalId.encode())
+                for line in elementContent(ifc_file, element):
+                    elementHasher.update(line.encode())
+
+                for port in ifcopenshell.util.system.get_ports(element):
+                    for line in elementContent(ifc_file, port):
+                        elementHasher.update(line.encode())
+                    # connected elements (sorted, the order of the inverses follows the step ids)
+                    connections = []
+                    for direction, rels in (
+                        ("from", port.ConnectedFrom),
+                        ("to", port.ConnectedTo),
+                    ):
+                        for rel in rels:
+                            for otherPort in (rel.RelatingPort, rel.RelatedPort):
+                                otherElement = (
+                                    ifcopenshell.util.system.get_port_element(otherPort)
+                                )
+                                if otherPort != port and otherElement is not None:
+                                    connections.append(
+                                        f"{direction}:{otherElement.GlobalId}"
+                                    )
+                    for connection in sorted(connections):
+                        elementHasher.update(connection.encode())
+
+                elementSignatures[globalId] = elementHasher.hexdigest()
+            systemHasher.update(elementSignatures[globalId].encode())
+
+        signatures[systemName] = systemHasher.hexdigest()
+    return signatures
+
+
+def spaceSignatures(space_file: ifcopenshell.file) -> dict[str, str]:
+    """Signature of each IfcSpace (content, placement and representation), by GlobalId."""
+    signatures = {}
+    for space in space_file.by_type("IfcSpace"):
+        spaceHasher = hashlib.blake2b(digest_size=16)
+        for line in elementContent(space_file, space):
+            spaceHasher.update(line.encode())
+        signatures[space.GlobalId] = spaceHasher.hexdigest()
+    return signatures
+
+
+def systemPayloads(systemsTree: Tree) -> dict[str, dict]:
+    """
+    Store each system of a tree from getSystemTrees() as a payload (see networkStore.payload()) without step ids.
+
+    The element and branch GlobalIds are stored instead of step ids (these can change when a file is exported again),
+    and air flows/pressure losses are cleared as they are recalculated in every run.
+    """
+    network = systemsTree[systemsTree.root].data.network
+    rootRow = network.rows[systemsTree.root]
+    systems = network.system[: len(network)]
+
+    payloads = {}
+    for systemNode in systemsTree.children(systemsTree.root):
+        systemRow = network.rows[systemNode.identifier]
+        rows = np.concatenate([[rootRow], np.flatnonzero(systems == systemRow)])
+
+        payload = network.payload(rows)
+        columns = payload["columns"]
+        for name in ("airFlow", "elementPressureLoss", "pathPressureLoss"):
+            columns[name][:] = 0
+        payload["branchElementIDs"] = [
+            network.ifc_file.by_id(int(stepID)).GlobalId if stepID >= 0 else None
+            for stepID in columns["branchStepID"]
+        ]
+        payload["tags"] = [
+            systemsTree[identifier].tag for identifier in payload["identifiers"]
+        ]
+        payloads[systemNode.identifier] = payload
+    return payloads
+
+
+def restorePayload(payload: dict, ifc_file: ifcopenshell.file) -> dict:
+    """Payload from systemPayloads() with the step ids of the elements in ifc_file."""
+    columns = dict(payload["columns"])
+    columns["stepID"] = np.array(
+        [
+            ifc_file.by_guid(elementID).id() if stepID >= 0 else -1
+            for stepID, elementID in zip(columns["stepID"], payload["elementIDs"])
+        ],
+        dtype=np.int64,
+    )
+    columns["branchStepID"] = np.array(
+        [
+            ifc_file.by_guid(elementID).id() if elementID else -1
+            for elementID in payload["branchElementIDs"]
+        ],
+        dtype=np.int64,
+    )
+    return {**payload, "columns": columns}
+
+
+def snapshotPath(ifc_path: str, ifc_file: ifcopenshell.file | None = None) -> str:
+    """Snapshot file of a MEP file: next to its geometry cache (or in the default cache folder)."""
+    cache = getGeometryCache(ifc_file) if ifc_file is not None else None
+    cacheDir = (
+        os.path.dirname(cache.cachePath)
+        if cache is not None
+        else os.path.join("A3", "outputFiles", "geometryCache")
+    )
+    return os.path.join(cacheDir, cacheFileName(ifc_path, ".snapshot.pkl"))
+
+
+def loadSnapshot(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception:
+        return None
+    return snapshot if snapshot.get("version") == SNAPSHOT_VERSION else None
+
+
+def saveSnapshot(path: str, snapshot: dict):
+    writeFileAtomically(path, lambda f: pickle.dump(snapshot, f))
+
+
+@profiled()
+def incrementalPipeline(
+    console: Console,
+    MEP_file: ifcopenshell.file,
+    MEP_path: str,
+    space_file: ifcopenshell.file,
+    output_bcf: str | None = None,
+    building_category: str | None = "II",
+    space_file_name: str = "ARCH",
+    snapshotFile: str | None = None,
+    workers: int | None = None,
+    bcfSnapshots: bool = False,
+    bcfSnapshotWorkers: int | None = None,
+) -> tuple:
+    """
+    Same analysis as modulePipeline(), but systems that have not changed since the previous run are reused.
+
+    input:
+        console: rich.console.Console
+            For console printing purposes.
+        MEP_file, MEP_path:
+            MEP file with ventilation systems and its path on disk.
+        space_file: ifcopenshell.file
+            Architectural ifc file with spaces.
+        output_bcf: str | None
+            BCF file with the issues - only written again if the issues have changed (None: no BCF file).
+        building_category: str | None
+            Passed on to spaceAirFlowCalculator().
+        space_file_name: str
+            Name of the ARCH file (for the space table).
+        snapshotFile: str | None
+            Snapshot of the previous run (default: snapshotPath()).
+        workers: int | None
+            Passed on to getSystemTrees().
+        bcfSnapshots, bcfSnapshotWorkers:
+            Passed on to old_generate_bcf_from_errors() as snapshots and snapshotWorkers.
+
+    Returns: The same values as modulePipeline() and a dictionary of what changed:
+        {"changedSystems": [...], "reusedSystems": [...], "changedSpaces": [...], "bcfWritten": bool}
+    """
+    snapshotFile = snapshotFile or snapshotPath(MEP_path, MEP_file)
+    snapshot = loadSnapshot(snapshotFile) or {}
+
+    ifc_file_Spaces, table_AirFlows = spaceAirFlowCalculator(
+        console=console, space_file=space_file, building_category=building_category
+    )
+
+    identifiedSystems, missingAHUsystems, table_AHUs = ahuFinder(
+        console, MEP_file, targetSystems="IfcDistributionSystem"
+    )
+    spaceTerminals, unassignedTerminals, table_Spaces = airTerminalSpaceClashAnalyzer(
+        console,
+        MEP_file,
+        ifc_file_Spaces,
+        identifiedSystems=identifiedSystems,
+        space_file_name=space_file_name,
+    )
+    terminalSpaces = buildTerminalSpaceIndex(ifc_file_Spaces, spaceTerminals)
+
+    # diff against the previous run
+    signatures = systemSignatures(MEP_file, identifiedSystems)
+    oldSignatures = snapshot.get("systemSignatures", {})
+    oldPayloads = snapshot.get("systemPayloads", {})
+    cachedSystems = {
+        systemName: restorePayload(oldPayloads[systemName], MEP_file)
+        for systemName, signature in signatures.items()
+        if oldSignatures.get(systemName) == signature and systemName in oldPayloads
+    }
+
+    spaces = spaceSignatures(ifc_file_Spaces)
+    oldSpaces = snapshot.get("spaceSignatures", {})
+    changedSpaces = sorted(
+        spaceID
+        for spaceID in spaces.keys() | oldSpaces.keys()
+        if spaces.get(spaceID) != oldSpaces.get(spaceID)
+    )
+
+    systemsTree, ifc_file_new = getSystemTrees(
+        console=console,
+        identifiedSystems=identifiedSystems,
+        ifc_file=MEP_file,
+        space_file=ifc_file_Spaces,
+        spaceTerminals=spaceTerminals,
+        terminalSpaces=terminalSpaces,
+        showChoice="n",
+        workers=workers,
+        ifc_path=MEP_path,
+        cachedSystems=cachedSystems,
+    )
+
+    # the BCF file only depends on the issues
+    issues = {
+        "missingAHUsystems": missingAHUsystems,
+        "unassignedTerminals": unassignedTerminals,
+    }
+    bcfWritten = False
+    if output_bcf is not None and (
+        issues != snapshot.get("issues")
+        or snapshot.get("output_bcf") != output_bcf
+        or not os.path.exists(output_bcf)
+    ):
+        old_generate_bcf_from_errors(
+            console=console,
+            ifc_file=MEP_file,
+            ifc_file_path=MEP_path,
+            missingAHUsystems=missingAHUsystems,
+            unassignedTerminals=unassignedTerminals,
+            output_bcf=output_bcf,
+            snapshots=bcfSnapshots,
+            snapshotWorkers=bcfSnapshotWorkers,
+        )
+        bcfWritten = True
+
+    saveSnapshot(
+        snapshotFile,
+        {
+            "version": SNAPSHOT_VERSION,
+            "systemSignatures": signatures,
+            "systemPayloads": systemPayloads(systemsTree),
+            "spaceSignatures": spaces,
+            "issues": issues,
+            "output_bcf": output_bcf,
+        },
+    )
+
+    changes = {
+        "changedSystems": [s for s in identifiedSystems if s not in cachedSystems],
+        "reusedSystems": [s for s in identifiedSystems if s in cachedSystems],
+        "changedSpaces": changedSpaces,
+        "bcfWritten": bcfWritten,
+    }
+    console.print(
+        f"Incremental analysis: {len(changes['changedSystems'])} systems built, "
+        f"{len(changes['reusedSystems'])} reused, {len(changedSpaces)} changed spaces"
+    )
+
+    return (
+        identifiedSystems,
+        missingAHUsystems,
+        table_AHUs,
+        spaceTerminals,
+        unassignedTerminals,
+        table_Spaces,
+        systemsTree,
+        ifc_file_new,
+        changes,
+    )
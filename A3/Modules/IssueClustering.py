@@ -0,0 +1,172 @@
+"""
+Clustering of BCF issues, so thousands of similar issues close to each other become a few topics.
+
+Version: 17/10/26
+
+Issues with one element (i.e. air terminals that are not inside a space) are grouped by:
+    - issue category,
+    - storey the element is contained in,
+    - (first) system the element belongs to,
+    - position: the bounding box centers are hashed to a grid of cellSize (m), and neighbouring occupied cells
+      are joined into one cluster.
+Clusters with at least minClusterSize issues become one issue with all elements selected and the combined
+bounding box (the BCF camera frames the whole cluster). Clusters larger than maxClusterSize are split.
+Smaller clusters, issues with more than one element and elements without geometry are kept as they are.
+"""
+
+import itertools
+
+import ifcopenshell
+import ifcopenshell.util.system
+import numpy as np
+
+from .GeometryEngine import bboxTable
+from .Profiler import profiled
+
+# default thresholds of clusterIssues()
+CLUSTER_CELL_SIZE = 5.0  # m
+CLUSTER_MIN_SIZE = 5
+CLUSTER_MAX_SIZE = 200
+
+# the 26 neighbouring cells (and the cell itself) of a grid cell
+_NEIGHBOUR_OFFSETS = list(itertools.product((-1, 0, 1), repeat=3))
+
+
+def elementContainers(ifc_file: ifcopenshell.file) -> dict:
+    """Spatial structure element (i.e. storey) of every contained element, in one pass: {element id: structure}."""
+    containers = {}
+    for rel in ifc_file.by_type("IfcRelContainedInSpatialStructure"):
+        for element in rel.RelatedElements:
+            containers.setdefault(element.id(), rel.RelatingStructure)
+    return containers
+
+
+def _gridClusters(cells: list[tuple]) -> list[list[int]]:
+    """Join the items in neighbouring occupied grid cells. Returns lists of item indices (in item order)."""
+    cellItems = {}
+    for i, cell in enumerate(cells):
+        cellItems.setdefault(cell, []).append(i)
+
+    clusters = []
+    seen = set()
+    for start in cellItems:
+        if start in seen:
+            continue
+        seen.add(start)
+        stack, items = [start], []
+        while stack:
+            cell = stack.pop()
+            items.extend(cellItems[cell])
+            for offset in _NEIGHBOUR_OFFSETS:
+                neighbour = (
+                    cell[0] + offset[0],
+                    cell[1] + offset[1],
+                    cell[2] + offset[2],
+                )
+                if neighbour in cellItems and neighbour not in seen:
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        clusters.append(sorted(items))
+    return clusters
+
+
+@profiled()
+def clusterIssues(
+    ifc_file: ifcopenshell.file,
+    issues: list[dict],
+    bboxes: bboxTable,
+    cellSize: float = CLUSTER_CELL_SIZE,
+    minClusterSize: int = CLUSTER_MIN_SIZE,
+    maxClusterSize: int = CLUSTER_MAX_SIZE,
+) -> list[dict]:
+    """
+    Collapse issues of the same category that are close to each other into one issue per cluster.
+
+    input:
+        ifc_file: ifcopenshell.file
+            File containing the issue elements.
+        issues: list[dict]
+            [{"category": str, "title": str, "message": str, "elements": [ifcopenshell.entity_instance, ...]}, ...]
+            (the issue format of build_bcf_topics(), with a category).
+        bboxes: bboxTable
+            Bounding boxes of the issue elements, see issueBBoxes().
+        cellSize: float
+            Size of the grid cells (m). Issues in the same or neighbouring cells are clustered.
+        minClusterSize: int
+            Clusters with fewer issues are not collapsed.
+        maxClusterSize: int
+            Clusters with more issues are split into several issues.
+
+    Returns: The list of issues, where each collapsed cluster is one issue (at the position of its first issue)
+        with all elements, the messages of all issues and "bbox": (min, max) of the whole cluster.
+    """
+    candidates = [
+        i
+        for i, issue in enumerate(issues)
+        if len(issue["elements"]) == 1 and issue["elements"][0] in bboxes
+    ]
+    if len(candidates) < minClusterSize:
+        return list(issues)
+
+    _, mins, maxs = bboxes.take([issues[i]["elements"][0] for i in candidates])
+    centers = (mins + maxs) / 2
+    cells = np.floor(centers / cellSize).astype(np.int64).tolist()
+
+    # group by category, storey and system, then cluster each group on the grid
+    containers = elementContainers(ifc_file)
+    groups = {}
+    for row, i in enumerate(candidates):
+        element = issues[i]["elements"][0]
+        container = containers.get(element.id())
+        systems = ifcopenshell.util.system.get_element_systems(element)
+        key = (
+            issues[i].get("category", ""),
+            container.id() if container is not None else None,
+            systems[0].Name if systems else None,
+        )
+        groups.setdefault(key, []).append(row)
+
+    clusterOf = (
+        {}
+    )  # issue index -> cluster issue (only set for the first issue of a cluster)
+    clustered = set()
+    for (category, containerID, systemName), rows in groups.items():
+        for cluster in _gridClusters([tuple(cells[row]) for row in rows]):
+            if len(cluster) < minClusterSize:
+                continue
+            clusterRows = [rows[c] for c in cluster]
+            for start in range(0, len(clusterRows), maxClusterSize):
+                chunk = clusterRows[start : start + maxClusterSize]
+                if len(chunk) < minClusterSize:
+                    continue
+                members = [candidates[row] for row in chunk]
+                container = (
+                    ifc_file.by_id(containerID) if containerID is not None else None
+                )
+                location = ", ".join(
+                    name
+                    for name in (
+                        container.Name if container is not None else None,
+                        systemName,
+                    )
+                    if name
+                )
+                clusterOf[members[0]] = {
+                    "category": category,
+                    "title": f"{category} - {len(members)} elements"
+                    + (f" ({location})" if location else ""),
+                    "message": f"{len(members)} issues close to each other:\n"
+                    + "\n".join(issues[i]["message"] for i in members),
+                    "elements": [issues[i]["elements"][0] for i in members],
+                    "bbox": (
+                        mins[chunk].min(axis=0),
+                        maxs[chunk].max(axis=0),
+                    ),
+                }
+                clustered.update(members)
+
+    return [
+        clusterOf[i] if i in clusterOf else issue
+        for i, issue in enumerate(issues)
+        if i in clusterOf or i not in clustered
+    ]
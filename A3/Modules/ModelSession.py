@@ -0,0 +1,74 @@
+"""
+Session cache of opened IFC models, so the menu does not re-open and re-parse the files for every run.
+
+Version: 17/10/26
+
+Parsed models are kept in an LRU cache keyed by path, file size and modification time (a changed file is
+opened again). Each analysis run gets a working copy of a model with checkout():
+    - The changes of a run (i.e. the Psets added by spaceAirFlowCalculator() and getSystemTrees()) are recorded
+      in an ifcopenshell transaction.
+    - The next checkout() of the same model rolls the previous run back first.
+So the working copy is the parsed model itself (no copy is made), but every run starts from the file as it is
+on disk - a second run does not stack duplicate Psets, and runs with different building categories reuse the parsed model.
+"""
+
+import os
+from collections import OrderedDict
+
+import ifcopenshell
+
+from .GeometryEngine import useGeometryCache
+from .PropertyIndex import dropPropertyIndex
+
+
+class modelSession:
+    def __init__(self, maxModels: int = 4):
+        """
+        input:
+            maxModels: int
+                Number of parsed models kept in memory (least recently used models are dropped first).
+        """
+        self.maxModels = maxModels
+        self.models = OrderedDict()  # (path, size, mtime) -> ifcopenshell.file
+
+    def _key(self, path: str) -> tuple:
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def open(self, path: str) -> ifcopenshell.file:
+        """The parsed model of a file (opened the first time, or when the file has changed)."""
+        key = self._key(path)
+        if key in self.models:
+            self.models.move_to_end(key)
+            return self.models[key]
+
+        # drop older versions of the same file
+        for oldKey in [k for k in self.models if k[0] == key[0]]:
+            del self.models[oldKey]
+
+        ifc_file = ifcopenshell.open(path)
+        useGeometryCache(ifc_file, path)
+        self.models[key] = ifc_file
+        while len(self.models) > self.maxModels:
+            self.models.popitem(last=False)
+        return ifc_file
+
+    def checkout(self, path: str) -> ifcopenshell.file:
+        """
+        Working copy of a model for one analysis run.
+
+        The changes of the previous run on the model are rolled back, and the changes of the new run are recorded
+        until the next checkout() (the returned file keeps them, i.e. for export).
+        """
+        ifc_file = self.open(path)
+        ifc_file.discard_transaction()
+        # the property index still has the values of the previous run
+        dropPropertyIndex(ifc_file)
+        ifc_file.begin_transaction()
+        return ifc_file
+
+    def __contains__(self, path: str) -> bool:
+        return os.path.exists(path) and self._key(path) in self.models
+
+    def __len__(self):
+        return len(self.models)
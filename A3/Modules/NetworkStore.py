@@ -0,0 +1,780 @@
+"""
+Compact (struct-of-arrays) storage of the ventilation networks built by getSystemTrees().
+
+Version: 17/10/26
+
+Every element in the system trees is one row in a networkStore. The values used in the analysis
+(air flow, pressure losses, duct dimensions, parent, IFC type, ...) are stored in NumPy arrays instead of
+one Python object per element, so large networks stay small in memory and aggregations run on whole arrays.
+
+elementNode is a thin view of one row, so the treelib trees (and tree.show(data_property=...)) work as before.
+"""
+
+import ifcopenshell
+import ifcopenshell.geom
+import ifcopenshell.util.system
+import numpy as np
+
+from .FittingLoss import bendZeta, dynamicPressure, teeZeta, transitionZeta
+from .Profiler import profiled
+
+FITTING_TYPES = [None, "Straight", "Bend", "Tee"]
+
+# pressure loss of fittings that can not be looked up in the zeta tables
+DEFAULT_FITTING_PRESSURE_LOSS = 10  # Pa (assumed value)
+
+# number of fittings that are passed through to find the duct segment next to a fitting
+MAX_FITTING_STEPS = 4
+
+
+def roundValues(values: np.ndarray, decimals: int = 2) -> np.ndarray:
+    """np.round(), but values close to a tie are rounded with Python's round() - so the results are the same as round()."""
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, decimals)
+
+    scaled = values * 10**decimals
+    closeToTie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(closeToTie):
+        rounded[i] = round(float(values[i]), decimals)
+    return rounded
+
+
+def getElementDims(element: ifcopenshell.entity_instance) -> tuple:
+    """
+    Cross area (m2), length (m) and dimensions of a duct segment.
+
+    Only works for IfcDuctElements with IfcCircleProfileDef or IfcRectangleProfileDef
+    """
+    if element.is_a() not in ["IfcDuctSegment"]:
+        return 0, 0, {}
+
+    elementAreaSolid = element.Representation.Representations[0].Items[0]
+    elementSweptArea = elementAreaSolid.SweptArea
+
+    if elementSweptArea.is_a() == "IfcCircleProfileDef":
+        crossArea = np.pi * (elementSweptArea.Radius / 1000) ** 2  # m2
+        elementLength = round(elementAreaSolid.Depth / 1000, 3)  # m
+        elementDims = {"Diameter_m": round(elementSweptArea.Radius * 2 / 1000, 3)}
+
+    elif elementSweptArea.is_a() == "IfcRectangleProfileDef":
+        crossArea = (
+            min(
+                elementSweptArea.XDim,
+                elementSweptArea.YDim,
+            )
+            / 1000
+            * elementAreaSolid.Depth
+            / 1000
+        )  # m2
+        elementLength = (
+            max(
+                elementSweptArea.XDim,
+                elementSweptArea.YDim,
+            )
+            / 1000
+        )  # m
+        elementDims = {
+            "Width_m": round(
+                min(
+                    elementSweptArea.XDim,
+                    elementSweptArea.YDim,
+                )
+                / 1000,
+                3,
+            ),
+            "Height_m": round(elementAreaSolid.Depth / 1000, 3),
+        }
+
+    else:
+        return 0, 0, {}
+
+    return round(crossArea, 3), round(elementLength, 3), elementDims
+
+
+def getHydraulicDiameter(elementDims: dict) -> float:
+    """Hydraulic diameter (m) of a round or rectangular duct, NaN if the dimensions are unknown."""
+    if elementDims.get("Diameter_m"):
+        # circular duct
+        return (
+            4
+            * ((np.pi * elementDims.get("Diameter_m") ** 2) / 4)
+            / (np.pi * elementDims.get("Diameter_m"))
+        )  # m
+
+    elif elementDims.get("Width_m") and elementDims.get("Height_m"):
+        # rectangular duct
+        return (2 * elementDims.get("Height_m") * elementDims.get("Width_m")) / (
+            elementDims.get("Height_m") + elementDims.get("Width_m")
+        )  # m
+
+    return np.nan
+
+
+def getPortPosition(port: ifcopenshell.entity_instance) -> list:
+    port_matrix = ifcopenshell.geom.map_shape(
+        settings=ifcopenshell.geom.settings(), inst=port
+    ).matrix.components
+    return [port_matrix[0][3], port_matrix[1][3], port_matrix[2][3]]
+
+
+def getBranchPort(ports: list, positions: list) -> int:
+    """
+    Index of the branch port of a T-piece with three ports.
+
+    The two ports furthest apart are the main run (through flow), the third port is the branch.
+    """
+    positions = np.asarray(positions, dtype=float)
+    pairs = [(0, 1, 2), (0, 2, 1), (1, 2, 0)]
+    distances = [np.linalg.norm(positions[i] - positions[j]) for i, j, _ in pairs]
+    return pairs[int(np.argmax(distances))][2]
+
+
+def getOrientationVector(port1=None, port2=None) -> np.ndarray:
+    # create orientation vector from elementPorts
+    vector = np.array(port2) - np.array(port1)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return np.array([0, 0, 0])
+    return np.round(vector / norm, 2)
+
+
+def ductPressureLoss(
+    airFlow: np.ndarray,
+    crossArea: np.ndarray,
+    hydraulicDiameter: np.ndarray,
+    length: np.ndarray,
+) -> np.ndarray:
+    """
+    Friction pressure loss of duct segments (Blasius correlation for turbulent flow, 64/Re for laminar flow).
+
+    input:
+        airFlow: np.ndarray
+            Air flow in l/s.
+        crossArea: np.ndarray
+            Cross area in m2.
+        hydraulicDiameter: np.ndarray
+            Hydraulic diameter in m.
+        length: np.ndarray
+            Length in m.
+
+    Returns: Pressure loss in Pa (rounded to 2 decimals) for each segment.
+        NaN for segments without air flow or with invalid dimensions.
+    """
+    airFlow = np.asarray(airFlow, dtype=float)
+    crossArea = np.asarray(crossArea, dtype=float)
+    D_h = np.asarray(hydraulicDiameter, dtype=float)
+    length = np.asarray(length, dtype=float)
+
+    valid = (
+        (airFlow != 0)
+        & ~np.isnan(crossArea)
+        & (crossArea != 0)
+        & (length != 0)
+        & ~np.isnan(D_h)
+    )
+    losses = np.full(len(airFlow), np.nan)
+    if not valid.any():
+        return losses
+    airFlow, crossArea, D_h, length = (
+        airFlow[valid],
+        crossArea[valid],
+        D_h[valid],
+        length[valid],
+    )
+
+    # Convert air flow from l/s to m3/s
+    Q = airFlow / 1000  # m3/s
+
+    # Calculate velocity (v = Q / A)
+    v = Q / crossArea  # m/s
+
+    # Air properties at 20°C
+    rho = 1.2041  # kg/m3
+    mu = 1.81e-5  # Pa.s
+
+    # Calculate Reynolds number (Re = (rho * v * D_h) / mu)
+    Re = (rho * v * D_h) / mu
+
+    # Determine friction factor (f) using the Blasius correlation for turbulent flow
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f_lambda = np.where(
+            Re < 2000,
+            64 / (Re + 1e-10),  # Laminar flow
+            0.3164 * np.abs(Re) ** -0.25,  # Turbulent flow
+        )
+
+    # dynamic pressure
+    p_d = 0.5 * rho * v**2  # Pa/m
+
+    # Calculate pressure loss (ΔP = f * (p_d/D_h))
+    delta_P = f_lambda * (p_d / D_h)
+
+    losses[valid] = roundValues(delta_P * length, 2)  # Pressure loss in Pascals
+    return losses
+
+
+class networkStore:
+    # name and dtype of each per-element array
+    COLUMNS = {
+        "airFlow": np.float64,  # l/s
+        "elementPressureLoss": np.float64,  # Pa
+        "pathPressureLoss": np.float64,  # Pa
+        "crossArea": np.float64,  # m2 (NaN if unknown)
+        "length": np.float64,  # m (NaN if unknown)
+        "hydraulicDiameter": np.float64,  # m (NaN if unknown)
+        "diameter": np.float64,  # m - round ducts (NaN if unknown)
+        "width": np.float64,  # m - rectangular ducts (NaN if unknown)
+        "height": np.float64,  # m - rectangular ducts (NaN if unknown)
+        "parent": np.int64,  # row of the parent in the tree (-1 for the root)
+        "depth": np.int32,  # 0: root, 1: system, 2: AHU, ...
+        "typeCode": np.int16,  # index into typeNames
+        "fittingType": np.int8,  # index into FITTING_TYPES
+        "stepID": np.int64,  # ifcopenshell step id of the element (-1 if no element)
+        "system": np.int64,  # row of the system the element is in (-1 for the root)
+        "branchStepID": np.int64,  # T-pieces: step id of the element connected to the branch port (-1 if none)
+    }
+
+    def __init__(self, ifc_file: ifcopenshell.file | None = None, capacity: int = 1024):
+        """
+        input:
+            ifc_file: ifcopenshell.file
+                The MEP file, used to look up the elements of the rows.
+            capacity: int
+                Initial number of rows (the arrays grow when needed).
+        """
+        self.ifc_file = ifc_file
+        self.size = 0
+        for name, dtype in self.COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.portOrientations = np.full((capacity, 3), np.nan)
+
+        self.typeNames = []
+        self.typeCodes = {}
+
+        # identifiers/GlobalIds are only references to the strings - one list each
+        self.identifiers = []
+        self.elementIDs = []
+        self.prevElementIDs = []
+        self.rows = {}  # identifier -> row
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        capacity = max(1024, 2 * len(self.airFlow))
+        for name in self.COLUMNS:
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[: self.size] = array[: self.size]
+            setattr(self, name, grown)
+        grown = np.full((capacity, 3), np.nan)
+        grown[: self.size] = self.portOrientations[: self.size]
+        self.portOrientations = grown
+
+    def getTypeCode(self, IfcType: str) -> int:
+        if IfcType not in self.typeCodes:
+            self.typeCodes[IfcType] = len(self.typeNames)
+            self.typeNames.append(IfcType)
+        return self.typeCodes[IfcType]
+
+    def addElement(
+        self,
+        identifier: str,
+        parent: str | None,
+        IfcType: str,
+        element: ifcopenshell.entity_instance | None = None,
+        elementID: str | None = None,
+        prevElementID: str | None = None,
+        portPositions: dict | None = None,
+    ) -> "elementNode":
+        """
+        Add an element to the network.
+
+        input:
+            identifier: str
+                Identifier of the node in the tree.
+            parent: str | None
+                Identifier of the parent node in the tree (None for the root).
+            IfcType: str
+                IFC class (or "Root").
+            element: ifcopenshell.entity_instance | None
+                The IFC element - dimensions and port orientations are read from it.
+            elementID, prevElementID: str | None
+                Same as elementNode.elementID and elementNode.prevElementID.
+            portPositions: dict | None
+                Precomputed port positions (port step id -> [x, y, z]) from getPortPositions().
+                Ports that are not in it are placed with ifcopenshell.geom.map_shape().
+
+        Returns: elementNode view of the new row.
+        """
+        if self.size == len(self.airFlow):
+            self._grow()
+        row = self.size
+        self.size += 1
+
+        parentRow = self.rows[parent] if parent is not None else -1
+        self.parent[row] = parentRow
+        self.depth[row] = self.depth[parentRow] + 1 if parentRow >= 0 else 0
+        self.typeCode[row] = self.getTypeCode(IfcType)
+        self.stepID[row] = element.id() if element is not None else -1
+        self.system[row] = (
+            row
+            if self.depth[row] == 1
+            else self.system[parentRow] if parentRow >= 0 else -1
+        )
+        self.branchStepID[row] = -1
+        for name in (
+            "crossArea",
+            "length",
+            "hydraulicDiameter",
+            "diameter",
+            "width",
+            "height",
+        ):
+            getattr(self, name)[row] = np.nan
+
+        self.identifiers.append(identifier)
+        self.elementIDs.append(elementID)
+        self.prevElementIDs.append(prevElementID)
+        self.rows[identifier] = row
+
+        if element is None:
+            return elementNode(self, row)
+
+        representation = element.Representation
+        if representation is not None:
+            elementAreaSolid = representation.Representations[0].Items[0]
+            if elementAreaSolid.is_a() != "IfcMappedItem":
+                crossArea, length, elementDims = getElementDims(element)
+                self.crossArea[row] = crossArea
+                self.length[row] = length
+                self.hydraulicDiameter[row] = getHydraulicDiameter(elementDims)
+                self.diameter[row] = elementDims.get("Diameter_m", np.nan)
+                self.width[row] = elementDims.get("Width_m", np.nan)
+                self.height[row] = elementDims.get("Height_m", np.nan)
+
+        elementPorts = ifcopenshell.util.system.get_ports(element)
+        if len(elementPorts) in (2, 3):
+            positions = [
+                (
+                    portPositions[port.id()]
+                    if portPositions and port.id() in portPositions
+                    else getPortPosition(port)
+                )
+                for port in elementPorts
+            ]
+
+        if len(elementPorts) == 2:
+            # find orientation vector
+            self.portOrientations[row] = getOrientationVector(
+                port1=positions[0], port2=positions[1]
+            )
+            if IfcType == "IfcDuctFitting":
+                # check if fitting is straight (the orientation consists only of 1s and 0s) or not
+                if all(abs(x) in (0, 1) for x in self.portOrientations[row]):
+                    self.fittingType[row] = FITTING_TYPES.index("Straight")
+                else:
+                    self.fittingType[row] = FITTING_TYPES.index("Bend")
+
+        elif len(elementPorts) == 3 and IfcType == "IfcDuctFitting":
+            self.fittingType[row] = FITTING_TYPES.index("Tee")
+            branchPort = elementPorts[getBranchPort(elementPorts, positions)]
+            connectedPort = ifcopenshell.util.system.get_connected_port(branchPort)
+            if connectedPort is not None:
+                connectedElement = ifcopenshell.util.system.get_port_element(
+                    connectedPort
+                )
+                if connectedElement is not None:
+                    self.branchStepID[row] = connectedElement.id()
+
+        return elementNode(self, row)
+
+    def view(self, identifier: str) -> "elementNode":
+        return elementNode(self, self.rows[identifier])
+
+    def payload(self, rows: np.ndarray | None = None) -> dict:
+        """
+        Rows (default: all rows) as arrays and lists (without the ifc file), so the network can be sent to another process or stored.
+
+        Parent and system are renumbered to the positions in the payload (-1 if they are not included).
+        """
+        rows = (
+            np.arange(self.size) if rows is None else np.asarray(rows, dtype=np.int64)
+        )
+        position = np.full(self.size, -1, dtype=np.int64)
+        position[rows] = np.arange(len(rows))
+
+        columns = {name: getattr(self, name)[rows].copy() for name in self.COLUMNS}
+        for name in ("parent", "system"):
+            columns[name] = np.where(
+                columns[name] >= 0, position[np.maximum(columns[name], 0)], -1
+            )
+
+        return {
+            "columns": columns,
+            "portOrientations": self.portOrientations[rows].copy(),
+            "typeNames": list(self.typeNames),
+            "identifiers": [self.identifiers[row] for row in rows.tolist()],
+            "elementIDs": [self.elementIDs[row] for row in rows.tolist()],
+            "prevElementIDs": [self.prevElementIDs[row] for row in rows.tolist()],
+        }
+
+    def appendPayload(self, payload: dict) -> np.ndarray:
+        """
+        Append the rows of another network (output from payload()) to this network.
+
+        Roots (rows without parent) are not added again, but matched to the row with the same identifier in this network.
+        Parent, system and type codes are renumbered to the rows and types of this network.
+
+        Returns: The row in this network of each row in the payload.
+        """
+        columns = payload["columns"]
+        identifiers = payload["identifiers"]
+        isRoot = columns["parent"] < 0
+        added = np.flatnonzero(~isRoot)
+
+        rows = np.empty(len(identifiers), dtype=np.int64)
+        rows[added] = self.size + np.arange(len(added))
+        for i in np.flatnonzero(isRoot):
+            rows[i] = self.rows[identifiers[i]]
+
+        while self.size + len(added) > len(self.airFlow):
+            self._grow()
+        newRows = rows[added]
+
+        for name in self.COLUMNS:
+            getattr(self, name)[newRows] = columns[name][added]
+        self.portOrientations[newRows] = payload["portOrientations"][added]
+
+        # renumber references to rows and types
+        self.parent[newRows] = rows[columns["parent"][added]]
+        system = columns["system"][added]
+        self.system[newRows] = np.where(system >= 0, rows[np.maximum(system, 0)], -1)
+        typeCodes = np.array(
+            [self.getTypeCode(IfcType) for IfcType in payload["typeNames"]],
+            dtype=self.typeCode.dtype,
+        )
+        self.typeCode[newRows] = typeCodes[columns["typeCode"][added]]
+
+        for i, row in zip(added.tolist(), newRows.tolist()):
+            self.identifiers.append(identifiers[i])
+            self.elementIDs.append(payload["elementIDs"][i])
+            self.prevElementIDs.append(payload["prevElementIDs"][i])
+            self.rows[identifiers[i]] = row
+        self.size += len(added)
+
+        return rows
+
+    def levels(self) -> list[np.ndarray]:
+        """Rows grouped by depth: levels()[d] are the rows at depth d (in the order they were added)."""
+        depth = self.depth[: self.size]
+        order = np.argsort(depth, kind="stable")
+        counts = np.bincount(depth)
+        return np.split(order, np.cumsum(counts)[:-1])
+
+    @profiled()
+    def sumAirFlows(self, leafAirFlows: dict, minDepth: int = 2):
+        """
+        The air flow of each element is the sum of the air flows of its children (leaves get leafAirFlows).
+        Rows above minDepth are not changed.
+        """
+        levels = self.levels()
+        rows = np.arange(self.size)
+        childCount = np.bincount(
+            self.parent[: self.size][self.parent[: self.size] >= 0],
+            minlength=self.size,
+        )
+
+        deep = rows[self.depth[: self.size] >= minDepth]
+        self.airFlow[deep] = 0
+        for row in deep[childCount[deep] == 0]:
+            self.airFlow[row] = leafAirFlows.get(self.identifiers[row], 0)
+
+        # deepest level first, so all children are summed before their parent
+        for depth in range(len(levels) - 1, minDepth, -1):
+            levelRows = levels[depth]
+            np.add.at(self.airFlow, self.parent[levelRows], self.airFlow[levelRows])
+
+    @profiled()
+    def pressureLosses(self, rows: np.ndarray | None = None):
+        """
+        Calculate pressure loss for duct elements - all given rows (default: all rows) in one go.
+        Rows without air flow (or with invalid dimensions) are not changed.
+        """
+        rows = (
+            np.arange(self.size) if rows is None else np.asarray(rows, dtype=np.int64)
+        )
+        rows = rows[self.airFlow[rows] != 0]
+
+        typeCodes = self.typeCode[rows]
+        segments = rows[typeCodes == self.typeCodes.get("IfcDuctSegment", -1)]
+        fittings = rows[typeCodes == self.typeCodes.get("IfcDuctFitting", -1)]
+        terminals = rows[typeCodes == self.typeCodes.get("IfcAirTerminal", -1)]
+
+        segmentLosses = ductPressureLoss(
+            airFlow=self.airFlow[segments],
+            crossArea=self.crossArea[segments],
+            hydraulicDiameter=self.hydraulicDiameter[segments],
+            length=self.length[segments],
+        )
+        valid = ~np.isnan(segmentLosses)
+        self.elementPressureLoss[segments[valid]] = segmentLosses[valid]
+
+        self.elementPressureLoss[fittings] = self.fittingPressureLosses(fittings)
+
+        # PRESSURE LOSS ESTIMATION OF AIR TERMINALS IS NOT IMPLEMENTED YET!
+        self.elementPressureLoss[terminals] = 0.2  # Pa (assumed value)
+
+    def childRows(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Number of children, first child and second child (-1 if none) of each row."""
+        parents = self.parent[: self.size]
+        order = np.argsort(
+            parents, kind="stable"
+        )  # children in the order they were added
+        starts = np.searchsorted(parents[order], rows, side="left")
+        counts = np.searchsorted(parents[order], rows, side="right") - starts
+
+        firstChild = np.where(counts >= 1, order[np.minimum(starts, self.size - 1)], -1)
+        secondChild = np.where(
+            counts >= 2, order[np.minimum(starts + 1, self.size - 1)], -1
+        )
+        return counts, firstChild, secondChild
+
+    def nearestSegmentRows(self, rows: np.ndarray, towardsRoot: bool) -> np.ndarray:
+        """
+        Row of the duct segment next to each row (-1 if none): the row itself if it is a duct segment, otherwise
+        the parent (towardsRoot) or the only child, through at most MAX_FITTING_STEPS other fittings.
+        """
+        rows = np.array(rows, dtype=np.int64)
+        segmentCode = self.typeCodes.get("IfcDuctSegment", -1)
+        fittingCode = self.typeCodes.get("IfcDuctFitting", -1)
+        found = np.full(len(rows), -1, dtype=np.int64)
+
+        for _ in range(MAX_FITTING_STEPS + 1):
+            valid = rows >= 0
+            typeCodes = np.where(valid, self.typeCode[np.maximum(rows, 0)], -1)
+            isSegment = valid & (typeCodes == segmentCode)
+            found[isSegment] = rows[isSegment]
+
+            # only continue through fittings
+            searching = valid & (typeCodes == fittingCode) & (found < 0)
+            if not searching.any():
+                break
+            if towardsRoot:
+                nextRows = self.parent[rows[searching]]
+            else:
+                counts, firstChild, _ = self.childRows(rows[searching])
+                nextRows = np.where(counts == 1, firstChild, -1)
+            rows = np.full(len(rows), -1, dtype=np.int64)
+            rows[searching] = nextRows
+        return found
+
+    def fittingPressureLosses(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Pressure loss (Pa) of duct fittings from the zeta tables (see FittingLoss.py), for all rows in one go.
+
+        The cross sections are taken from the duct segments next to the fitting (see nearestSegmentRows(), if the
+        fitting is connected to other fittings, i.e. a bend into a tee):
+            - Bend: the duct before (or after) the bend.
+            - Straight: expansion/reduction from the inlet to the outlet duct (flow direction from the system type).
+            - Tee: inlet duct, through duct and branch duct - the largest of the through and branch loss is used.
+              Only tees in supply systems are looked up, the zeta tables are for diverging flow.
+        Fittings that can not be looked up (unknown type, no duct segments next to them, or tees in return systems)
+        get DEFAULT_FITTING_PRESSURE_LOSS.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        losses = np.full(len(rows), np.nan)
+        if len(rows) == 0:
+            return losses
+
+        fittingTypes = self.fittingType[rows]
+        counts, firstChild, secondChild = self.childRows(rows)
+
+        def column(name: str, columnRows: np.ndarray) -> np.ndarray:
+            values = getattr(self, name)[np.maximum(columnRows, 0)]
+            values = np.where(columnRows >= 0, values, np.nan)
+            if name == "crossArea":
+                # elements without a known cross section (fittings, terminals) are stored with 0
+                values = np.where(values > 0, values, np.nan)
+            return values
+
+        # the duct segments next to the fitting (through other fittings connected to it)
+        parents = self.nearestSegmentRows(self.parent[rows], towardsRoot=True)
+        firstChildDuct = self.nearestSegmentRows(firstChild, towardsRoot=False)
+        secondChildDuct = self.nearestSegmentRows(secondChild, towardsRoot=False)
+
+        airFlow = self.airFlow[rows]
+        parentArea = column("crossArea", parents)
+        childArea = column("crossArea", firstChildDuct)
+
+        # bends: use the duct before the bend, or the duct after it
+        bends = fittingTypes == FITTING_TYPES.index("Bend")
+        duct = np.where(~np.isnan(parentArea), parents, firstChildDuct)
+        zeta = bendZeta(
+            column("diameter", duct), column("width", duct), column("height", duct)
+        )
+        bendLoss = zeta * dynamicPressure(airFlow, column("crossArea", duct))
+        losses[bends] = bendLoss[bends]
+
+        # straight: expansion or reduction (return systems flow towards the AHU)
+        straights = fittingTypes == FITTING_TYPES.index("Straight")
+        returnSystem = np.array(
+            ["VU" in str(self.identifiers[system]) for system in self.system[rows]],
+            dtype=bool,
+        )
+        inletArea = np.where(returnSystem, childArea, parentArea)
+        outletArea = np.where(returnSystem, parentArea, childArea)
+        zeta, referenceArea = transitionZeta(inletArea, outletArea)
+        straightLoss = zeta * dynamicPressure(airFlow, referenceArea)
+        losses[straights] = straightLoss[straights]
+
+        # tees: find the child connected to the branch port
+        # (the zeta tables are for diverging flow, so tees in return systems get the default loss)
+        tees = (
+            (fittingTypes == FITTING_TYPES.index("Tee")) & (counts == 2) & ~returnSystem
+        )
+        branchStepIDs = self.branchStepID[rows]
+        firstIsBranch = column("stepID", firstChild) == branchStepIDs
+        secondIsBranch = column("stepID", secondChild) == branchStepIDs
+        tees &= firstIsBranch | secondIsBranch
+        branchChild = np.where(firstIsBranch, firstChild, secondChild)
+        throughChild = np.where(firstIsBranch, secondChild, firstChild)
+        branchDuct = np.where(firstIsBranch, firstChildDuct, secondChildDuct)
+        throughDuct = np.where(firstIsBranch, secondChildDuct, firstChildDuct)
+
+        throughArea = column("crossArea", throughDuct)
+        branchArea = column("crossArea", branchDuct)
+        zetaThrough, zetaBranch = teeZeta(
+            inletArea=parentArea,
+            throughArea=throughArea,
+            branchArea=branchArea,
+            airFlow=airFlow,
+            throughAirFlow=column("airFlow", throughChild),
+            branchAirFlow=column("airFlow", branchChild),
+        )
+        with np.errstate(invalid="ignore"):
+            teeLoss = np.fmax(
+                zetaThrough
+                * dynamicPressure(column("airFlow", throughChild), throughArea),
+                zetaBranch
+                * dynamicPressure(column("airFlow", branchChild), branchArea),
+            )
+        # all three cross sections are needed to look up a tee
+        tees &= ~(np.isnan(parentArea) | np.isnan(throughArea) | np.isnan(branchArea))
+        losses[tees] = teeLoss[tees]
+
+        losses = np.where(
+            np.isnan(losses), DEFAULT_FITTING_PRESSURE_LOSS, roundValues(losses, 2)
+        )
+        return losses
+
+    @profiled()
+    def pressureLossDuct(self, row: int):
+        """
+        Calculate pressure loss for one duct element.
+        """
+        self.pressureLosses(np.array([row]))
+
+    @profiled()
+    def accumulatePathPressureLoss(self, minDepth: int = 2):
+        """pathPressureLoss = elementPressureLoss + pathPressureLoss of the parent, from the top of the tree and down."""
+        levels = self.levels()
+        for depth in range(minDepth, len(levels)):
+            levelRows = levels[depth]
+            self.pathPressureLoss[levelRows] = roundValues(
+                self.elementPressureLoss[levelRows]
+                + self.pathPressureLoss[self.parent[levelRows]],
+                2,
+            )
+
+
+class elementNode:
+    """
+    View of one element (row) in a networkStore.
+
+    Has the same attributes as the element objects used before, so it can be used as data of the treelib nodes.
+    """
+
+    __slots__ = ("network", "row")
+
+    def __init__(self, network: networkStore, row: int):
+        self.network = network
+        self.row = row
+
+    def __str__(self):
+        return f"{self.IfcType} ({self.airFlow})"
+
+    @property
+    def element(self) -> ifcopenshell.entity_instance | None:
+        stepID = int(self.network.stepID[self.row])
+        return self.network.ifc_file.by_id(stepID) if stepID >= 0 else None
+
+    @property
+    def elementID(self) -> str | None:
+        return self.network.elementIDs[self.row]
+
+    @property
+    def prevElementID(self) -> str | None:
+        return self.network.prevElementIDs[self.row]
+
+    @property
+    def IfcType(self) -> str:
+        return self.network.typeNames[self.network.typeCode[self.row]]
+
+    @property
+    def elementPorts(self) -> list:
+        element = self.element
+        return ifcopenshell.util.system.get_ports(element) if element else []
+
+    @property
+    def airFlow(self) -> float:
+        return float(self.network.airFlow[self.row])  # in l/s
+
+    @airFlow.setter
+    def airFlow(self, value: float):
+        self.network.airFlow[self.row] = value
+
+    @property
+    def elementPressureLoss(self) -> float:
+        return float(self.network.elementPressureLoss[self.row])  # in Pa
+
+    @elementPressureLoss.setter
+    def elementPressureLoss(self, value: float):
+        self.network.elementPressureLoss[self.row] = value
+
+    @property
+    def pathPressureLoss(self) -> float:
+        return float(self.network.pathPressureLoss[self.row])  # in Pa
+
+    @pathPressureLoss.setter
+    def pathPressureLoss(self, value: float):
+        self.network.pathPressureLoss[self.row] = value
+
+    @property
+    def elementCrossArea(self) -> float:
+        return float(self.network.crossArea[self.row])
+
+    @property
+    def elementLength(self) -> float:
+        return float(self.network.length[self.row])
+
+    @property
+    def hydraulicDiameter(self) -> float:
+        return float(self.network.hydraulicDiameter[self.row])
+
+    @property
+    def elementDims(self) -> dict:
+        element = self.element
+        return getElementDims(element)[2] if element else {}
+
+    @property
+    def portOrientations(self):
+        orientation = self.network.portOrientations[self.row]
+        return [] if np.isnan(orientation).any() else orientation
+
+    @property
+    def fittingType(self) -> str | None:
+        return FITTING_TYPES[self.network.fittingType[self.row]]
+
+    def pressureLossDuct(self):
+        return self.network.pressureLossDuct(self.row)
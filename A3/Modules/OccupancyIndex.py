@@ -0,0 +1,112 @@
+"""
+Number of seats (chairs) in every space of an architectural IFC file, found in one pass.
+
+Version: 17/10/26
+
+Chairs are IfcFurniture with "Chair" in the name (or the CHAIR predefined type). A chair belongs to a space if:
+    - it is contained in the space (any IfcRelContainedInSpatialStructure of the space), or
+    - it is not contained in any space (i.e. only in the storey), and the center of its bounding box is inside
+      the bounding box of the space. The spaces are searched with a boundingBoxTree, smallest space first.
+The seat counts only depend on the file, so they are attached to the opened file (getOccupancyIndex()) and
+reused by every run on the same model (i.e. in a modelSession).
+"""
+
+import weakref
+
+import ifcopenshell
+import numpy as np
+
+from .GeometryEngine import getElementBBoxes
+from .SpatialIndex import boundingBoxTree
+from .Profiler import profiled
+
+
+def isChair(element: ifcopenshell.entity_instance) -> bool:
+    if not element.is_a("IfcFurniture"):
+        return False
+    return "Chair" in (element.Name or "") or (
+        getattr(element, "PredefinedType", None) == "CHAIR"
+    )
+
+
+@profiled()
+def buildOccupancyIndex(
+    space_file: ifcopenshell.file, geometricFallback: bool = True
+) -> dict:
+    """
+    Count the chairs in every space.
+
+    input:
+        space_file: ifcopenshell.file
+            Architectural IFC file with spaces and furniture.
+        geometricFallback: bool
+            Also place chairs that are not contained in a space by their bounding boxes.
+
+    Returns: A dictionary with:
+        "seats": {space step id: number of chairs} (spaces without chairs are left out),
+        "contained": number of chairs contained in a space,
+        "placed": number of chairs placed by their geometry,
+        "unplaced": number of chairs that are not in any space.
+    """
+    seats = {}
+    chairSpaces = {}  # chair step id -> space step id
+
+    for rel in space_file.by_type("IfcRelContainedInSpatialStructure"):
+        space = rel.RelatingStructure
+        if not space.is_a("IfcSpace"):
+            continue
+        for element in rel.RelatedElements:
+            if isChair(element) and element.id() not in chairSpaces:
+                chairSpaces[element.id()] = space.id()
+                seats[space.id()] = seats.get(space.id(), 0) + 1
+    contained = len(chairSpaces)
+
+    looseChairs = [
+        chair
+        for chair in space_file.by_type("IfcFurniture")
+        if chair.id() not in chairSpaces and isChair(chair)
+    ]
+
+    placed = 0
+    if geometricFallback and looseChairs:
+        spaces = space_file.by_type("IfcSpace")
+        bboxes = getElementBBoxes(space_file, spaces + looseChairs)
+
+        found, spaceMins, spaceMaxs = bboxes.take(spaces)
+        spaceIDs = np.array([space.id() for space in spaces], dtype=np.int64)[found]
+        # smallest space first, so a chair in a room inside a larger zone goes to the room
+        order = np.argsort(np.prod(spaceMaxs - spaceMins, axis=1), kind="stable")
+        spaceTree = boundingBoxTree(
+            keys=spaceIDs[order].tolist(),
+            mins=spaceMins[order],
+            maxs=spaceMaxs[order],
+        )
+
+        found, chairMins, chairMaxs = bboxes.take(looseChairs)
+        centers = (chairMins + chairMaxs) / 2
+        for spaceID in spaceTree.queryBatch(centers, centers):
+            if spaceID is not None:
+                seats[spaceID] = seats.get(spaceID, 0) + 1
+                placed += 1
+
+    return {
+        "seats": seats,
+        "contained": contained,
+        "placed": placed,
+        "unplaced": len(looseChairs) - placed,
+    }
+
+
+# occupancy indexes attached to opened ifc files (see getOccupancyIndex())
+_fileIndexes = weakref.WeakKeyDictionary()
+
+
+def getOccupancyIndex(
+    space_file: ifcopenshell.file, geometricFallback: bool = True
+) -> dict:
+    """The occupancy index (buildOccupancyIndex()) of an opened IFC file, built the first time."""
+    key = geometricFallback
+    indexes = _fileIndexes.setdefault(space_file, {})
+    if key not in indexes:
+        indexes[key] = buildOccupancyIndex(space_file, geometricFallback)
+    return indexes[key]
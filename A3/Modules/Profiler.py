@@ -0,0 +1,306 @@
+"""
+PROFILER
+
+Version: 17/10/26
+
+Timing of the analysis stages and hot functions, to find out what dominates the run time on a given model.
+
+Stages and functions are wrapped in spans:
+    - @profiled() on a function (i.e. ahuFinder, get_element_bbox, build_downstream_tree, pressureLossDuct),
+    - with span("name"): around a block of code.
+While profiling is started (startProfiling() / with profiling():), each span records its wall time, number of
+calls and (with memory=True, using tracemalloc) the peak memory allocated inside it. When profiling is not
+started, a span is one check of a global variable, so the instrumentation can stay in the code.
+
+The results can be printed as a Rich table (summaryTable()), and written as a Chrome trace (writeTrace(),
+open in chrome://tracing or https://ui.perfetto.dev) or as a JSON summary (writeSummary()).
+Only spans in this process are recorded (not in the worker processes of the parallel system builder).
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from rich.table import Table
+
+# number of trace events that are kept (the summary always counts all calls)
+MAX_TRACE_EVENTS = 200_000
+
+
+class profiler:
+    def __init__(self, memory: bool = False, maxEvents: int = MAX_TRACE_EVENTS):
+        """
+        input:
+            memory: bool
+                Record the peak memory of each span with tracemalloc (makes the run a lot slower).
+            maxEvents: int
+                Maximum number of spans kept for the trace.
+        """
+        self.memory = memory
+        self.maxEvents = maxEvents
+        self.stats = {}  # span name -> {"calls", "total", "max", "peakMemory"}
+        self.events = []  # (name, thread id, start, duration, args)
+        self.droppedEvents = 0
+        self.local = threading.local()  # stack of open spans per thread
+        self.depths = {}  # (thread id, span name) -> number of open spans (recursion)
+        self.start = time.perf_counter()
+        self.end = None
+        self.startedTracemalloc = False
+
+    def _stack(self) -> list:
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def enter(self, name: str) -> list:
+        """Open a span. Returns the frame that is passed to exit()."""
+        thread = threading.get_ident()
+        key = (thread, name)
+        self.depths[key] = self.depths.get(key, 0) + 1
+
+        memoryStart = 0
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            stack = self._stack()
+            if stack:
+                stack[-1][3] = max(stack[-1][3], peak)
+            tracemalloc.reset_peak()
+            memoryStart = current
+
+        # [name, thread, start time, peak memory, memory at start]
+        frame = [name, thread, time.perf_counter(), memoryStart, memoryStart]
+        self._stack().append(frame)
+        return frame
+
+    def exit(self, frame: list, args: dict | None = None):
+        """Close a span opened with enter()."""
+        end = time.perf_counter()
+        name, thread, start, peak, memoryStart = frame
+        stack = self._stack()
+        if stack and stack[-1] is frame:
+            stack.pop()
+        elif frame in stack:
+            stack.remove(frame)
+
+        peakMemory = 0
+        if self.memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            peakMemory = peak - memoryStart
+            if stack:
+                stack[-1][3] = max(stack[-1][3], peak)
+
+        key = (thread, name)
+        self.depths[key] -= 1
+        duration = end - start
+
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = {
+                "calls": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "peakMemory": 0,
+            }
+        stats["calls"] += 1
+        # recursive calls are only counted once in the total time
+        if self.depths[key] == 0:
+            stats["total"] += duration
+        stats["max"] = max(stats["max"], duration)
+        stats["peakMemory"] = max(stats["peakMemory"], peakMemory)
+
+        if len(self.events) < self.maxEvents:
+            self.events.append((name, thread, start, duration, args))
+        else:
+            self.droppedEvents += 1
+
+    def elapsed(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def summary(self) -> dict:
+        """{span name: {"calls", "total", "mean", "max", "peakMemory"}} (seconds and bytes), slowest first."""
+        return {
+            name: {
+                "calls": stats["calls"],
+                "total": stats["total"],
+                "mean": stats["total"] / stats["calls"],
+                "max": stats["max"],
+                "peakMemory": stats["peakMemory"],
+            }
+            for name, stats in sorted(
+                self.stats.items(), key=lambda item: item[1]["total"], reverse=True
+            )
+        }
+
+    def summaryTable(self, title: str = "Profile") -> Table:
+        """Rich table with the time, number of calls (and peak memory) of each span, slowest first."""
+        elapsed = self.elapsed()
+        table_Profile = Table(title=f"{title} ({round(elapsed, 2)} s)", show_lines=True)
+        table_Profile.add_column("Span", style="cyan")
+        table_Profile.add_column("Calls", style="blue")
+        table_Profile.add_column("Total (s)", style="magenta")
+        table_Profile.add_column("Mean (ms)", style="magenta")
+        table_Profile.add_column("Max (ms)", style="magenta")
+        table_Profile.add_column("% of run", style="green")
+        if self.memory:
+            table_Profile.add_column("Peak memory (MB)", style="yellow")
+
+        for name, stats in self.summary().items():
+            row = [
+                name,
+                str(stats["calls"]),
+                f"{stats['total']:.3f}",
+                f"{stats['mean'] * 1000:.2f}",
+                f"{stats['max'] * 1000:.2f}",
+                f"{100 * stats['total'] / elapsed:.1f}" if elapsed else "-",
+            ]
+            if self.memory:
+                row.append(f"{stats['peakMemory'] / 1e6:.1f}")
+            table_Profile.add_row(*row)
+        return table_Profile
+
+    def writeTrace(self, path: str) -> str:
+        """Write the spans as a Chrome trace (Trace Event Format). Returns the path."""
+        pid = os.getpid()
+        threads = {}
+        traceEvents = []
+        for name, thread, start, duration, args in self.events:
+            event = {
+                "name": name,
+                "cat": "A3",
+                "ph": "X",
+                "ts": round((start - self.start) * 1e6, 3),
+                "dur": round(duration * 1e6, 3),
+                "pid": pid,
+                "tid": threads.setdefault(thread, len(threads)),
+            }
+            if args:
+                event["args"] = args
+            traceEvents.append(event)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "traceEvents": traceEvents,
+                    "displayTimeUnit": "ms",
+                    "otherData": {
+                        "elapsed": self.elapsed(),
+                        "droppedEvents": self.droppedEvents,
+                    },
+                },
+                f,
+                default=str,
+            )
+        return path
+
+    def writeSummary(self, path: str) -> str:
+        """Write summary() (and the total run time) as JSON. Returns the path."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"elapsed": self.elapsed(), "spans": self.summary()}, f, indent=2)
+        return path
+
+
+# the running profiler (None when profiling is not started)
+_activeProfiler = None
+
+
+def startProfiling(memory: bool = False) -> profiler:
+    """Start recording spans. Returns the profiler (stop it with stopProfiling())."""
+    global _activeProfiler
+    _activeProfiler = profiler(memory=memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _activeProfiler.startedTracemalloc = True
+    return _activeProfiler
+
+
+def stopProfiling() -> profiler | None:
+    """Stop recording spans. Returns the profiler that was running."""
+    global _activeProfiler
+    prof, _activeProfiler = _activeProfiler, None
+    if prof is not None:
+        prof.end = time.perf_counter()
+        if prof.startedTracemalloc:
+            tracemalloc.stop()
+    return prof
+
+
+def getProfiler() -> profiler | None:
+    return _activeProfiler
+
+
+@contextlib.contextmanager
+def profiling(memory: bool = False):
+    """Record all spans inside the with block: with profiling() as prof: ..."""
+    prof = startProfiling(memory=memory)
+    try:
+        yield prof
+    finally:
+        stopProfiling()
+
+
+class _span:
+    __slots__ = ("prof", "name", "args", "frame")
+
+    def __init__(self, prof: profiler, name: str, args: dict):
+        self.prof, self.name, self.args = prof, name, args
+
+    def __enter__(self):
+        self.frame = self.prof.enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.prof.exit(self.frame, self.args)
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def span(name: str, **args):
+    """Time a block of code: with span("bcf"): ... (args are shown in the trace)."""
+    if _activeProfiler is None:
+        return _NULL_SPAN
+    return _span(_activeProfiler, name, args)
+
+
+def profiled(name: str | None = None):
+    """Decorator that times every call of a function as a span (named after the function by default)."""
+
+    def decorator(func):
+        spanName = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            prof = _activeProfiler
+            if prof is None:
+                return func(*args, **kwargs)
+            frame = prof.enter(spanName)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                prof.exit(frame)
+
+        return wrapper
+
+    return decorator
+
+
+def reportProfile(
+    console, prof: profiler, outputDir: str, name: str = "profile"
+) -> tuple[str, str]:
+    """
+    Print the summary table of a profiler and write <name>_trace.json (Chrome trace) and <name>.json (summary)
+    to outputDir. Returns both paths.
+    """
+    console.print(prof.summaryTable())
+    tracePath = prof.writeTrace(os.path.join(outputDir, f"{name}_trace.json"))
+    summaryPath = prof.writeSummary(os.path.join(outputDir, f"{name}.json"))
+    console.print(f"Profile written to '{tracePath}' and '{summaryPath}'")
+    return tracePath, summaryPath
@@ -0,0 +1,167 @@
+"""
+Index of all property and quantity values in an IFC file, so reading a property is a dictionary lookup
+instead of a walk through the relationships of the element (ifcopenshell.util.element.get_pset()).
+
+Version: 17/10/26
+
+The index is built in one pass over IfcRelDefinesByProperties (and the Psets of the element types), and
+gives the same values as get_pset(element, name, prop):
+    - the first property/quantity set with the name is used,
+    - properties missing on the element are read from its type.
+The index is attached to the opened file (getPropertyIndex()), and writePsets() updates the index of the
+file it writes to (write-through), so values written during the analysis can be read back from the index.
+Psets edited in other ways (i.e. ifcopenshell.api.pset) are not tracked - call dropPropertyIndex() after that.
+"""
+
+import weakref
+
+import ifcopenshell
+import ifcopenshell.util.element
+
+from .GeometryEngine import elementID
+
+
+class propertyIndex:
+    def __init__(self, ifc_file: ifcopenshell.file):
+        """
+        input:
+            ifc_file: ifcopenshell.file
+                File to index. All property/quantity sets of all elements and types are read once.
+        """
+        self.ifc_file = ifc_file
+        self.definitions = (
+            {}
+        )  # (element id, pset name) -> definition id (first definition with the name)
+        self.definitionTypes = {}  # definition id -> "pset"/"qto"/"other"
+        self.values = {}  # definition id -> {prop name: value}
+        self.elementTypes = {}  # element id -> type id
+
+        for rel in ifc_file.by_type("IfcRelDefinesByProperties"):
+            definition = rel.RelatingPropertyDefinition
+            # IfcPropertySetDefinitionSet (a list of Psets) is not read by get_pset() either
+            if not isinstance(definition, ifcopenshell.entity_instance):
+                continue
+            for element in rel.RelatedObjects:
+                self._addDefinition(element.id(), definition)
+
+        for rel in ifc_file.by_type("IfcRelDefinesByType"):
+            for element in rel.RelatedObjects:
+                self.elementTypes.setdefault(element.id(), rel.RelatingType.id())
+
+        for elementType in ifc_file.by_type("IfcTypeObject"):
+            for definition in elementType.HasPropertySets or []:
+                self._addDefinition(elementType.id(), definition)
+
+    def _readDefinition(self, definition: ifcopenshell.entity_instance):
+        definitionID = definition.id()
+        if definition.is_a("IfcPropertySet"):
+            self.definitionTypes[definitionID] = "pset"
+        elif definition.is_a("IfcElementQuantity"):
+            self.definitionTypes[definitionID] = "qto"
+        else:
+            self.definitionTypes[definitionID] = "other"
+
+        values = ifcopenshell.util.element.get_property_definition(definition) or {}
+        values.pop("id", None)
+        self.values[definitionID] = values
+
+    def _addDefinition(self, ownerID: int, definition: ifcopenshell.entity_instance):
+        key = (ownerID, definition.Name)
+        if key in self.definitions:
+            return
+        self.definitions[key] = definition.id()
+        if definition.id() not in self.definitionTypes:
+            self._readDefinition(definition)
+
+    def update(
+        self,
+        element: ifcopenshell.entity_instance,
+        definition: ifcopenshell.entity_instance,
+    ):
+        """Read a property set again after it was written to the element (used by writePsets())."""
+        key = (element.id(), definition.Name)
+        if self.definitions.get(key) not in (None, definition.id()):
+            return  # get_pset() still finds the first set with the name
+        self.definitions[key] = definition.id()
+        self._readDefinition(definition)
+
+    def _definition(self, elementID: int, name: str, psets_only: bool, qtos_only: bool):
+        definitionID = self.definitions.get((elementID, name))
+        if definitionID is None:
+            return None
+        if psets_only and self.definitionTypes[definitionID] != "pset":
+            return None
+        if qtos_only and self.definitionTypes[definitionID] != "qto":
+            return None
+        return definitionID
+
+    def get(
+        self,
+        element: ifcopenshell.entity_instance | int,
+        name: str,
+        prop: str,
+        psets_only: bool = False,
+        qtos_only: bool = False,
+    ):
+        """
+        Value of a property or quantity, same as ifcopenshell.util.element.get_pset(element, name, prop).
+
+        input:
+            element: ifcopenshell.entity_instance | int
+                Element (or its step id).
+            name: str
+                Name of the property/quantity set.
+            prop: str
+                Name of the property/quantity.
+            psets_only, qtos_only: bool
+                Only read property sets / quantity sets.
+
+        Returns: The value, or None if the element does not have the property.
+        """
+        element = elementID(element)
+
+        typeValue = None
+        typeID = self.elementTypes.get(element)
+        if typeID is not None:
+            typeDefinition = self._definition(typeID, name, False, False)
+            if typeDefinition is not None:
+                typeValue = self.values[typeDefinition].get(prop)
+
+        definitionID = self._definition(element, name, psets_only, qtos_only)
+        value = (
+            self.values[definitionID].get(prop) if definitionID is not None else None
+        )
+        if value is None and typeValue is not None:
+            return typeValue
+        return value
+
+    def __len__(self):
+        return sum(len(values) for values in self.values.values())
+
+
+# property indexes attached to opened ifc files (see getPropertyIndex())
+_fileIndexes = weakref.WeakKeyDictionary()
+
+
+def getPropertyIndex(
+    ifc_file: ifcopenshell.file, build: bool = True
+) -> propertyIndex | None:
+    """
+    The property index of an opened IFC file (built the first time).
+
+    input:
+        ifc_file: ifcopenshell.file
+            Opened IFC file.
+        build: bool
+            Build the index if the file does not have one yet (False: return None instead).
+    """
+    index = _fileIndexes.get(ifc_file)
+    if index is None and build:
+        index = propertyIndex(ifc_file)
+        _fileIndexes[ifc_file] = index
+    return index
+
+
+def dropPropertyIndex(ifc_file: ifcopenshell.file):
+    """Forget the property index of a file (i.e. after its Psets were changed without writePsets())."""
+    _fileIndexes.pop(ifc_file, None)
@@ -0,0 +1,266 @@
+"""
+Bulk writer for property sets, used instead of ifcopenshell.api.pset.add_pset() + edit_pset() per element.
+
+Version: 17/10/26
+
+writePsets() takes the values of many elements at once ({element: {pset name: {property: value}}}):
+    - An existing property set with the same name on the element is updated (no duplicate Psets).
+    - New property sets are created with all their properties at once, and their IfcRelDefinesByProperties
+      relationships are created together at the end.
+    - The property index of the file (PropertyIndex.py) is updated with the written values.
+    - New IfcPropertySingleValue entities with the same name, type and value are shared between the property
+      sets (an IfcProperty may be part of several property sets). Properties that are shared are never edited
+      in place, so changing the value of one element never changes another element.
+The property types follow edit_pset(): the type of the existing value, the type from the buildingSMART
+Pset template, or the Python type of the value (str -> IfcLabel, float -> IfcReal, bool -> IfcBoolean,
+int -> IfcInteger).
+"""
+
+import ifcopenshell
+import ifcopenshell.api.owner
+import ifcopenshell.guid
+import ifcopenshell.util.pset
+
+from .PropertyIndex import getPropertyIndex
+from .Profiler import profiled
+
+# Python types of the values -> IFC types, when there is no Pset template (same as edit_pset())
+PYTHON_MEASURE_TYPES = [
+    (str, "IfcLabel"),
+    (float, "IfcReal"),
+    (bool, "IfcBoolean"),
+    (int, "IfcInteger"),
+]
+
+# cast functions of the attribute types of the IFC value types (same as edit_pset())
+ATTRIBUTE_CASTS = {
+    "LOGICAL": str,
+    "BOOL": bool,
+    "INT": int,
+    "DOUBLE": float,
+    "STRING": str,
+    "BINARY": bytes,
+}
+
+
+class psetWriter:
+    def __init__(self, ifc_file: ifcopenshell.file, shareProperties: bool = True):
+        """
+        input:
+            ifc_file: ifcopenshell.file
+                File the property sets are written to.
+            shareProperties: bool
+                Share new IfcPropertySingleValue entities with the same name and value between property sets.
+        """
+        self.ifc_file = ifc_file
+        self.shareProperties = shareProperties
+        self.templates = ifcopenshell.util.pset.get_template(ifc_file.schema_identifier)
+        self.templateTypes = {}  # pset name -> {property name: PrimaryMeasureType}
+        self.casts = {}  # measure type -> cast function
+        self.sharedProperties = (
+            {}
+        )  # (name, measure type, value) -> IfcPropertySingleValue
+        self.ownerHistory = None
+        self.ownerHistoryCreated = False
+
+    def _templateTypes(self, psetName: str) -> dict:
+        if psetName not in self.templateTypes:
+            template = self.templates.get_by_name(psetName)
+            self.templateTypes[psetName] = (
+                {
+                    prop.Name: prop.PrimaryMeasureType or "IfcLabel"
+                    for prop in template.HasPropertyTemplates
+                    if prop.is_a("IfcSimplePropertyTemplate")
+                }
+                if template
+                else {}
+            )
+        return self.templateTypes[psetName]
+
+    def _measureType(
+        self, psetName: str, name: str, value, oldValue=None
+    ) -> str | None:
+        if oldValue is not None:
+            return oldValue.is_a()
+        templateTypes = self._templateTypes(psetName)
+        if name in templateTypes:
+            return templateTypes[name]
+        for pythonType, measureType in PYTHON_MEASURE_TYPES:
+            if isinstance(value, pythonType):
+                return measureType
+        return None
+
+    def _typedValue(self, psetName: str, name: str, value, oldValue=None) -> tuple:
+        """(IFC type, cast value) of a property value ((None, None) for None, IFC values are used as they are)."""
+        if value is None:
+            return None, None
+        if isinstance(value, ifcopenshell.entity_instance):
+            return value.is_a(), value.wrappedValue
+        measureType = self._measureType(psetName, name, value, oldValue)
+        if measureType not in self.casts:
+            attributeType = self.ifc_file.create_entity(measureType).attribute_type(0)
+            self.casts[measureType] = ATTRIBUTE_CASTS[attributeType]
+        return measureType, self.casts[measureType](value)
+
+    def _nominalValue(self, measureType: str | None, value):
+        if measureType is None:
+            return None
+        return self.ifc_file.create_entity(measureType, value)
+
+    def _newProperty(self, psetName: str, name: str, value):
+        if isinstance(value, ifcopenshell.entity_instance) and value.is_a(
+            "IfcProperty"
+        ):
+            return value
+
+        measureType, value = self._typedValue(psetName, name, value)
+        key = (name, measureType, value)
+        if self.shareProperties and key in self.sharedProperties:
+            return self.sharedProperties[key]
+
+        prop = self.ifc_file.create_entity(
+            "IfcPropertySingleValue",
+            Name=name,
+            NominalValue=self._nominalValue(measureType, value),
+        )
+        if self.shareProperties:
+            self.sharedProperties[key] = prop
+        return prop
+
+    def _ownerHistory(self):
+        if not self.ownerHistoryCreated:
+            self.ownerHistory = ifcopenshell.api.owner.create_owner_history(
+                self.ifc_file
+            )
+            self.ownerHistoryCreated = True
+        return self.ownerHistory
+
+    def _updateProperties(self, pset, psetName: str, values: dict):
+        """Update the properties of an existing property set."""
+        properties = []
+        replaced = []  # properties of other kinds, removed after the update
+        values = dict(values)
+        for prop in pset.HasProperties or []:
+            if prop.Name not in values:
+                properties.append(prop)
+                continue
+            # properties shared with other property sets are replaced instead of edited
+            if self.ifc_file.get_total_inverses(prop) > 1:
+                continue
+            # other kinds of properties (i.e. IfcPropertyEnumeratedValue) are replaced by a single value
+            if not prop.is_a("IfcPropertySingleValue"):
+                replaced.append(prop)
+                continue
+            value = values.pop(prop.Name)
+            if isinstance(value, ifcopenshell.entity_instance) and value.is_a(
+                "IfcProperty"
+            ):
+                properties.append(value)
+                continue
+            prop.NominalValue = self._nominalValue(
+                *self._typedValue(psetName, prop.Name, value, prop.NominalValue)
+            )
+            properties.append(prop)
+
+        properties += [
+            self._newProperty(psetName, name, value) for name, value in values.items()
+        ]
+        pset.HasProperties = properties
+        for prop in replaced:
+            if self.ifc_file.get_total_inverses(prop) == 0:
+                self.ifc_file.remove(prop)
+
+    @profiled()
+    def write(self, elementPsets: dict) -> dict:
+        """
+        Write the property sets of many elements.
+
+        input:
+            elementPsets: dict
+                {element: {pset name: {property name: value}}}, where element is an IfcObject or IfcTypeObject.
+                Values can be Python values, IFC values (i.e. file.createIfcLabel("x")), IfcProperty entities or None.
+
+        Returns: A dictionary {element: {pset name: IfcPropertySet}} with the written property sets.
+        """
+        written = {}
+        newPsets = []  # (element, pset) pairs that need a relationship
+
+        for element, psets in elementPsets.items():
+            if element.is_a("IfcTypeObject"):
+                existingPsets = {
+                    definition.Name: definition
+                    for definition in reversed(element.HasPropertySets or [])
+                    if definition.is_a("IfcPropertySet")
+                }
+            elif element.is_a("IfcObject") or element.is_a("IfcContext"):
+                existingPsets = {
+                    rel.RelatingPropertyDefinition.Name: rel.RelatingPropertyDefinition
+                    for rel in reversed(element.IsDefinedBy or [])
+                    if rel.is_a("IfcRelDefinesByProperties")
+                    and rel.RelatingPropertyDefinition.is_a("IfcPropertySet")
+                }
+            else:
+                raise TypeError(
+                    f"Class '{element.is_a()}' doesn't support adding a property set."
+                )
+
+            written[element] = {}
+            for psetName, values in psets.items():
+                pset = existingPsets.get(psetName)
+                if pset is not None:
+                    self._updateProperties(pset, psetName, values)
+                else:
+                    pset = self.ifc_file.create_entity(
+                        "IfcPropertySet",
+                        GlobalId=ifcopenshell.guid.new(),
+                        OwnerHistory=self._ownerHistory(),
+                        Name=psetName,
+                        HasProperties=[
+                            self._newProperty(psetName, name, value)
+                            for name, value in values.items()
+                        ],
+                    )
+                    existingPsets[psetName] = pset
+                    newPsets.append((element, pset))
+                written[element][psetName] = pset
+
+        # relationships of all new property sets
+        for element, pset in newPsets:
+            if element.is_a("IfcTypeObject"):
+                element.HasPropertySets = list(element.HasPropertySets or []) + [pset]
+            else:
+                self.ifc_file.create_entity(
+                    "IfcRelDefinesByProperties",
+                    GlobalId=ifcopenshell.guid.new(),
+                    OwnerHistory=self._ownerHistory(),
+                    RelatedObjects=[element],
+                    RelatingPropertyDefinition=pset,
+                )
+
+        # write-through to the property index of the file (if it has one)
+        index = getPropertyIndex(self.ifc_file, build=False)
+        if index is not None:
+            for element, psets in written.items():
+                for pset in psets.values():
+                    index.update(element, pset)
+
+        return written
+
+
+def writePsets(
+    ifc_file: ifcopenshell.file, elementPsets: dict, shareProperties: bool = True
+) -> dict:
+    """
+    Write the property sets of many elements at once, see psetWriter.write().
+
+    input:
+        ifc_file: ifcopenshell.file
+            File the property sets are written to.
+        elementPsets: dict
+            {element: {pset name: {property name: value}}}
+        shareProperties: bool
+            Share new IfcPropertySingleValue entities with the same name and value between property sets.
+
+    Returns: A dictionary {element: {pset name: IfcPropertySet}} with the written property sets.
+    """
+    return psetWriter(ifc_file, shareProperties).write(elementPsets)
@@ -0,0 +1,521 @@
+"""
+SNAPSHOT RENDERER
+
+Version: 17/10/26
+
+Small PNG snapshots of BCF viewpoints, rendered on the CPU with NumPy (no GPU, display or OpenGL needed).
+
+All elements of the model are tessellated once (one pass of ifcopenshell.geom.iterator) into a sceneGeometry:
+world-space triangles with a color (IFC material/style) and a face normal, grouped per element. The scene is
+attached to the opened file (getSceneGeometry()), so all snapshots of a run share the same triangles.
+
+Each viewpoint is rendered by:
+    - culling: the elements whose bounding box overlaps the bounding box of the view frustum are found for all
+      viewpoints at once with a boundingBoxTree of the element bounding boxes,
+    - projecting the triangles of these elements with the BCF camera (perspective, field of view 60°),
+    - rasterizing them with a z-buffer (all pixels of many triangles in one NumPy step),
+    - flat shading (head light), the selected elements of the topic are highlighted.
+The viewpoints are rendered in a pool of worker processes (renderSnapshots()), each worker gets the scene once.
+"""
+
+import multiprocessing
+import struct
+import weakref
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import ifcopenshell
+import ifcopenshell.geom
+import numpy as np
+
+from .GeometryEngine import geometrySettings
+from .SpatialIndex import boundingBoxTree
+from .Profiler import profiled
+
+SNAPSHOT_SIZE = 256  # width/height of the snapshots (px)
+SNAPSHOT_FIELD_OF_VIEW = 60.0  # same as bcf.v3.visinfo.build_camera_from_vectors()
+SNAPSHOT_BACKGROUND = (245, 245, 245)
+SNAPSHOT_HIGHLIGHT = (230, 60, 30)  # color of the selected elements
+SNAPSHOT_NEAR = 0.05  # triangles closer to the camera than this (m) are not drawn
+SNAPSHOT_FAR_FACTOR = (
+    3.0  # elements further away than this times the target distance are culled
+)
+
+# elements that are not drawn (they would hide the elements of the topic)
+HIDDEN_CLASSES = (
+    "IfcSpatialElement",
+    "IfcOpeningElement",
+    "IfcVirtualElement",
+    "IfcAnnotation",
+)
+
+# maximum number of candidate pixels rasterized in one NumPy step (bounds the memory use)
+_RASTER_CHUNK = 1 << 20
+
+
+class sceneGeometry:
+    def __init__(self, ids, offsets, triangles, normals, colors, mins, maxs):
+        """
+        input:
+            ids: list[int]
+                Step ids of the elements.
+            offsets: np.ndarray
+                (n + 1,) array, the triangles of element i are triangles[offsets[i]:offsets[i + 1]].
+            triangles: np.ndarray
+                (t, 3, 3) array with the world coordinates of the triangle corners.
+            normals: np.ndarray
+                (t, 3) array with the unit normal of each triangle.
+            colors: np.ndarray
+                (t, 3) uint8 array with the color of each triangle.
+            mins, maxs: np.ndarray
+                (n, 3) arrays with the min/max XYZ coordinates of each element.
+        """
+        self.ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        self.offsets = np.asarray(offsets, dtype=np.int64).reshape(-1)
+        self.triangles = np.asarray(triangles, dtype=np.float32).reshape(-1, 3, 3)
+        self.normals = np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+        self.colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        self.mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+        self.maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+        self.rows = {elID: row for row, elID in enumerate(self.ids.tolist())}
+        self.tree = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def arrays(self) -> tuple:
+        """The arrays of the scene (sent to the worker processes)."""
+        return (
+            self.ids,
+            self.offsets,
+            self.triangles,
+            self.normals,
+            self.colors,
+            self.mins,
+            self.maxs,
+        )
+
+    def elementTree(self) -> boundingBoxTree:
+        """boundingBoxTree of the element bounding boxes (keys are the element rows), built the first time."""
+        if self.tree is None:
+            self.tree = boundingBoxTree(
+                keys=list(range(len(self.ids))), mins=self.mins, maxs=self.maxs
+            )
+        return self.tree
+
+    def triangleRows(self, rows: np.ndarray) -> np.ndarray:
+        """Indices of the triangles of the elements in rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, ends = self.offsets[rows], self.offsets[rows + 1]
+        counts = ends - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+        firsts = np.repeat(starts - np.r_[0, np.cumsum(counts)[:-1]], counts)
+        return firsts + np.arange(total)
+
+
+@profiled()
+def buildSceneGeometry(
+    ifc_file: ifcopenshell.file, threads: int | None = None
+) -> sceneGeometry:
+    """
+    Tessellate all visible elements of a file in one pass.
+
+    input:
+        ifc_file: ifcopenshell.file
+            File to tessellate.
+        threads: int | None
+            Number of threads used by the geometry iterator (defaults to the number of CPUs).
+
+    Returns: sceneGeometry with the triangles of all elements that have geometry.
+    """
+    products = [
+        product
+        for product in ifc_file.by_type("IfcProduct")
+        if product.Representation is not None
+        and not any(product.is_a(ifcClass) for ifcClass in HIDDEN_CLASSES)
+    ]
+
+    ids, offsets, mins, maxs = [], [0], [], []
+    triangles, normals, colors = [], [], []
+    if products:
+        iterator = ifcopenshell.geom.iterator(
+            geometrySettings(),
+            ifc_file,
+            threads or multiprocessing.cpu_count(),
+            include=products,
+        )
+        if iterator.initialize():
+            while True:
+                shape = iterator.get()
+                geometry = shape.geometry
+                verts = np.frombuffer(geometry.verts_buffer, dtype=np.float64)
+                faces = np.frombuffer(geometry.faces_buffer, dtype=np.int32)
+                if len(verts) and len(faces):
+                    verts = verts.reshape(-1, 3)
+                    corners = verts[faces.reshape(-1, 3)]
+                    normal = np.cross(
+                        corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]
+                    )
+                    length = np.linalg.norm(normal, axis=1)
+                    keep = length > 0
+                    corners, normal = corners[keep], normal[keep] / length[keep, None]
+
+                    palette = np.array(
+                        [material.diffuse.components for material in geometry.materials]
+                        or [(0.7, 0.7, 0.7)]
+                    )
+                    materialIDs = np.frombuffer(
+                        geometry.material_ids_buffer, dtype=np.int32
+                    )[keep]
+                    materialIDs = np.where(
+                        (materialIDs >= 0) & (materialIDs < len(palette)),
+                        materialIDs,
+                        0,
+                    )
+
+                    ids.append(shape.id)
+                    offsets.append(offsets[-1] + len(corners))
+                    mins.append(verts.min(axis=0))
+                    maxs.append(verts.max(axis=0))
+                    triangles.append(corners)
+                    normals.append(normal)
+                    colors.append(
+                        np.clip(palette[materialIDs] * 255, 0, 255).astype(np.uint8)
+                    )
+                if not iterator.next():
+                    break
+
+    return sceneGeometry(
+        ids,
+        offsets,
+        np.concatenate(triangles) if triangles else np.zeros((0, 3, 3)),
+        np.concatenate(normals) if normals else np.zeros((0, 3)),
+        np.concatenate(colors) if colors else np.zeros((0, 3)),
+        mins,
+        maxs,
+    )
+
+
+# scenes attached to opened ifc files (see getSceneGeometry())
+_fileScenes = weakref.WeakKeyDictionary()
+
+
+def getSceneGeometry(ifc_file: ifcopenshell.file) -> sceneGeometry:
+    """The scene (buildSceneGeometry()) of an opened IFC file, tessellated the first time."""
+    scene = _fileScenes.get(ifc_file)
+    if scene is None:
+        scene = buildSceneGeometry(ifc_file)
+        _fileScenes[ifc_file] = scene
+    return scene
+
+
+#######################################
+#        Rasterizer
+#######################################
+
+
+def cameraBasis(direction, up) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Unit (forward, right, up) vectors of a camera."""
+    forward = np.asarray(direction, dtype=float)
+    forward = forward / np.linalg.norm(forward)
+    right = np.cross(forward, np.asarray(up, dtype=float))
+    if np.linalg.norm(right) < 1e-9:
+        # looking straight up/down
+        right = np.cross(forward, [0.0, 1.0, 0.0])
+    right = right / np.linalg.norm(right)
+    return forward, right, np.cross(right, forward)
+
+
+def viewBounds(
+    positions: np.ndarray,
+    directions: np.ndarray,
+    ups: np.ndarray,
+    fieldOfView: float = SNAPSHOT_FIELD_OF_VIEW,
+    farFactor: float = SNAPSHOT_FAR_FACTOR,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Bounding boxes of the view frustums of many cameras (used to cull the elements of each viewpoint).
+    The frustums end at farFactor times the length of the camera direction (the distance to the target).
+
+    Returns: (n, 3) arrays with the min/max XYZ coordinates.
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+    directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+    ups = np.asarray(ups, dtype=float).reshape(-1, 3)
+    mins, maxs = np.empty_like(positions), np.empty_like(positions)
+    halfWidth = np.tan(np.radians(fieldOfView) / 2)
+    for i in range(len(positions)):
+        forward, right, up = cameraBasis(directions[i], ups[i])
+        far = farFactor * max(np.linalg.norm(directions[i]), SNAPSHOT_NEAR)
+        corners = [positions[i]] + [
+            positions[i]
+            + far * (forward + sx * halfWidth * right + sy * halfWidth * up)
+            for sx in (-1, 1)
+            for sy in (-1, 1)
+        ]
+        mins[i], maxs[i] = np.min(corners, axis=0), np.max(corners, axis=0)
+    return mins, maxs
+
+
+def _rasterize(screen, depths, colors, size, depthBuffer, colorBuffer):
+    """
+    Draw triangles into the buffers (nearest triangle wins).
+
+    input:
+        screen: (t, 3, 2) pixel coordinates of the corners.
+        depths: (t, 3) distance of the corners in front of the camera.
+        colors: (t, 3) uint8 colors.
+        depthBuffer, colorBuffer: (size * size,) and (size * size, 3) arrays, updated in place.
+    """
+    x0 = np.clip(np.ceil(screen[:, :, 0].min(axis=1) - 0.5), 0, size)
+    x1 = np.clip(np.floor(screen[:, :, 0].max(axis=1) - 0.5), -1, size - 1)
+    y0 = np.clip(np.ceil(screen[:, :, 1].min(axis=1) - 0.5), 0, size)
+    y1 = np.clip(np.floor(screen[:, :, 1].max(axis=1) - 0.5), -1, size - 1)
+    widths = (x1 - x0 + 1).astype(np.int64)
+    heights = (y1 - y0 + 1).astype(np.int64)
+
+    # twice the signed area of each triangle (triangles are drawn from both sides)
+    a, b, c = screen[:, 0], screen[:, 1], screen[:, 2]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (
+        c[:, 0] - a[:, 0]
+    )
+    visible = (widths > 0) & (heights > 0) & (np.abs(area) > 1e-12)
+    keep = np.flatnonzero(visible)
+    if len(keep) == 0:
+        return
+    counts = widths[keep] * heights[keep]
+    chunkEnds = np.cumsum(counts)
+
+    start = 0
+    while start < len(keep):
+        # triangles of this chunk: at most _RASTER_CHUNK candidate pixels (at least one triangle)
+        base = chunkEnds[start - 1] if start else 0
+        end = max(
+            start + 1,
+            int(np.searchsorted(chunkEnds, base + _RASTER_CHUNK, side="right")),
+        )
+        chunk = keep[start:end]
+        chunkCounts = counts[start:end]
+        start = end
+
+        tri = np.repeat(np.arange(len(chunk)), chunkCounts)
+        local = np.arange(len(tri)) - np.repeat(
+            np.cumsum(chunkCounts) - chunkCounts, chunkCounts
+        )
+        t = chunk[tri]
+        px = x0[t].astype(np.int64) + local % widths[t]
+        py = y0[t].astype(np.int64) + local // widths[t]
+        cx, cy = px + 0.5, py + 0.5
+
+        # barycentric coordinates of the pixel centers
+        ta, tb, tc = a[t], b[t], c[t]
+        w0 = (tb[:, 0] - cx) * (tc[:, 1] - cy) - (tb[:, 1] - cy) * (tc[:, 0] - cx)
+        w1 = (tc[:, 0] - cx) * (ta[:, 1] - cy) - (tc[:, 1] - cy) * (ta[:, 0] - cx)
+        w0, w1 = w0 / area[t], w1 / area[t]
+        w2 = 1 - w0 - w1
+        inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+        t, px, py = t[inside], px[inside], py[inside]
+        w0, w1, w2 = w0[inside], w1[inside], w2[inside]
+
+        # perspective correct depth
+        depth = 1 / (w0 / depths[t, 0] + w1 / depths[t, 1] + w2 / depths[t, 2])
+        pixel = py * size + px
+
+        # nearest fragment of each pixel in this chunk, then against the depth buffer
+        order = np.lexsort((depth, pixel))
+        pixel, depth, t = pixel[order], depth[order], t[order]
+        first = np.r_[True, pixel[1:] != pixel[:-1]]
+        pixel, depth, t = pixel[first], depth[first], t[first]
+        closer = depth < depthBuffer[pixel]
+        depthBuffer[pixel[closer]] = depth[closer]
+        colorBuffer[pixel[closer]] = colors[t[closer]]
+
+
+@profiled()
+def renderSnapshot(
+    scene: sceneGeometry,
+    position,
+    direction,
+    up,
+    rows: np.ndarray,
+    selectedRows=(),
+    size: int = SNAPSHOT_SIZE,
+    fieldOfView: float = SNAPSHOT_FIELD_OF_VIEW,
+) -> np.ndarray:
+    """
+    Render the elements in rows of the scene from a camera.
+
+    input:
+        scene: sceneGeometry
+        position, direction, up:
+            The BCF camera (view point, direction and up vector).
+        rows: np.ndarray
+            Rows of the elements to draw (i.e. the culled elements of the viewpoint).
+        selectedRows:
+            Rows of the elements that are highlighted.
+        size: int
+            Width and height of the image (px).
+        fieldOfView: float
+            Field of view of the camera (degrees).
+
+    Returns: (size, size, 3) uint8 RGB image.
+    """
+    forward, right, cameraUp = cameraBasis(direction, up)
+    triangleIDs = scene.triangleRows(rows)
+
+    depthBuffer = np.full(size * size, np.inf)
+    colorBuffer = np.tile(
+        np.array(SNAPSHOT_BACKGROUND, dtype=np.uint8), (size * size, 1)
+    )
+
+    if len(triangleIDs):
+        corners = scene.triangles[triangleIDs].astype(float) - np.asarray(
+            position, dtype=float
+        )
+        depths = corners @ forward
+        front = np.all(depths > SNAPSHOT_NEAR, axis=1)
+        triangleIDs, corners, depths = (
+            triangleIDs[front],
+            corners[front],
+            depths[front],
+        )
+
+        scale = size / 2 / np.tan(np.radians(fieldOfView) / 2)
+        screen = np.empty(corners.shape[:2] + (2,))
+        screen[:, :, 0] = size / 2 + scale * (corners @ right) / depths
+        screen[:, :, 1] = size / 2 - scale * (corners @ cameraUp) / depths
+
+        # flat shading with a light at the camera
+        colors = scene.colors[triangleIDs].astype(float)
+        if len(selectedRows):
+            selected = np.zeros(len(scene.ids), dtype=bool)
+            selected[np.asarray(selectedRows, dtype=np.int64)] = True
+            triangleElements = (
+                np.searchsorted(scene.offsets, triangleIDs, side="right") - 1
+            )
+            colors[selected[triangleElements]] = SNAPSHOT_HIGHLIGHT
+        light = 0.35 + 0.65 * np.abs(scene.normals[triangleIDs] @ forward)
+        colors = np.clip(colors * light[:, None], 0, 255).astype(np.uint8)
+
+        _rasterize(screen, depths, colors, size, depthBuffer, colorBuffer)
+
+    return colorBuffer.reshape(size, size, 3)
+
+
+def encodePng(image: np.ndarray) -> bytes:
+    """PNG file (8 bit RGB) of a (height, width, 3) uint8 image."""
+    height, width = image.shape[:2]
+    rows = np.zeros((height, 1 + width * 3), dtype=np.uint8)  # filter type 0 per row
+    rows[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+#######################################
+#        Parallel rendering
+#######################################
+
+
+def _setWorkerScene(arrays: tuple):
+    global _workerScene
+    _workerScene = sceneGeometry(*arrays)
+
+
+def renderSnapshotBatch(views: list[tuple], size: int) -> list[bytes]:
+    """Worker: render viewpoints of the scene set by _setWorkerScene(). views: [(camera, rows, selectedRows), ...]"""
+    return [
+        encodePng(renderSnapshot(_workerScene, *camera, rows, selectedRows, size))
+        for camera, rows, selectedRows in views
+    ]
+
+
+def renderSnapshots(
+    ifc_file: ifcopenshell.file,
+    cameras: tuple[np.ndarray, np.ndarray, np.ndarray],
+    selections: list[list],
+    size: int = SNAPSHOT_SIZE,
+    workers: int | None = None,
+    batchSize: int = 16,
+):
+    """
+    Render the PNG snapshots of many viewpoints.
+
+    input:
+        ifc_file: ifcopenshell.file
+            File with the elements (tessellated once, see getSceneGeometry()).
+        cameras: tuple[np.ndarray, np.ndarray, np.ndarray]
+            (n, 3) arrays with the view points, directions and up vectors of the cameras (i.e. from cameraVectors()).
+        selections: list[list]
+            Highlighted elements (or step ids) of each viewpoint.
+        size: int
+            Width and height of the snapshots (px).
+        workers: int | None
+            Number of worker processes (defaults to the number of CPUs, 1 renders in this process).
+        batchSize: int
+            Number of viewpoints rendered by a worker at a time.
+
+    Yields: The PNG file of each viewpoint (in the order of the cameras), as soon as it is rendered.
+    """
+    positions, directions, ups = (
+        np.asarray(vectors, dtype=float).reshape(-1, 3) for vectors in cameras
+    )
+    if len(positions) == 0:
+        return
+    scene = getSceneGeometry(ifc_file)
+
+    # cull the elements of all viewpoints at once
+    viewMins, viewMaxs = viewBounds(positions, directions, ups)
+    queryIndices, elementRows = scene.elementTree().overlapPairs(viewMins, viewMaxs)
+    order = np.argsort(queryIndices, kind="stable")
+    queryIndices, elementRows = queryIndices[order], elementRows[order]
+    splits = np.searchsorted(queryIndices, np.arange(1, len(positions)))
+    viewRows = np.split(elementRows, splits)
+
+    views = []
+    for i, selection in enumerate(selections):
+        selectedRows = [
+            scene.rows[elID]
+            for elID in (
+                (
+                    element.id()
+                    if isinstance(element, ifcopenshell.entity_instance)
+                    else element
+                )
+                for element in selection
+            )
+            if elID in scene.rows
+        ]
+        camera = (positions[i], directions[i], ups[i])
+        views.append((camera, viewRows[i], np.asarray(selectedRows, dtype=np.int64)))
+    batches = [views[i : i + batchSize] for i in range(0, len(views), batchSize)]
+
+    workers = workers or multiprocessing.cpu_count()
+    if workers <= 1 or len(batches) <= 1:
+        for camera, rows, selectedRows in views:
+            yield encodePng(renderSnapshot(scene, *camera, rows, selectedRows, size))
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(batches)),
+        initializer=_setWorkerScene,
+        initargs=(scene.arrays(),),
+    ) as executor:
+        for snapshots in executor.map(
+            renderSnapshotBatch, batches, [size] * len(batches)
+        ):
+            yield from snapshots
@@ -0,0 +1,166 @@
+"""
+Bounding box tree (packed R-tree) used to find which spaces an element overlaps with.
+
+Version: 17/10/26
+
+The tree is bulk loaded once from all bounding boxes (Sort-Tile-Recursive packing), so a query only
+visits the branches whose bounding boxes overlap the query box instead of testing every space.
+
+Overlap is tested the same way as bbox_overlap() in VentilationSystemAnalyzer.py (touching boxes overlap).
+"""
+
+import numpy as np
+
+
+class boundingBoxTree:
+    def __init__(
+        self,
+        keys: list,
+        mins: np.ndarray,
+        maxs: np.ndarray,
+        nodeCapacity: int = 8,
+    ):
+        """
+        input:
+            keys: list
+                One key per bounding box (i.e. space.GlobalId). Query results are returned as keys.
+            mins, maxs: np.ndarray
+                (n, 3) arrays with the min/max XYZ coordinates of each bounding box.
+            nodeCapacity: int
+                Number of children per node in the tree.
+        """
+        self.keys = list(keys)
+        mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+        if len(mins) != len(self.keys) or len(maxs) != len(self.keys):
+            raise ValueError("keys, mins and maxs must have the same length")
+
+        self.nodeCapacity = max(2, int(nodeCapacity))
+
+        # leaves are the bounding boxes themselves, sorted so neighbouring boxes end up in the same nodes
+        self.order = self._strOrder(centers=(mins + maxs) / 2)
+        self.levelMins = [mins[self.order]]
+        self.levelMaxs = [maxs[self.order]]
+
+        # pack each level into nodes of nodeCapacity consecutive children until only the root is left
+        while len(self.levelMins[-1]) > 1:
+            childCount = len(self.levelMins[-1])
+            starts = np.arange(0, childCount, self.nodeCapacity)
+            self.levelMins.append(
+                np.minimum.reduceat(self.levelMins[-1], starts, axis=0)
+            )
+            self.levelMaxs.append(
+                np.maximum.reduceat(self.levelMaxs[-1], starts, axis=0)
+            )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _strOrder(self, centers: np.ndarray) -> np.ndarray:
+        """Sort-Tile-Recursive order of the box centers (x slabs -> y slabs -> z)."""
+        count = len(centers)
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        leafCount = int(np.ceil(count / self.nodeCapacity))
+        slabs = max(1, int(np.ceil(leafCount ** (1 / 3))))
+        xSlabSize = self.nodeCapacity * slabs * slabs
+        ySlabSize = self.nodeCapacity * slabs
+
+        order = np.argsort(centers[:, 0], kind="stable")
+        for xStart in range(0, count, xSlabSize):
+            xSlab = order[xStart : xStart + xSlabSize]
+            xSlab = xSlab[np.argsort(centers[xSlab, 1], kind="stable")]
+            for yStart in range(0, len(xSlab), ySlabSize):
+                ySlab = xSlab[yStart : yStart + ySlabSize]
+                xSlab[yStart : yStart + ySlabSize] = ySlab[
+                    np.argsort(centers[ySlab, 2], kind="stable")
+                ]
+            order[xStart : xStart + xSlabSize] = xSlab
+
+        return order
+
+    def overlapPairs(
+        self, mins: np.ndarray, maxs: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find all (query, box) pairs that overlap, for all query boxes at once.
+
+        Returns:
+            queryIndices, boxIndices: np.ndarray
+                Index into the query boxes and the ORIGINAL index of the overlapping bounding box.
+        """
+        mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+        if len(self.keys) == 0 or len(mins) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        # start every query at the root and walk down one level at a time
+        queryIndices = np.arange(len(mins))
+        nodeIndices = np.zeros(len(mins), dtype=np.int64)
+
+        for level in range(len(self.levelMins) - 1, -1, -1):
+            if level < len(self.levelMins) - 1:
+                # expand each surviving node to its (up to nodeCapacity) children on this level
+                children = nodeIndices[:, None] * self.nodeCapacity + np.arange(
+                    self.nodeCapacity
+                )
+                queryIndices = np.repeat(queryIndices, self.nodeCapacity)
+                children = children.ravel()
+                valid = children < len(self.levelMins[level])
+                queryIndices, nodeIndices = queryIndices[valid], children[valid]
+
+            overlap = np.all(
+                (mins[queryIndices] <= self.levelMaxs[level][nodeIndices])
+                & (maxs[queryIndices] >= self.levelMins[level][nodeIndices]),
+                axis=1,
+            )
+            queryIndices, nodeIndices = queryIndices[overlap], nodeIndices[overlap]
+
+            if len(queryIndices) == 0:
+                break
+
+        return queryIndices, self.order[nodeIndices]
+
+    def queryBatch(
+        self, mins: np.ndarray, maxs: np.ndarray, allMatches: bool = False
+    ) -> list:
+        """
+        Look up the overlapping bounding boxes for all query boxes in one go.
+
+        input:
+            mins, maxs: np.ndarray
+                (m, 3) arrays with the min/max XYZ coordinates of the query boxes (i.e. air terminals).
+            allMatches: bool
+                False: return the key of the FIRST overlapping box (in the order the keys were given), or None.
+                True: return a list of keys of all overlapping boxes (in the order the keys were given).
+
+        Returns: A list with one result per query box.
+        """
+        queryCount = len(np.asarray(mins).reshape(-1, 3))
+        queryIndices, boxIndices = self.overlapPairs(mins, maxs)
+
+        # sort by query, then by original box index, so the first hit of each query is the first match
+        sortOrder = np.lexsort((boxIndices, queryIndices))
+        queryIndices, boxIndices = queryIndices[sortOrder], boxIndices[sortOrder]
+
+        if allMatches:
+            results = [[] for _ in range(queryCount)]
+            for queryIndex, boxIndex in zip(queryIndices.tolist(), boxIndices.tolist()):
+                results[queryIndex].append(self.keys[boxIndex])
+            return results
+
+        results = [None] * queryCount
+        if len(queryIndices) == 0:
+            return results
+
+        firstHits = np.flatnonzero(np.r_[True, queryIndices[1:] != queryIndices[:-1]])
+        for queryIndex, boxIndex in zip(
+            queryIndices[firstHits].tolist(), boxIndices[firstHits].tolist()
+        ):
+            results[queryIndex] = self.keys[boxIndex]
+        return results
+
+    def query(self, bbox: dict, allMatches: bool = False):
+        """Look up a single bounding box ({"min": [x, y, z], "max": [x, y, z]}), see queryBatch()."""
+        return self.queryBatch(bbox["min"], bbox["max"], allMatches=allMatches)[0]
@@ -0,0 +1,660 @@
+"""
+SYNTHETIC MODEL GENERATOR
+
+Version: 17/10/26
+
+Builds a synthetic MEP/ARCH pair of IFC4 files of any size, for benchmarks (benchmarks/pipelineBenchmark.py) and
+for trying the analysis without the course models.
+
+ARCH file:
+    - storeys with a row of spaces (6 x 8 m, 3 m high) along the x axis,
+    - Qto_SpaceBaseQuantities.GrossFloorArea and a LongName (space type) on each space,
+    - chairs contained in the office spaces.
+MEP file, per system pair (supply "VI01", return "VU01", ...), with one AHU (IfcUnitaryEquipment) per pair:
+    - a riser from the AHU through all storeys, with a tee on each storey (except the top storey),
+    - on each storey, a header of tees that splits the riser into branchingFactor main ducts,
+    - each main duct runs along the spaces served by the system, with ductsPerFitting rectangular duct segments
+      between two tees (the last space is fed through a bend),
+    - each tee feeds a round branch duct across the space, with a tee (a bend for the last one) and a drop to each
+      of the terminalsPerSpace air terminals.
+    The supply ducts run along one side of the spaces, and the return ducts along the other side.
+    By default there is a short duct between two fittings; with directFittings=True tees and bends are
+    connected directly to each other.
+All elements have IfcDistributionPorts (IfcRelNests), every port is connected to at most one other port
+(IfcRelConnectsPorts, in the flow direction of the system), the elements are assigned to their system and
+contained in their storey. The spaces of a storey are shared by the system pairs (space i is served by
+pair i % systems).
+"""
+
+import os
+
+import ifcopenshell
+import ifcopenshell.api.context
+import ifcopenshell.api.root
+import ifcopenshell.api.unit
+import ifcopenshell.guid
+import numpy as np
+
+SPACE_WIDTH = 6000.0  # mm (x)
+SPACE_DEPTH = 8000.0  # mm (y)
+SPACE_HEIGHT = 3000.0  # mm
+STOREY_HEIGHT = 3500.0  # mm
+DUCT_LEVEL = 3100.0  # mm above the storey, in the ceiling void
+TERMINAL_LEVEL = 2800.0  # mm above the storey (top of the air terminals)
+RISER_X = -1000.0  # mm
+RISER_RADIUS = 200.0  # mm (riser and header ducts)
+SPACE_TYPES = [
+    "Open Office",
+    "Meeting Room",
+    "Closed Office",
+    "Classroom",
+    "Auditorium",
+]
+
+
+class _ifcModelBuilder:
+    def __init__(self, name: str, storeys: int):
+        """New IFC4 file (mm) with a project, site, building and storeys, and helpers to create elements."""
+        self.file = ifcopenshell.file(schema="IFC4")
+        project = ifcopenshell.api.root.create_entity(
+            self.file, ifc_class="IfcProject", name=name
+        )
+        ifcopenshell.api.unit.assign_unit(self.file)
+        model = ifcopenshell.api.context.add_context(self.file, context_type="Model")
+        self.body = ifcopenshell.api.context.add_context(
+            self.file,
+            context_type="Model",
+            context_identifier="Body",
+            target_view="MODEL_VIEW",
+            parent=model,
+        )
+        self.directions = {}
+        self.profiles = {}
+
+        site = self.file.createIfcSite(
+            ifcopenshell.guid.new(),
+            Name="Site",
+            ObjectPlacement=self.placement((0, 0, 0)),
+        )
+        building = self.file.createIfcBuilding(
+            ifcopenshell.guid.new(),
+            Name="Building",
+            ObjectPlacement=site.ObjectPlacement,
+        )
+        self.storeys = [
+            self.file.createIfcBuildingStorey(
+                ifcopenshell.guid.new(),
+                Name=f"Level {level}",
+                Elevation=level * STOREY_HEIGHT,
+                ObjectPlacement=self.placement((0, 0, level * STOREY_HEIGHT)),
+            )
+            for level in range(storeys)
+        ]
+        self.file.createIfcRelAggregates(
+            ifcopenshell.guid.new(), RelatingObject=project, RelatedObjects=[site]
+        )
+        self.file.createIfcRelAggregates(
+            ifcopenshell.guid.new(), RelatingObject=site, RelatedObjects=[building]
+        )
+        self.file.createIfcRelAggregates(
+            ifcopenshell.guid.new(),
+            RelatingObject=building,
+            RelatedObjects=self.storeys,
+        )
+        self.contained = {storey: [] for storey in self.storeys}
+
+    def direction(self, xyz):
+        xyz = tuple(float(v) for v in xyz)
+        if xyz not in self.directions:
+            self.directions[xyz] = self.file.createIfcDirection(xyz)
+        return self.directions[xyz]
+
+    def placement(self, xyz, axis=None, ref=None):
+        return self.file.createIfcLocalPlacement(
+            None,
+            self.file.createIfcAxis2Placement3D(
+                self.file.createIfcCartesianPoint(tuple(float(v) for v in xyz)),
+                self.direction(axis) if axis else None,
+                self.direction(ref) if ref else None,
+            ),
+        )
+
+    def rectangle(self, x: float, y: float, centered: bool = False):
+        key = ("rectangle", float(x), float(y), centered)
+        if key not in self.profiles:
+            self.profiles[key] = self.file.createIfcRectangleProfileDef(
+                "AREA",
+                None,
+                self.file.createIfcAxis2Placement2D(
+                    self.file.createIfcCartesianPoint(
+                        (0.0, 0.0) if centered else (x / 2, y / 2)
+                    )
+                ),
+                float(x),
+                float(y),
+            )
+        return self.profiles[key]
+
+    def circle(self, radius: float):
+        key = ("circle", float(radius))
+        if key not in self.profiles:
+            self.profiles[key] = self.file.createIfcCircleProfileDef(
+                "AREA", None, None, float(radius)
+            )
+        return self.profiles[key]
+
+    def extrusion(self, profile, depth: float):
+        solid = self.file.createIfcExtrudedAreaSolid(
+            profile,
+            self.file.createIfcAxis2Placement3D(
+                self.file.createIfcCartesianPoint((0.0, 0.0, 0.0))
+            ),
+            self.direction((0, 0, 1)),
+            float(depth),
+        )
+        return self.file.createIfcProductDefinitionShape(
+            None,
+            None,
+            [
+                self.file.createIfcShapeRepresentation(
+                    self.body, "Body", "SweptSolid", [solid]
+                )
+            ],
+        )
+
+    def element(self, ifcClass: str, storey, placement, representation, **attributes):
+        element = self.file.create_entity(
+            ifcClass,
+            GlobalId=ifcopenshell.guid.new(),
+            ObjectPlacement=placement,
+            Representation=representation,
+            **attributes,
+        )
+        self.contained[storey].append(element)
+        return element
+
+    def containElements(self):
+        for storey, elements in self.contained.items():
+            if elements:
+                self.file.createIfcRelContainedInSpatialStructure(
+                    ifcopenshell.guid.new(),
+                    RelatedElements=elements,
+                    RelatingStructure=storey,
+                )
+
+
+class _ventilationSystemBuilder:
+    def __init__(
+        self,
+        builder: _ifcModelBuilder,
+        name: str,
+        supply: bool,
+        directFittings: bool = False,
+    ):
+        """Elements, ports and connections of one distribution system."""
+        self.builder = builder
+        self.file = builder.file
+        self.supply = supply
+        self.directFittings = directFittings
+        self.system = self.file.createIfcDistributionSystem(
+            ifcopenshell.guid.new(), Name=name, PredefinedType="VENTILATION"
+        )
+        self.members = []
+
+    def ports(self, element, positions: list) -> list:
+        ports = [
+            self.file.createIfcDistributionPort(
+                ifcopenshell.guid.new(),
+                Name=f"Port{i}",
+                ObjectPlacement=self.builder.placement(position),
+                FlowDirection="SOURCEANDSINK",
+            )
+            for i, position in enumerate(positions)
+        ]
+        self.file.createIfcRelNests(
+            ifcopenshell.guid.new(), RelatingObject=element, RelatedObjects=ports
+        )
+        return ports
+
+    def connect(self, upstreamPort, downstreamPort):
+        """Connect two ports in the flow direction (supply: away from the AHU, return: towards the AHU)."""
+        if self.supply:
+            relating, related = downstreamPort, upstreamPort
+        else:
+            relating, related = upstreamPort, downstreamPort
+        self.file.createIfcRelConnectsPorts(
+            ifcopenshell.guid.new(), RelatingPort=relating, RelatedPort=related
+        )
+
+    def add(self, element, upstreamPort, positions: list) -> list:
+        """Add an element with ports at positions, its first port connected to upstreamPort. Returns the ports."""
+        ports = self.ports(element, positions)
+        if upstreamPort is not None:
+            self.connect(upstreamPort, ports[0])
+        self.members.append(element)
+        return ports
+
+    def straightDuct(self, storey, upstreamPort, start, end, radius: float = 100.0):
+        """Round duct segment from start to end (along one axis). Returns the downstream port."""
+        start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+        vector = end - start
+        length = float(np.linalg.norm(vector))
+        axis = tuple(vector / length)
+        ref = (0, 0, 1) if abs(axis[2]) < 0.5 else (1, 0, 0)
+        duct = self.builder.element(
+            "IfcDuctSegment",
+            storey,
+            self.builder.placement(start, axis, ref),
+            self.builder.extrusion(self.builder.circle(radius), length),
+        )
+        return self.add(duct, upstreamPort, [start, end])[1]
+
+    def connectorDuct(self, storey, upstreamPort, start, end, radius: float = 100.0):
+        """Duct between two fittings, left out with directFittings (the fittings are connected to each other)."""
+        if self.directFittings:
+            return upstreamPort
+        return self.straightDuct(storey, upstreamPort, start, end, radius)
+
+    def mainDuct(self, storey, upstreamPort, start, length: float, width: float):
+        """Rectangular duct segment (300 mm high) from start along +x. Returns the downstream port."""
+        x, y, z = start
+        duct = self.builder.element(
+            "IfcDuctSegment",
+            storey,
+            self.builder.placement((x, y, z)),
+            self.builder.extrusion(self.builder.rectangle(length, width), 300),
+        )
+        return self.add(duct, upstreamPort, [(x, y, z), (x + length, y, z)])[1]
+
+    def fitting(self, storey, upstreamPort, objectType: str, center, positions: list):
+        fitting = self.builder.element(
+            "IfcDuctFitting",
+            storey,
+            self.builder.placement(center),
+            self.builder.extrusion(self.builder.rectangle(300, 300, True), 300),
+            ObjectType=objectType,
+        )
+        return self.add(fitting, upstreamPort, positions)
+
+    def tee(self, storey, upstreamPort, center, run, branch) -> tuple:
+        """Tee with the main run in the direction run and the branch port in the direction branch. Returns (through, branch) ports."""
+        center, run, branch = (
+            np.asarray(v, dtype=float) for v in (center, run, branch)
+        )
+        ports = self.fitting(
+            storey,
+            upstreamPort,
+            "T-stykke",
+            center,
+            [center - 150 * run, center + 150 * run, center + 150 * branch],
+        )
+        return ports[1], ports[2]
+
+    def bend(self, storey, upstreamPort, start, end):
+        """90 degree bend between start and end. Returns the downstream port."""
+        return self.fitting(storey, upstreamPort, "BU 90", start, [start, end])[1]
+
+
+def syntheticElementCount(
+    storeys: int,
+    spacesPerStorey: int,
+    systems: int = 1,
+    branchingFactor: int = 1,
+    terminalsPerSpace: int = 1,
+    ductsPerFitting: int = 1,
+    directFittings: bool = False,
+) -> int:
+    """Number of MEP elements (AHUs, duct segments, fittings and air terminals) generateSyntheticModels() creates."""
+    count = systems
+    for pair in range(systems):
+        served = len(range(pair, spacesPerStorey, systems))
+        groups = min(branchingFactor, served) if served else 0
+        perStorey = (
+            2  # riser and the duct to the header
+            + 4 * max(groups - 1, 0)  # header tee, ducts and bend
+            + served * (ductsPerFitting + 1 + 4 * terminalsPerSpace)
+        )
+        if directFittings:
+            # no ducts after the riser tee, between the header tees and on the branch ducts
+            perStorey -= max(groups - 1, 0) + served * terminalsPerSpace
+        count += 2 * (storeys * perStorey + (storeys - 1))  # + riser tees
+        if directFittings:
+            count -= 2 * (storeys - 1)
+    return count
+
+
+def syntheticModelParameters(targetElements: int, **parameters) -> dict:
+    """
+    Parameters of generateSyntheticModels() for a model with about targetElements MEP elements.
+    The number of spaces per storey (and the number of storeys, at most 20, if not given) is chosen,
+    the other parameters are kept.
+    """
+    parameters = dict(parameters)
+    parameters.setdefault("systems", 1)
+    countParameters = {
+        key: value for key, value in parameters.items() if key != "chairsPerSpace"
+    }
+    countParameters.pop("storeys", None)
+
+    # elements of one space (both systems), without the risers and headers
+    perSpace = 2 * (
+        parameters.get("ductsPerFitting", 1)
+        + 1
+        + (3 if parameters.get("directFittings") else 4)
+        * parameters.get("terminalsPerSpace", 1)
+    )
+    if "storeys" not in parameters:
+        spaces = max(1, targetElements / perSpace)
+        parameters["storeys"] = int(min(20, max(1, round(np.sqrt(spaces / 10)))))
+
+    # the element count grows with the number of spaces per storey
+    low, high = parameters["systems"], max(
+        parameters["systems"], int(targetElements / perSpace) + 1
+    )
+    while low < high:
+        middle = (low + high) // 2
+        if (
+            syntheticElementCount(parameters["storeys"], middle, **countParameters)
+            < targetElements
+        ):
+            low = middle + 1
+        else:
+            high = middle
+    parameters["spacesPerStorey"] = low
+    return parameters
+
+
+def generateSyntheticModels(
+    mepPath: str,
+    archPath: str,
+    storeys: int = 2,
+    spacesPerStorey: int = 4,
+    systems: int = 1,
+    branchingFactor: int = 1,
+    terminalsPerSpace: int = 1,
+    ductsPerFitting: int = 1,
+    directFittings: bool = False,
+    chairsPerSpace: int = 2,
+) -> dict:
+    """
+    Write a synthetic MEP/ARCH pair of IFC4 files.
+
+    input:
+        mepPath, archPath: str
+            Paths of the MEP and ARCH files (use the xxx-MEP.ifc/xxx-ARCH.ifc names to analyse them with main.py).
+        storeys: int
+            Number of storeys.
+        spacesPerStorey: int
+            Number of spaces on each storey.
+        systems: int
+            Number of supply/return system pairs (each with its own AHU).
+        branchingFactor: int
+            Number of main ducts the riser of a system splits into on each storey.
+        terminalsPerSpace: int
+            Number of air terminals of each system in each space it serves.
+        ductsPerFitting: int
+            Number of rectangular duct segments between two tees of a main duct (the duct/fitting ratio).
+        directFittings: bool
+            Connect fittings directly to each other (riser tee to header tee, header tee to header tee, tee to
+            the branch tees and bends in the spaces), as in many real models, instead of through a short duct.
+        chairsPerSpace: int
+            Number of chairs in each office space (used for the occupancy).
+
+    Returns: A dictionary with the paths ("MEP", "ARCH") and the number of created elements.
+    """
+    if min(storeys, spacesPerStorey, systems, branchingFactor, ductsPerFitting) < 1:
+        raise ValueError(
+            "storeys, spacesPerStorey, systems, branchingFactor and ductsPerFitting must be at least 1"
+        )
+    # the supply and the return ducts each have half of the space depth
+    if 450 * branchingFactor + 600 * terminalsPerSpace > SPACE_DEPTH / 2 - 300:
+        raise ValueError(
+            "branchingFactor and terminalsPerSpace are too large to fit the ducts in the spaces"
+        )
+
+    # ARCH file
+    arch = _ifcModelBuilder("ARCH", storeys)
+    spaceCount = chairCount = 0
+    for level, storey in enumerate(arch.storeys):
+        z = level * STOREY_HEIGHT
+        spaces = []
+        for i in range(spacesPerStorey):
+            x = i * SPACE_WIDTH
+            spaceType = SPACE_TYPES[i % len(SPACE_TYPES)]
+            space = arch.file.createIfcSpace(
+                ifcopenshell.guid.new(),
+                Name=f"{level}.{i}",
+                LongName=spaceType,
+                ObjectPlacement=arch.placement((x, 0, z)),
+                Representation=arch.extrusion(
+                    arch.rectangle(SPACE_WIDTH, SPACE_DEPTH), SPACE_HEIGHT
+                ),
+            )
+            spaces.append(space)
+            quantities = arch.file.createIfcElementQuantity(
+                ifcopenshell.guid.new(),
+                Name="Qto_SpaceBaseQuantities",
+                Quantities=[
+                    arch.file.createIfcQuantityArea(
+                        "GrossFloorArea",
+                        None,
+                        None,
+                        SPACE_WIDTH * SPACE_DEPTH / 1e6,
+                    )
+                ],
+            )
+            arch.file.createIfcRelDefinesByProperties(
+                ifcopenshell.guid.new(),
+                RelatedObjects=[space],
+                RelatingPropertyDefinition=quantities,
+            )
+            if "Office" in spaceType and chairsPerSpace:
+                chairs = [
+                    arch.file.createIfcFurniture(
+                        ifcopenshell.guid.new(),
+                        Name=f"Chair:{c}",
+                        ObjectPlacement=arch.placement(
+                            (x + 500 + (c % 8) * 600, 1500 + (c // 8) * 800, z)
+                        ),
+                        Representation=arch.extrusion(arch.rectangle(500, 500), 900),
+                    )
+                    for c in range(chairsPerSpace)
+                ]
+                arch.file.createIfcRelContainedInSpatialStructure(
+                    ifcopenshell.guid.new(),
+                    RelatedElements=chairs,
+                    RelatingStructure=space,
+                )
+                chairCount += len(chairs)
+        arch.file.createIfcRelAggregates(
+            ifcopenshell.guid.new(), RelatingObject=storey, RelatedObjects=spaces
+        )
+        spaceCount += len(spaces)
+    os.makedirs(os.path.dirname(archPath) or ".", exist_ok=True)
+    arch.file.write(archPath)
+
+    # MEP file
+    mep = _ifcModelBuilder("MEP", storeys)
+    systemBuilders = []
+    for pair in range(systems):
+        riserX = RISER_X - 600 * pair
+        ahu = mep.element(
+            "IfcUnitaryEquipment",
+            mep.storeys[0],
+            mep.placement((riserX - 2000, SPACE_DEPTH / 2, 0)),
+            mep.extrusion(mep.rectangle(1500, 1000), 2000),
+            Name=f"AHU {pair + 1}",
+            ObjectType="Geniox 12",
+        )
+        served = list(range(pair, spacesPerStorey, systems))
+        groups = (
+            [
+                group.tolist()
+                for group in np.array_split(served, min(branchingFactor, len(served)))
+            ]
+            if served
+            else []
+        )
+
+        # the supply ducts run from one side of the spaces and the return ducts from the other side
+        for prefix, supply, y, side in (
+            ("VI", True, 300.0, 1),
+            ("VU", False, SPACE_DEPTH - 300, -1),
+        ):
+            system = _ventilationSystemBuilder(
+                mep, f"{prefix}{pair + 1:02d}", supply, directFittings
+            )
+            system.members.append(ahu)
+            systemBuilders.append(system)
+            port = system.ports(ahu, [(riserX - 1250, y, 0)])[0]
+            riserBottom = (riserX, y, 0.0)
+
+            for level, storey in enumerate(mep.storeys):
+                z = level * STOREY_HEIGHT + DUCT_LEVEL
+                if level == storeys - 1:
+                    port = system.straightDuct(
+                        storey, port, riserBottom, (riserX, y, z), RISER_RADIUS
+                    )
+                    storeyPort = system.straightDuct(
+                        storey, port, (riserX, y, z), (riserX + 450, y, z), RISER_RADIUS
+                    )
+                else:
+                    port = system.straightDuct(
+                        storey, port, riserBottom, (riserX, y, z - 150), RISER_RADIUS
+                    )
+                    port, storeyPort = system.tee(
+                        storey, port, (riserX, y, z), (0, 0, 1), (1, 0, 0)
+                    )
+                    storeyPort = system.connectorDuct(
+                        storey,
+                        storeyPort,
+                        (riserX + 150, y, z),
+                        (riserX + 450, y, z),
+                        RISER_RADIUS,
+                    )
+                    riserBottom = (riserX, y, z + 150)
+
+                # header: one tee per extra main duct, the main ducts are offset towards the middle of the spaces
+                x = riserX + 450
+                mainStarts = []
+                for g in range(len(groups) - 1):
+                    storeyPort, branchPort = system.tee(
+                        storey, storeyPort, (x + 150, y, z), (1, 0, 0), (0, side, 0)
+                    )
+                    offset = 450.0 * (g + 1)
+                    branchPort = system.straightDuct(
+                        storey,
+                        branchPort,
+                        (x + 150, y + side * 150, z),
+                        (x + 150, y + side * offset, z),
+                        RISER_RADIUS,
+                    )
+                    mainY = y + side * (offset + 150)
+                    branchPort = system.bend(
+                        storey,
+                        branchPort,
+                        (x + 150, y + side * offset, z),
+                        (x + 300, mainY, z),
+                    )
+                    mainStarts.append((branchPort, x + 300, mainY))
+                    storeyPort = system.connectorDuct(
+                        storey,
+                        storeyPort,
+                        (x + 300, y, z),
+                        (x + 600, y, z),
+                        RISER_RADIUS,
+                    )
+                    x += 600
+                mainStarts.append((storeyPort, x, y))
+
+                terminalZ = level * STOREY_HEIGHT + TERMINAL_LEVEL
+                for group, (mainPort, mx, my) in zip(groups, mainStarts):
+                    for i in group:
+                        teeX = i * SPACE_WIDTH + SPACE_WIDTH / 3
+                        length = max(teeX - 150 - mx, 100.0 * ductsPerFitting)
+                        for d in range(ductsPerFitting):
+                            mainPort = system.mainDuct(
+                                storey,
+                                mainPort,
+                                (mx + d * length / ductsPerFitting, my, z),
+                                length / ductsPerFitting,
+                                400 - 40 * (level % 5),
+                            )
+                        mx += length
+                        bx = mx + 150
+
+                        # the main duct ends with a bend into the last space
+                        if i == group[-1]:
+                            branchPort = system.bend(
+                                storey, mainPort, (mx, my, z), (bx, my + side * 150, z)
+                            )
+                        else:
+                            mainPort, branchPort = system.tee(
+                                storey, mainPort, (bx, my, z), (1, 0, 0), (0, side, 0)
+                            )
+                        mx += 300
+
+                        # branch duct across the space, with a tee and a drop to each terminal (a bend for the last one)
+                        by = my + side * 150
+                        for t in range(terminalsPerSpace):
+                            branchPort = system.connectorDuct(
+                                storey,
+                                branchPort,
+                                (bx, by, z),
+                                (bx, by + side * 300, z),
+                            )
+                            by += side * 300
+                            dropStart = (bx, by + side * 150, z - 150)
+                            if t < terminalsPerSpace - 1:
+                                branchPort, dropPort = system.tee(
+                                    storey,
+                                    branchPort,
+                                    (bx, by + side * 150, z),
+                                    (0, side, 0),
+                                    (0, 0, -1),
+                                )
+                                by += side * 300
+                            else:
+                                dropPort = system.bend(
+                                    storey, branchPort, (bx, by, z), dropStart
+                                )
+                            dropPort = system.straightDuct(
+                                storey,
+                                dropPort,
+                                dropStart,
+                                (bx, dropStart[1], terminalZ),
+                            )
+                            terminal = mep.element(
+                                "IfcAirTerminal",
+                                storey,
+                                mep.placement((bx, dropStart[1], terminalZ - 100)),
+                                mep.extrusion(mep.rectangle(600, 600, True), 100),
+                            )
+                            system.connect(
+                                dropPort,
+                                system.add(
+                                    terminal, None, [(bx, dropStart[1], terminalZ)]
+                                )[0],
+                            )
+
+    for system in systemBuilders:
+        mep.file.createIfcRelAssignsToGroup(
+            ifcopenshell.guid.new(),
+            RelatedObjects=system.members,
+            RelatingGroup=system.system,
+        )
+    mep.containElements()
+    os.makedirs(os.path.dirname(mepPath) or ".", exist_ok=True)
+    mep.file.write(mepPath)
+
+    return {
+        "MEP": mepPath,
+        "ARCH": archPath,
+        "spaces": spaceCount,
+        "chairs": chairCount,
+        "systems": len(systemBuilders),
+        "airTerminals": len(mep.file.by_type("IfcAirTerminal")),
+        "ductSegments": len(mep.file.by_type("IfcDuctSegment")),
+        "ductFittings": len(mep.file.by_type("IfcDuctFitting")),
+        "elements": sum(len(elements) for elements in mep.contained.values()),
+    }
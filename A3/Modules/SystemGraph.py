@@ -0,0 +1,154 @@
+"""
+Adjacency graphs (CSR arrays) of the ventilation systems, used to walk a system downstream from its AHU.
+
+Version: 17/10/26
+
+All port connections (IfcRelConnectsPorts via the ports nested in each element) and system groupings
+(IfcRelAssignsToGroup) are resolved in one sweep, so a traversal does not have to call
+ifcopenshell.util.system.get_connected_from/to and get_element_systems for every element again.
+
+Downstream direction is the same as in build_downstream_tree():
+    VI (supply): ifcopenshell.util.system.get_connected_from()
+    VU (return): ifcopenshell.util.system.get_connected_to()
+"""
+
+import ifcopenshell
+import ifcopenshell.util.system
+import numpy as np
+
+from .Profiler import profiled
+
+
+class systemGraph:
+    def __init__(self, systemName: str, elementIDs: list, indptr, indices):
+        """
+        input:
+            systemName: str
+                Name of the IfcSystem.
+            elementIDs: list
+                Step ids of the elements (nodes) in the graph.
+            indptr, indices: np.ndarray
+                CSR adjacency: the downstream neighbours of node i are indices[indptr[i]:indptr[i + 1]].
+        """
+        self.systemName = systemName
+        self.elementIDs = np.asarray(elementIDs, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.rows = {elID: row for row, elID in enumerate(self.elementIDs.tolist())}
+
+    def __len__(self):
+        return len(self.elementIDs)
+
+    def __contains__(self, element):
+        return self._elementID(element) in self.rows
+
+    def _elementID(self, element) -> int:
+        return element if isinstance(element, int) else element.id()
+
+    def row(self, element: ifcopenshell.entity_instance | int) -> int:
+        return self.rows[self._elementID(element)]
+
+    def downstream(self, row: int) -> np.ndarray:
+        """Rows of the downstream neighbours of a node (in the order ifcopenshell.util.system returns them)."""
+        return self.indices[self.indptr[row] : self.indptr[row + 1]]
+
+
+def flowDirection(systemName: str) -> str:
+    """'from' for supply systems (VI), 'to' for return systems (VU)."""
+    if "VI" in systemName:
+        return "from"
+    elif "VU" in systemName:
+        return "to"
+    raise ValueError(f"Unable to determine flow direction for {systemName}")
+
+
+def getSystemMembers(ifc_file: ifcopenshell.file) -> dict[str, set]:
+    """Step ids of the elements in each system (by system name), same systems as get_element_systems()."""
+    systemMembers = {}
+    for rel in ifc_file.by_type("IfcRelAssignsToGroup"):
+        group = rel.RelatingGroup
+        if not group.is_a("IfcSystem") or group.is_a() in (
+            "IfcStructuralAnalysisModel",
+            "IfcZone",
+        ):
+            continue
+        members = systemMembers.setdefault(group.Name, set())
+        members.update(
+            obj.id()
+            for obj in rel.RelatedObjects
+            if not obj.is_a("IfcDistributionPort")
+        )
+    return systemMembers
+
+
+def getConnections(element: ifcopenshell.entity_instance) -> tuple[list, list]:
+    """
+    Connected elements of an element in both directions.
+
+    Returns: (connectedFrom, connectedTo) - lists of step ids, same order as
+    ifcopenshell.util.system.get_connected_from() and get_connected_to().
+    """
+    connections = {"from": [], "to": []}
+    for port in ifcopenshell.util.system.get_ports(element):
+        for direction, rels in (
+            ("from", port.ConnectedFrom),
+            ("to", port.ConnectedTo),
+        ):
+            for rel in rels:
+                for other_port in [rel.RelatedPort, rel.RelatingPort]:
+                    if other_port == port:
+                        continue
+                    other_element = ifcopenshell.util.system.get_port_element(
+                        other_port
+                    )
+                    if other_element:
+                        connections[direction].append(other_element.id())
+    return connections["from"], connections["to"]
+
+
+@profiled()
+def buildSystemGraphs(
+    ifc_file: ifcopenshell.file, systemRoots: dict
+) -> dict[str, systemGraph]:
+    """
+    Build a downstream adjacency graph for each system.
+
+    input:
+        ifc_file: ifcopenshell.file
+            .ifc file with ventilation systems.
+        systemRoots: dict
+            System name as key and the element the traversal starts at (the AHU) as value.
+
+    Returns: A dictionary with system name as key and a systemGraph as value.
+    Each graph contains the root and the elements of the system, and only edges to elements of the same system.
+    """
+    systemMembers = getSystemMembers(ifc_file)
+
+    # port connections of every element, resolved once (an element can be in several systems)
+    connections = {}
+
+    graphs = {}
+    for systemName, root in systemRoots.items():
+        direction = flowDirection(systemName)
+        members = systemMembers.get(systemName, set())
+
+        elementIDs = [root.id()] + sorted(members - {root.id()})
+        rows = {elID: row for row, elID in enumerate(elementIDs)}
+
+        indptr, indices = [0], []
+        for elID in elementIDs:
+            if elID not in connections:
+                connections[elID] = getConnections(ifc_file.by_id(elID))
+            connectedFrom, connectedTo = connections[elID]
+
+            # keep only elements in the same system
+            indices.extend(
+                rows[other]
+                for other in (connectedFrom if direction == "from" else connectedTo)
+                if other in members
+            )
+            indptr.append(len(indices))
+
+        graphs[systemName] = systemGraph(systemName, elementIDs, indptr, indices)
+
+    return graphs
@@ -37,7 +37,8 @@ import ifcopenshell.api.pset
 # import ifcopenshell.api.project
 import ifcopenshell.geom
 
-# import os
+import os
+from concurrent.futures import ProcessPoolExecutor
 from rich.console import Console
 
 # from rich.prompt import Prompt
@@ -48,11 +49,24 @@ from rich import inspect
 import numpy as np
 from treelib.tree import Tree
 
+from .GeometryEngine import (
+    getElementBBoxes,
+    getGeometryCache,
+    getPortPositions,
+)
+from .SpatialIndex import boundingBoxTree
+from .SystemGraph import buildSystemGraphs, systemGraph
+from .NetworkStore import elementNode, networkStore
+from .PsetWriter import writePsets
+from .PropertyIndex import getPropertyIndex
+from .Profiler import profiled, span
+
 # import json
 # from pressureLossDB import pressure_loss_db
 # from functions import get_element_bbox, bbox_overlap
 
 
+@profiled()
 def ahuFinder(
     console: Console,
     ifc_file: ifcopenshell.file,
@@ -72,6 +86,21 @@ def ahuFinder(
     ]
 
     missingAHUsystems = {}
+
+    # element type cache: is the element an AHU? (checked once per element, even if it is in several systems)
+    isAHU = {}
+
+    def elementIsAHU(element: ifcopenshell.entity_instance) -> bool:
+        if element.id() not in isAHU:
+            isAHU[element.id()] = element.is_a("IfcUnitaryEquipment") or (
+                "Geniox" in str(element.ObjectType)
+            )
+        return isAHU[element.id()]
+
+    # AHU GlobalIds in each identified system, and the identified systems of each AHU (in the same order as identifiedSystems)
+    systemAHUs = {}
+    ahuSystems = {}
+
     for system in ifc_file_systems:
         elements = system.IsGroupedBy[0].RelatedObjects
 
@@ -85,7 +114,9 @@ def ahuFinder(
 
         # the AHU element _should_ be an IfcUnitaryEquipment, but in the given ifc files, they are IfcBuildingElementProxy containing 'Geniox' in their names.
         # in the future, this should just create an instance in the BCF file saying that the system is missing an AHU element.
+        identified = False
         if any(e and "IfcUnitaryEquipment" in e for e in uniqueElements):
+            identified = True
             identifiedSystems[system.Name] = {
                 "ElementCount": len(elements),
                 "ElementTypes": list(uniqueElements),
@@ -94,6 +125,7 @@ def ahuFinder(
         else:
             # if uniqueElements contains IfcBuildingElementProxy with 'Geniox' in their ObjectType, consider it as having an AHU - remove this in future
             if any("Geniox" in str(e) for e in uniqueElementsType):
+                identified = True
                 identifiedSystems[system.Name] = {
                     "ElementCount": len(elements),
                     "ElementTypes": list(uniqueElements),
@@ -106,31 +138,32 @@ def ahuFinder(
                     "ElementIDs": [element.GlobalId for element in elements],
                 }
 
-    # for all identified systems, find the Supply/Return pairs (the systems using the same AHU) and add a new key 'PairedSystem' to the dictionary
-    for systemName, info in identifiedSystems.items():
-        elements = info.get("ElementIDs", [])
-        ahu_elements = [
-            el
-            for el in elements
-            if ifc_file.by_id(el).is_a("IfcUnitaryEquipment")
-            or ("Geniox" in str(ifc_file.by_id(el).ObjectType))
-        ]
-        pairedSystems = []
-        for otherSystemName, otherInfo in identifiedSystems.items():
-            if otherSystemName == systemName:
-                continue
-            other_elements = otherInfo.get("ElementIDs", [])
-            other_ahu_elements = [
-                el
-                for el in other_elements
-                if ifc_file.by_id(el).is_a("IfcUnitaryEquipment")
-                or ("Geniox" in str(ifc_file.by_id(el).ObjectType))
+        if identified:
+            systemAHUs[system.Name] = [
+                element.GlobalId for element in elements if elementIsAHU(element)
             ]
-            # if any of the ahu_elements are in other_ahu_elements, consider them paired
-            if any(ahu in other_ahu_elements for ahu in ahu_elements):
-                pairedSystems.append(otherSystemName)
+
+    # index of the identified systems using each AHU
+    for systemName in identifiedSystems:
+        for ahu in systemAHUs[systemName]:
+            systems = ahuSystems.setdefault(ahu, [])
+            if systemName not in systems:
+                systems.append(systemName)
+
+    # for all identified systems, find the Supply/Return pairs (the systems using the same AHU) and add a new key 'PairedSystem' to the dictionary
+    systemOrder = {systemName: i for i, systemName in enumerate(identifiedSystems)}
+    for systemName in identifiedSystems:
+        # systems sharing any of the AHUs of this system
+        pairedSystems = {
+            otherSystemName
+            for ahu in systemAHUs[systemName]
+            for otherSystemName in ahuSystems[ahu]
+            if otherSystemName != systemName
+        }
         if pairedSystems:
-            identifiedSystems[systemName]["PairedSystems"] = pairedSystems
+            identifiedSystems[systemName]["PairedSystems"] = sorted(
+                pairedSystems, key=systemOrder.get
+            )
 
     # table of AHUs and their respective supply and return systems (with element counts)
     table_AHUs = Table(title="AHU Elements and their Systems", show_lines=True)
@@ -142,14 +175,7 @@ def ahuFinder(
 
     # VI=Supply, VU=Return
     for systemName, info in identifiedSystems.items():
-        elements = info.get("ElementIDs", [])
-        ahu_elements = [
-            el
-            for el in elements
-            if ifc_file.by_id(el).is_a("IfcUnitaryEquipment")
-            or ("Geniox" in str(ifc_file.by_id(el).ObjectType))
-        ]
-        for ahu in ahu_elements:
+        for ahu in systemAHUs[systemName]:
             if ahu in processed_AHUs:
                 continue
             supplySystem = systemName if "VI" in systemName else None
@@ -184,39 +210,62 @@ def ahuFinder(
 
 
 #######################################
-#        The following two functions
+#        The following functions
 #        are for clash detection.
 #######################################
 
 
-def get_element_bbox(element: ifcopenshell.entity_instance) -> dict:
-    """Return min/max XYZ coordinates of an IFC element in world coordinates.
-    I WANT TO CHANGE THIS TO USE ifcopenshell.util.shape.get_bbox(element) insead!
-    """
-    settings = ifcopenshell.geom.settings()
-    settings.set(settings.USE_WORLD_COORDS, True)
+def bbox_overlap(b1: dict, b2: dict) -> bool:
+    return all(
+        b1["min"][i] <= b2["max"][i] and b1["max"][i] >= b2["min"][i] for i in range(3)
+    )
 
-    shape = ifcopenshell.geom.create_shape(settings, element)
-    verts = np.array(shape.geometry.verts).reshape(-1, 3)
 
-    bbox_min = verts.min(axis=0)
-    bbox_max = verts.max(axis=0)
+def buildSpaceIndex(
+    console: Console,
+    space_file: ifcopenshell.file,
+) -> boundingBoxTree:
+    """Build a bounding box tree of all (relevant) spaces in the space file.
 
-    return {"min": bbox_min, "max": bbox_max}
+    The tree only depends on the space geometry, so it can be built once per ARCH file
+    and reused for every run of airTerminalSpaceClashAnalyzer().
 
+    Returns: boundingBoxTree with space.GlobalId as keys.
+    """
+    spaces = space_file.by_type("IfcSpace")
+    # spaces with a long name of Area should be ignored (in this case, at they mess it up)
+    spaces = [space for space in spaces if "Area" not in space.LongName]
+    spaces = [space for space in spaces if "Rooftop Terrace" not in space.LongName]
 
-def bbox_overlap(b1: dict, b2: dict) -> bool:
-    return all(
-        b1["min"][i] <= b2["max"][i] and b1["max"][i] >= b2["min"][i] for i in range(3)
-    )
+    # space bounding boxes (all spaces are tessellated in one pass)
+    spaceBBoxes = getElementBBoxes(space_file, spaces)
+
+    spaceIDs, spaceMins, spaceMaxs = [], [], []
+    for space in spaces:
+        bbox = spaceBBoxes.get(space)
+        if bbox is None:
+            console.print(
+                f"[yellow]Skipping space {space.GlobalId}: no geometry[/yellow]"
+            )
+            continue
+        # add 0.5 to max Z to ensure overlap with more air terminals
+        bbox["max"][2] += 0.5
+        # print(f'Space {space.GlobalId} bbox: {bbox}')
+        spaceIDs.append(space.GlobalId)
+        spaceMins.append(bbox["min"])
+        spaceMaxs.append(bbox["max"])
+
+    return boundingBoxTree(keys=spaceIDs, mins=spaceMins, maxs=spaceMaxs)
 
 
+@profiled()
 def airTerminalSpaceClashAnalyzer(
     console: Console,
     MEP_file: ifcopenshell.file,
     space_file: ifcopenshell.file,
     space_file_name: str,
     identifiedSystems: dict,
+    spaceIndex: boundingBoxTree | None = None,
 ) -> tuple[dict, dict, Table]:
     """Checks which air terminals are inside which spaces.
 
@@ -229,28 +278,16 @@ def airTerminalSpaceClashAnalyzer(
             Architectural ifc file with defined spaces WITH Pset_SpaceAirHandlingDimensioning
         identifiedSystems: dict
             output from ahuFinder()
+        spaceIndex: boundingBoxTree | None
+            output from buildSpaceIndex(). Built from space_file if not given.
 
     Returns: A dictionary with space.GlobalId as key and a list of air terminal GlobalIds as values.
     """
-    spaces = space_file.by_type("IfcSpace")
-    # spaces with a long name of Area should be ignored (in this case, at they mess it up)
-    spaces = [space for space in spaces if "Area" not in space.LongName]
-    spaces = [space for space in spaces if "Rooftop Terrace" not in space.LongName]
+    if spaceIndex is None:
+        spaceIndex = buildSpaceIndex(console=console, space_file=space_file)
 
-    # space bounding boxes
-    space_bboxes = {}
-    for space in spaces:
-        try:
-            bbox = get_element_bbox(space)
-            # add 0.5 to max Z to ensure overlap with more air terminals
-            bbox["max"][2] += 0.5
-            # print(f'Space {space.GlobalId} bbox: {bbox}')
-            space_bboxes[space.GlobalId] = {"space": space, **bbox}
-        except Exception as e:
-            console.print(f"[yellow]Skipping space {space.GlobalId}: {e}[/yellow]")
-
-    spaceTerminals = {}
-    unassignedTerminals = {"Supply": [], "Return": []}
+    # collect all air terminals, so they can be tessellated and looked up in one go
+    systemTerminals = []
 
     for systemName, info in identifiedSystems.items():
         # analyzing each system
@@ -262,29 +299,36 @@ def airTerminalSpaceClashAnalyzer(
             el for el in elements if MEP_file.by_id(el).is_a("IfcAirTerminal")
         ]
         # console.print(f"System {systemName}: {air_terminals}")
+        systemTerminals.extend((systemName, at) for at in air_terminals)
+
+    # get bounding boxes of all air terminals
+    terminalElements = [MEP_file.by_id(at) for _, at in systemTerminals]
+    terminalBBoxes = getElementBBoxes(MEP_file, terminalElements)
+    found, terminalMins, terminalMaxs = terminalBBoxes.take(terminalElements)
+
+    terminalSystems, terminalIDs = [], []
+    for (systemName, air_terminal), hasGeometry in zip(systemTerminals, found):
+        # print(f'Analyzing air terminal {air_terminal.GlobalId}, {air_terminal=}')
+        if not hasGeometry:
+            console.print(
+                f"[yellow]Skipping air terminal {air_terminal}: no geometry[/yellow]"
+            )
+            continue
 
-        for air_terminal in air_terminals:
-            # print(f'Analyzing air terminal {air_terminal.GlobalId}, {air_terminal=}')
-            try:
-                # get bounding box of air terminal
-                at_bbox = get_element_bbox(MEP_file.by_id(air_terminal))
-            except Exception as e:
-                console.print(
-                    f"[yellow]Skipping air terminal {air_terminal}: {e}[/yellow]"
-                )
-                continue
+        terminalSystems.append(systemName)
+        terminalIDs.append(air_terminal)
 
-            # check which space the air terminal bounding box overlaps with
-            found_space = None
-            for sid, sdata in space_bboxes.items():
-                if bbox_overlap(at_bbox, sdata):
-                    found_space = sdata["space"]
-                    # air terminal is inside this space
-                    break
-                else:
-                    # air terminal not inside this space
-                    continue
+    # check which space each air terminal bounding box overlaps with (first match)
+    with span("airTerminalSpaceClashAnalyzer.queryBatch", terminals=len(terminalIDs)):
+        foundSpaces = spaceIndex.queryBatch(mins=terminalMins, maxs=terminalMaxs)
 
+    with span("airTerminalSpaceClashAnalyzer.assignTerminals"):
+        spaceTerminals = {}
+        unassignedTerminals = {"Supply": [], "Return": []}
+
+        for systemName, air_terminal, found_space in zip(
+            terminalSystems, terminalIDs, foundSpaces
+        ):
             if not found_space:  # unassigned air terminals
                 if "VU" in systemName:
                     unassignedTerminals["Return"].append(air_terminal)
@@ -294,15 +338,15 @@ def airTerminalSpaceClashAnalyzer(
                     continue
 
             if found_space:
-                # console.print(found_space.GlobalId)
-                if found_space.GlobalId not in spaceTerminals.keys():
-                    spaceTerminals[found_space.GlobalId] = {"Supply": [], "Return": []}
-                    # console.print(f"Created new entry for space: {found_space.GlobalId}")
+                # console.print(found_space)
+                if found_space not in spaceTerminals.keys():
+                    spaceTerminals[found_space] = {"Supply": [], "Return": []}
+                    # console.print(f"Created new entry for space: {found_space}")
 
                 if "VU" in systemName:
-                    spaceTerminals[found_space.GlobalId]["Return"].append(air_terminal)
+                    spaceTerminals[found_space]["Return"].append(air_terminal)
                 elif "VI" in systemName:
-                    spaceTerminals[found_space.GlobalId]["Supply"].append(air_terminal)
+                    spaceTerminals[found_space]["Supply"].append(air_terminal)
 
     # create table with space names and number of air terminals in each space - lastly a row with unnassigned air terminals
     table_spaces = Table(title="Air Terminals in Spaces", show_lines=True)
@@ -330,6 +374,54 @@ def airTerminalSpaceClashAnalyzer(
     return spaceTerminals, unassignedTerminals, table_spaces
 
 
+@profiled()
+def buildTerminalSpaceIndex(
+    space_file: ifcopenshell.file, spaceTerminals: dict
+) -> dict:
+    """Inverted index of airTerminalSpaceClashAnalyzer() output: which space each air terminal is in.
+
+    input:
+        space_file: ifcopenshell.file
+            Architectural ifc file with defined spaces WITH Pset_SpaceAirHandlingDimensioning
+        spaceTerminals: dict
+            output from airTerminalSpaceClashAnalyzer()
+
+    Returns: A dictionary with air terminal GlobalId as key and a dictionary as value:
+        {"SpaceID": space.GlobalId, "Direction": "Supply"/"Return", "AirFlow": the terminal's share of DesignAirFlow}
+    """
+    terminalSpaces = {}
+    properties = getPropertyIndex(space_file)
+
+    for spaceID, terminals in spaceTerminals.items():
+        designAirFlow = None  # only read the pset if the space has terminals
+
+        for direction in ("Supply", "Return"):
+            directionTerminals = terminals.get(direction, [])
+            if not directionTerminals:
+                continue
+
+            if designAirFlow is None:
+                designAirFlow = properties.get(
+                    space_file.by_guid(spaceID),
+                    "Pset_SpaceAirHandlingDimensioning",
+                    "DesignAirFlow",
+                )
+
+            # the design air flow of the space is split evenly between its terminals
+            for air_terminal in directionTerminals:
+                # keep the first space found (same as a search through spaceTerminals)
+                terminalSpaces.setdefault(
+                    air_terminal,
+                    {
+                        "SpaceID": spaceID,
+                        "Direction": direction,
+                        "AirFlow": designAirFlow / len(directionTerminals),
+                    },
+                )
+
+    return terminalSpaces
+
+
 #######################################
 #        The following functions (and class)
 #        are for keeping track of the
@@ -339,293 +431,295 @@ def airTerminalSpaceClashAnalyzer(
 #######################################
 
 
-class elementNode:
-    def __init__(
-        self,
-        IfcType: str,
-        airFlow: float,
-        element: ifcopenshell.entity_instance,
-        elementID: str,
-        prevElementID: str,
-        elementPorts: list,
-    ):
-        self.element: ifcopenshell.entity_instance = element
-        self.elementID: str = elementID
-        self.IfcType: str = IfcType
-        self.airFlow: float = airFlow  # in l/s
-        self.prevElementID: str = prevElementID
-        self.elementPorts = elementPorts
-        self.elementPressureLoss = 0  # in Pa - to be calculated
-        self.pathPressureLoss = 0  # in Pa - to be calculated
-
-        if element != None:
-            self.elementAreaSolid = self.element.Representation.Representations[
-                0
-            ].Items[0]
-
-            if self.elementAreaSolid.is_a() == "IfcMappedItem":
-                pass
-
-            else:
-                self.elementSweptArea = (
-                    self.element.Representation.Representations[0].Items[0].SweptArea
-                )
-
-                self.elementCrossArea, self.elementLength, self.elementDims = (
-                    self.getElementDims()
-                )
-
-        if not elementPorts:
-            self.portOrientations = []
-        elif len(elementPorts) == 2:
-            # inspect(elementPorts)
-            port1_matrix = (
-                ifcopenshell.geom.map_shape(
-                    settings=ifcopenshell.geom.settings(), inst=elementPorts[0]
-                )
-                .__getattribute__("matrix")
-                .components
-            )
-            port1 = [port1_matrix[0][3], port1_matrix[1][3], port1_matrix[2][3]]
-            port2_matrix = (
-                ifcopenshell.geom.map_shape(
-                    settings=ifcopenshell.geom.settings(), inst=elementPorts[1]
-                )
-                .__getattribute__("matrix")
-                .components
-            )
-            port2 = [port2_matrix[0][3], port2_matrix[1][3], port2_matrix[2][3]]
-            # find orientation vector
-            self.portOrientations = self.getOrientationVector(port1=port1, port2=port2)
-            if self.IfcType == "IfcDuctFitting":
-                # check if fitting is straight (self.portOrientations consists only of 1s and 0s) or not
-                if all(x in (0, 1) for x in self.portOrientations):
-                    self.fittingType = "Straight"
-                else:
-                    self.fittingType = "Bend"
-
-        elif len(elementPorts) > 2:
-            self.portOrientations = []
+@profiled()
+def build_downstream_tree(
+    element: ifcopenshell.entity_instance,
+    ifc_file: ifcopenshell.file,
+    system_name: str,
+    tree: Tree,
+    parent_id: str,
+    visited: set,
+    portPositions: dict | None = None,
+    graph: systemGraph | None = None,
+    network: networkStore | None = None,
+) -> Tree:
+    """
+    Build a tree structure of connected elements downstream from a given AHU using treelib.
+    Each node contains: GlobalId as identifier, and data with IfcType and airFlow.
+    portPositions (optional) are the precomputed port positions from getPortPositions().
+    graph (optional) is the systemGraph of the system from buildSystemGraphs(). Built here if not given.
+    network (optional) is the networkStore the elements are added to - the store of the tree root is used if not given.
 
+    The graph is walked depth first with an explicit stack (no recursion), in the same order as a recursive walk.
+    """
+    if graph is None:
+        graph = buildSystemGraphs(ifc_file, {system_name: element})[system_name]
+    if network is None:
+        network = tree[tree.root].data.network
+
+    def addNode(row: int, parent_id: str) -> str:
+        node_element = ifc_file.by_id(int(graph.elementIDs[row]))
+        visited.add(node_element.GlobalId)
+
+        # if parent_id is system_name, set tag to 'AHU' and only add child with same system_name
+        if parent_id == system_name:
+            tag = "AHU"
+            identifier = f"{system_name}_{node_element.GlobalId}"
         else:
-            self.portOrientations = []
-
-    def __str__(self):
-        return f"{self.IfcType} ({self.airFlow})"
-
-    def getOrientationVector(self, port1=None, port2=None) -> np.ndarray:
-        # create orientation vector from elementPorts
-        vector = np.array(port2) - np.array(port1)
-        norm = np.linalg.norm(vector)
-        if norm == 0:
-            return np.array([0, 0, 0])
-        return np.round(vector / norm, 2)
-
-    def getElementDims(self) -> tuple:
-        """
-        Only works for IfcDuctElements with IfcCircleProfileDef or IfcRectangleProfileDef
-        """
-        if self.element.is_a() not in ["IfcDuctSegment"]:
-            # print(f'Element {self.element.is_a()} has unsupported profile definition: {self.elementAreaSolid.is_a()}')
-            # inspect(self.elementAreaSolid)
-            return 0, 0, {}
-
-        if self.elementSweptArea.is_a() == "IfcCircleProfileDef":
-            crossArea = np.pi * (self.elementSweptArea.Radius / 1000) ** 2  # m2
-            elementLength = round(self.elementAreaSolid.Depth / 1000, 3)  # m
-            elementDims = {
-                "Diameter_m": round(self.elementSweptArea.Radius * 2 / 1000, 3)
-            }
+            tag = node_element.GlobalId
+            identifier = node_element.GlobalId
+
+        elementNodeData = network.addElement(
+            identifier=identifier,
+            parent=parent_id,
+            IfcType=node_element.is_a(),
+            element=node_element,
+            elementID=node_element.GlobalId,
+            prevElementID=parent_id,
+            portPositions=portPositions,
+        )
+        tree.create_node(
+            tag=tag, identifier=identifier, parent=parent_id, data=elementNodeData
+        )
+        return identifier
 
-        elif self.elementSweptArea.is_a() == "IfcRectangleProfileDef":
-            crossArea = (
-                min(
-                    self.elementSweptArea.XDim,
-                    self.elementSweptArea.YDim,
-                )
-                / 1000
-                * self.elementAreaSolid.Depth
-                / 1000
-            )  # m2
-            elementLength = (
-                max(
-                    self.elementSweptArea.XDim,
-                    self.elementSweptArea.YDim,
-                )
-                / 1000
-            )  # m
-            elementDims = {
-                "Width_m": round(
-                    min(
-                        self.elementSweptArea.XDim,
-                        self.elementSweptArea.YDim,
-                    )
-                    / 1000,
-                    3,
-                ),
-                "Height_m": round(self.elementAreaSolid.Depth / 1000, 3),
-            }
+    # stack of (row, identifier in tree, position in its list of downstream elements)
+    rootRow = graph.row(element)
+    stack = [[rootRow, addNode(rootRow, parent_id), 0]]
 
-        else:
-            # print(f'Element has unsupported profile definition: {self.elementAreaSolid.is_a()}')
-            # inspect(self.elementAreaSolid)
-            return 0, 0, {}
-
-        return round(crossArea, 3), round(elementLength, 3), elementDims
-
-    def pressureLossDuct(self):
-        """
-        Calculate pressure loss for duct elements.
-        """
-        if self.airFlow == 0:
-            return None
-
-        if self.IfcType == "IfcDuctSegment":
-            if self.elementCrossArea == 0 or self.elementLength == 0:
-                # invalid dimensions
-                return None
-
-            # get hydraulic diameter (D_h)
-            if self.elementDims.get("Diameter_m"):
-                # circular duct
-                D_h = (
-                    4
-                    * ((np.pi * self.elementDims.get("Diameter_m") ** 2) / 4)
-                    / (np.pi * self.elementDims.get("Diameter_m"))
-                )  # m
-
-            elif self.elementDims.get("Width_m") and self.elementDims.get("Height_m"):
-                # rectangular duct
-                D_h = (
-                    2
-                    * self.elementDims.get("Height_m")
-                    * self.elementDims.get("Width_m")
-                ) / (
-                    self.elementDims.get("Height_m") + self.elementDims.get("Width_m")
-                )  # m
-            else:
-                return None
+    while stack:
+        row, identifier, position = stack[-1]
+        downstream = graph.downstream(row)
+        if position >= len(downstream):
+            stack.pop()
+            continue
+        stack[-1][2] += 1
 
-            # Convert air flow from l/s to m3/s
-            Q = self.airFlow / 1000  # m3/s
+        child = int(downstream[position])
+        if ifc_file.by_id(int(graph.elementIDs[child])).GlobalId not in visited:
+            stack.append([child, addNode(child, identifier), 0])
 
-            # Calculate velocity (v = Q / A)
-            v = Q / self.elementCrossArea  # m/s
+    return tree
 
-            # Air properties at 20°C
-            rho = 1.2041  # kg/m3
-            mu = 1.81e-5  # Pa.s
 
-            # Calculate Reynolds number (Re = (rho * v * D_h) / mu)
-            Re = (rho * v * D_h) / mu
+@profiled()
+def aggregateSystemTree(systemsTree: Tree, leafAirFlows: dict) -> Tree:
+    """
+    Sum the air flows of the air terminals up through the system trees and accumulate the pressure losses.
 
-            # Determine friction factor (f) using the Blasius correlation for turbulent flow
-            if Re < 2000:
-                f_lambda = 64 / (Re + 1e-10)  # Laminar flow
-            else:
-                f_lambda = 0.3164 * Re**-0.25  # Turbulent flow
+    input:
+        systemsTree: Tree
+            Tree from getSystemTrees() (SystemsRoot -> systems -> AHU -> ... -> air terminals).
+        leafAirFlows: dict
+            Required air flow (l/s) of each leaf, keyed by node identifier. Leaves that are not in it get 0.
+
+    Runs on the networkStore of the tree, one tree level at a time:
+        1. Deepest level first: the air flow of an element is the sum of the air flows of its children.
+        2. The pressure loss of each element is calculated ONCE from its final air flow.
+        3. Top level first: pathPressureLoss = elementPressureLoss + pathPressureLoss of the parent.
+    The root and the system nodes (depth < 2) are not changed.
+    """
+    network = systemsTree[systemsTree.root].data.network
 
-            # dynamic pressure
-            # p_d = 1/2 * rho * v**2 # Pa/m
-            p_d = 0.5 * rho * v**2  # Pa/m
+    # 1. air flows
+    network.sumAirFlows(leafAirFlows, minDepth=2)
 
-            # Calculate pressure loss (ΔP = f * (p_d/D_h))
-            delta_P = f_lambda * (p_d / D_h)
+    # 2. pressure losses
+    network.pressureLosses(np.flatnonzero(network.depth[: len(network)] >= 2))
 
-            self.elementPressureLoss = round(
-                delta_P * self.elementLength, 2
-            )  # Store pressure loss in Pascals
+    # 3. path pressure losses
+    network.accumulatePathPressureLoss(minDepth=2)
 
-        elif self.IfcType == "IfcDuctFitting":
-            if "BU" in str(self.element.ObjectType):
-                # Bend
-                self.elementPressureLoss = 10  # Pa (assumed value)
+    return systemsTree
 
-            # if len(self.elementPorts) == 2:
-            # PRESSURE LOSS ESTIMATION OF DUCT FITTINGS HAVE NOT BEEN IMPLEMENTED YET!
-            # The pressure loss of all duct fittings are therefore assumed to be 0.2 Pa
-            else:
-                # not bend
-                self.elementPressureLoss = 10  # Pa (assumed value)
 
-        elif self.IfcType == "IfcAirTerminal":
-            # PRESSURE LOSS ESTIMATION OF AIR TERMINALS IS NOT IMPLEMENTED YET!
-            self.elementPressureLoss = 0.2  # Pa (assumed value)
+def createSystemsTree(ifc_file: ifcopenshell.file) -> Tree:
+    """Empty tree of systems: only the root, with a new networkStore for all elements."""
+    # values of all elements are stored in one networkStore, the tree nodes hold views (elementNode) of it
+    network = networkStore(ifc_file)
 
+    systemsTree = Tree()
+    systemsTree.create_node(
+        "Systems",
+        "SystemsRoot",
+        data=network.addElement(
+            identifier="SystemsRoot",
+            parent=None,
+            IfcType="Root",
+            elementID="",
+            prevElementID="",
+        ),
+    )  # give the root a data object with a .type attribute so show(data_property="type") works
+    return systemsTree
 
-def build_downstream_tree(
-    element: ifcopenshell.entity_instance,
+
+def addSystemTree(
+    systemsTree: Tree,
     ifc_file: ifcopenshell.file,
-    system_name: str,
-    tree: Tree,
-    parent_id: str,
-    visited: set,
+    systemName: str,
+    systemAHU: ifcopenshell.entity_instance,
+    portPositions: dict,
+    graph: systemGraph,
 ) -> Tree:
+    """Add a system node to the tree, with the elements of the system downstream from its AHU."""
+    network = systemsTree[systemsTree.root].data.network
+    visited = set()
+
+    # start at AHU and work downstream
+    # tree = build_downstream_tree(systemAHU, ifc_file, systemName, visited)
+    systemsTree.create_node(
+        systemName,
+        systemName,
+        parent="SystemsRoot",
+        data=network.addElement(
+            identifier=systemName,
+            parent="SystemsRoot",
+            IfcType=systemAHU.is_a(),
+        ),
+    )  # root node for the system
+
+    build_downstream_tree(
+        systemAHU,
+        ifc_file,
+        systemName,
+        systemsTree,
+        systemName,
+        visited,
+        portPositions,
+        graph,
+        network,
+    )
+    return systemsTree
+
+
+def mergeSystemTree(systemsTree: Tree, payload: dict) -> Tree:
+    """Add the nodes of a system built in another process (output from buildSystemPayloads()) to the tree."""
+    network = systemsTree[systemsTree.root].data.network
+    rows = network.appendPayload(payload)
+
+    # the rows are in the order the nodes were created, so parents are added before their children
+    for i, row in enumerate(rows.tolist()):
+        if payload["columns"]["parent"][i] < 0:
+            continue  # root
+        systemsTree.create_node(
+            tag=payload["tags"][i],
+            identifier=payload["identifiers"][i],
+            parent=network.identifiers[network.parent[row]],
+            data=elementNode(network, row),
+        )
+    return systemsTree
+
+
+#######################################
+#        Parallel system trees
+#        (each worker process opens the
+#        MEP file once)
+#######################################
+
+# minimum number of systems before the systems are built in worker processes (starting them takes time)
+PARALLEL_MIN_SYSTEMS = 8
+
+_workerFile = None
+
+
+def _openWorkerFile(ifc_path: str):
+    global _workerFile
+    _workerFile = ifcopenshell.open(ifc_path)
+
+
+def buildSystemPayloads(systemAHUs: dict, portPositions: dict) -> dict:
     """
-    Recursively build a tree structure of connected elements downstream from a given AHU using treelib.
-    Each node contains: GlobalId as identifier, and data with IfcType and airFlow.
+    Worker: build the trees of some systems in the ifc file opened by _openWorkerFile().
+
+    input:
+        systemAHUs: dict
+            System name as key and step id of its AHU as value.
+        portPositions: dict
+            Port positions (port step id -> [x, y, z]) of the elements in the systems.
+
+    Returns: A dictionary with system name as key and networkStore.payload() (+ "tags" of the tree nodes) as value.
     """
+    ifc_file = _workerFile
+    systemRoots = {
+        systemName: ifc_file.by_id(stepID) for systemName, stepID in systemAHUs.items()
+    }
+    systemGraphs = buildSystemGraphs(ifc_file, systemRoots)
+
+    payloads = {}
+    for systemName, systemAHU in systemRoots.items():
+        systemTree = createSystemsTree(ifc_file)
+        addSystemTree(
+            systemTree,
+            ifc_file,
+            systemName,
+            systemAHU,
+            portPositions,
+            systemGraphs[systemName],
+        )
+        network = systemTree[systemTree.root].data.network
+        payload = network.payload()
+        payload["tags"] = [
+            systemTree[identifier].tag for identifier in network.identifiers
+        ]
+        payloads[systemName] = payload
+    return payloads
 
-    # # STOP if already visited
-    # if element.GlobalId in visited:
-    #     return None
-
-    visited.add(element.GlobalId)
-
-    # # STOP if already created in the tree
-    # if identifier in tree.nodes:
-    #     return None
-
-    # inspect(ifcopenshell.geom.ShapeType(element))
-    elementNodeData = elementNode(
-        element=element,
-        elementID=element.GlobalId,
-        IfcType=element.is_a(),
-        airFlow=0,
-        prevElementID=parent_id,
-        elementPorts=ifcopenshell.util.system.get_ports(element),
-    )  # Placeholder for air flow value
-
-    # if parent_id is system_name, set tag to 'AHU' and only add child with same system_name
-    if parent_id == system_name:
-        tag = "AHU"
-        identifier = f"{system_name}_{element.GlobalId}"
-        new_parent_id = identifier
-    else:
-        tag = element.GlobalId
-        identifier = element.GlobalId
-        new_parent_id = identifier
 
-    tree.create_node(
-        tag=tag, identifier=identifier, parent=parent_id, data=elementNodeData
-    )
+@profiled()
+def buildSystemsParallel(
+    ifc_file: ifcopenshell.file,
+    ifc_path: str,
+    identifiedSystems: dict,
+    systemAHUs: dict,
+    portPositions: dict,
+    workers: int,
+) -> dict:
+    """
+    Build the trees of all systems in a pool of worker processes.
 
-    # Get all downstream connections
-    # CHANGE THIS TO: Flow direction!!! is more reliable!!
-    if "VI" in system_name:
-        downstream = ifcopenshell.util.system.get_connected_from(element)
-    elif "VU" in system_name:
-        downstream = ifcopenshell.util.system.get_connected_to(element)
-    else:
-        raise ValueError(f"Unable to determine flow direction for {system_name}")
-
-    # Keep only elements in the same system
-    downstream = [
-        el
-        for el in downstream
-        if system_name
-        in [sys.Name for sys in ifcopenshell.util.system.get_element_systems(el)]
-    ]
+    The systems are split into one shard per worker (largest systems first, each to the shard with the fewest elements).
+    Each worker opens ifc_path once and gets the AHUs and port positions of its systems.
 
-    for child in downstream:
-        if child.GlobalId not in visited:
-            build_downstream_tree(
-                child, ifc_file, system_name, tree, new_parent_id, visited
+    Returns: A dictionary with system name as key and the payload from buildSystemPayloads() as value.
+    """
+    shards = [{"systems": {}, "ports": {}, "elementCount": 0} for _ in range(workers)]
+    for systemName in sorted(
+        identifiedSystems,
+        key=lambda name: identifiedSystems[name]["ElementCount"],
+        reverse=True,
+    ):
+        shard = min(shards, key=lambda shard: shard["elementCount"])
+        shard["systems"][systemName] = systemAHUs[systemName].id()
+        shard["elementCount"] += identifiedSystems[systemName]["ElementCount"]
+
+    # only send the port positions of the elements in each shard
+    portShards = {}
+    for shard in shards:
+        for systemName in shard["systems"]:
+            portShards[systemName] = shard["ports"]
+    for systemName, info in identifiedSystems.items():
+        for el in info.get("ElementIDs", []):
+            portShards[systemName].update(
+                (port.id(), portPositions[port.id()])
+                for port in ifcopenshell.util.system.get_ports(ifc_file.by_id(el))
+                if port.id() in portPositions
             )
 
-    return tree
+    payloads = {}
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_openWorkerFile, initargs=(ifc_path,)
+    ) as executor:
+        futures = [
+            executor.submit(buildSystemPayloads, shard["systems"], shard["ports"])
+            for shard in shards
+            if shard["systems"]
+        ]
+        for future in futures:
+            payloads.update(future.result())
+    return payloads
 
 
+@profiled()
 def getSystemTrees(
     console: Console,
     identifiedSystems: dict,
@@ -633,148 +727,139 @@ def getSystemTrees(
     space_file: ifcopenshell.file,
     spaceTerminals: dict,
     showChoice=str,
+    terminalSpaces: dict | None = None,
+    workers: int | None = None,
+    ifc_path: str | None = None,
+    cachedSystems: dict | None = None,
 ) -> tuple[Tree, ifcopenshell.file]:
     """
     Create tree structures for each identified system showing how elements are connected.
+
+    terminalSpaces (optional) is the output from buildTerminalSpaceIndex(). Built from spaceTerminals if not given.
+    workers (optional) is the number of worker processes the systems are built in (defaults to the number of CPUs).
+    ifc_path (optional) is the path of ifc_file on disk, opened by the workers (defaults to the path of its geometry cache).
+    The systems are only built in parallel if there are at least PARALLEL_MIN_SYSTEMS systems and the path is known,
+    otherwise they are built one by one in this process. The result is the same.
+    cachedSystems (optional) are systems from a previous run that are reused instead of built again
+    (system name -> payload with the same step ids as ifc_file, see IncrementalAnalysis.py). Air flows and pressure losses
+    are always recalculated.
     """
-    systemsTree = Tree()
-    systemsTree.create_node(
-        "Systems",
-        "SystemsRoot",
-        data=elementNode(
-            IfcType="Root",
-            airFlow=0,
-            element=None,
-            elementID="",
-            prevElementID="",
-            elementPorts=None,
-        ),
-    )  # give the root a data object with a .type attribute so show(data_property="type") works
+    if terminalSpaces is None:
+        terminalSpaces = buildTerminalSpaceIndex(space_file, spaceTerminals)
 
+    # find AHU in each system
+    systemAHUs = {}
     for systemName, info in identifiedSystems.items():
-        visited = set()
-
-        # find AHU in system
         systemAHU_ID = [
             el
             for el in info.get("ElementIDs", [])
             if ifc_file.by_id(el).is_a("IfcUnitaryEquipment")
             or ("Geniox" in str(ifc_file.by_id(el).ObjectType))
         ]
-        # start at AHU and work downstream
-        systemAHU = ifc_file.by_id(systemAHU_ID[0])
+        systemAHUs[systemName] = ifc_file.by_id(systemAHU_ID[0])
+
+    # systems that are not reused from cachedSystems
+    buildSystems = {
+        systemName: info
+        for systemName, info in identifiedSystems.items()
+        if systemName not in (cachedSystems or {})
+    }
+
+    # port positions of all system elements in one go (reused from the geometry cache if one is attached)
+    portPositions = getPortPositions(
+        ifc_file,
+        [
+            port
+            for info in buildSystems.values()
+            for el in info.get("ElementIDs", [])
+            for port in ifcopenshell.util.system.get_ports(ifc_file.by_id(el))
+        ],
+    )
 
-        # tree = build_downstream_tree(systemAHU, ifc_file, systemName, visited)
-        subTree = systemsTree.create_node(
-            systemName,
-            systemName,
-            parent="SystemsRoot",
-            data=elementNode(
-                IfcType=systemAHU.is_a(),
-                airFlow=0,
-                element=None,
-                elementID=None,
-                prevElementID=None,
-                elementPorts=None,
-            ),
-        )  # root node for the system
-
-        build_downstream_tree(
-            systemAHU, ifc_file, systemName, systemsTree, systemName, visited
+    if ifc_path is None and getGeometryCache(ifc_file) is not None:
+        ifc_path = getGeometryCache(ifc_file).ifc_path
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(buildSystems))
+
+    systemsTree = createSystemsTree(ifc_file)
+    if (
+        workers > 1
+        and ifc_path is not None
+        and len(buildSystems) >= PARALLEL_MIN_SYSTEMS
+    ):
+        # build the systems in worker processes (merged into the tree below)
+        systemPayloads = buildSystemsParallel(
+            ifc_file, ifc_path, buildSystems, systemAHUs, portPositions, workers
+        )
+        systemGraphs = {}
+    else:
+        systemPayloads = {}
+        # resolve all port connections and system groupings in one sweep
+        systemGraphs = buildSystemGraphs(
+            ifc_file,
+            {systemName: systemAHUs[systemName] for systemName in buildSystems},
         )
 
-    # get all paths to air terminals (leaves)
-    all_paths = systemsTree.paths_to_leaves()
-    # console.print([len(path) for path in all_paths])
-    # all_paths = [path[2:] for path in all_paths_dirty if len(path) > 2]
+    # add the systems in the order of identifiedSystems
+    for systemName in identifiedSystems:
+        if systemName in systemGraphs:
+            addSystemTree(
+                systemsTree,
+                ifc_file,
+                systemName,
+                systemAHUs[systemName],
+                portPositions,
+                systemGraphs[systemName],
+            )
+        else:
+            mergeSystemTree(
+                systemsTree,
+                (
+                    systemPayloads[systemName]
+                    if systemName in systemPayloads
+                    else cachedSystems[systemName]
+                ),
+            )
+
+    # required air flow of each air terminal (leaf), and the Psets written to the terminals
+    leafAirFlows = {}
+    terminalPsets = {}
 
     # inspect(identifiedSystems.keys())
-    for path in all_paths:
-        pathTerminal = path[-1]
+    for leaf in systemsTree.leaves():
+        pathTerminal = leaf.identifier
         requiredAirFlow = 0
 
         if pathTerminal in list(identifiedSystems.keys()):
             inspect(pathTerminal)
             pass
 
-        if (
-            "VI"
-            in ifcopenshell.util.system.get_element_systems(
-                ifc_file.by_id(pathTerminal)
-            )[0].Name
-        ):
-            # Supply systems
-            # find air terminal in spaceAirFlows to get required air flow
-            for spaceID in spaceTerminals.keys():
-                if pathTerminal in [
-                    at for at in spaceTerminals[spaceID].get("Supply", [])
-                ]:
-                    # inspect(spaceTerminals[spaceID])
-                    requiredAirFlow = ifcopenshell.util.element.get_pset(
-                        element=space_file.by_guid(spaceID),
-                        name="Pset_SpaceAirHandlingDimensioning",
-                        prop="DesignAirFlow",
-                    ) / len(spaceTerminals[spaceID].get("Supply", []))
-
-                    terminalPset = ifcopenshell.api.pset.add_pset(
-                        file=ifc_file,
-                        product=ifc_file.by_guid(pathTerminal),
-                        name="Pset_AirTerminalOccurence",
-                    )
-                    ifcopenshell.api.pset.edit_pset(
-                        file=ifc_file,
-                        pset=terminalPset,
-                        properties={"AirFlowRate": requiredAirFlow},
-                    )
-
-                    break
-        elif (
-            "VU"
-            in ifcopenshell.util.system.get_element_systems(
-                ifc_file.by_id(pathTerminal)
-            )[0].Name
-        ):
-            # Return systems
-            for spaceID in spaceTerminals.keys():
-                if pathTerminal in [
-                    at for at in spaceTerminals[spaceID].get("Return", [])
-                ]:
-                    requiredAirFlow = ifcopenshell.util.element.get_pset(
-                        element=space_file.by_guid(spaceID),
-                        name="Pset_SpaceAirHandlingDimensioning",
-                        prop="DesignAirFlow",
-                    ) / len(spaceTerminals[spaceID].get("Return", []))
-
-                    terminalPset = ifcopenshell.api.pset.add_pset(
-                        file=ifc_file,
-                        product=ifc_file.by_guid(pathTerminal),
-                        name="Pset_AirTerminalOccurence",
-                    )
-                    ifcopenshell.api.pset.edit_pset(
-                        file=ifc_file,
-                        pset=terminalPset,
-                        properties={"AirFlowRate": requiredAirFlow},
-                    )
-
-                    break
-
-        # assign requiredAirFlow to all elements in path EXCEPT the root (systemName)
-        for node_id in path[2:]:
-            systemsTree[node_id].data.airFlow += requiredAirFlow
-            systemsTree[
-                node_id
-            ].data.pressureLossDuct()  # update pressure loss based on new air flow
-
-            if systemsTree[node_id].data.prevElementID != None:
-                parent_pl = systemsTree[
-                    systemsTree[node_id].data.prevElementID
-                ].data.pathPressureLoss
-
-                systemsTree[node_id].data.pathPressureLoss = round(
-                    systemsTree[node_id].data.elementPressureLoss + parent_pl, 2
-                )
+        # supply or return system?
+        systemName = ifcopenshell.util.system.get_element_systems(
+            ifc_file.by_id(pathTerminal)
+        )[0].Name
+        if "VI" in systemName:
+            direction = "Supply"
+        elif "VU" in systemName:
+            direction = "Return"
+        else:
+            direction = None
+
+        # find air terminal in terminalSpaces to get required air flow
+        terminalSpace = terminalSpaces.get(pathTerminal)
+        if terminalSpace is not None and terminalSpace["Direction"] == direction:
+            requiredAirFlow = terminalSpace["AirFlow"]
+
+            terminalPsets[ifc_file.by_guid(pathTerminal)] = {
+                "Pset_AirTerminalOccurence": {"AirFlowRate": requiredAirFlow}
+            }
+
+        leafAirFlows[pathTerminal] = requiredAirFlow
+
+    writePsets(ifc_file, terminalPsets)
 
-            # if systemsTree.data.IfcType == 'IfcDuctSegment':
+    aggregateSystemTree(systemsTree, leafAirFlows)
 
     if showChoice == "y":
         systemsTree.show(
@@ -784,6 +869,7 @@ def getSystemTrees(
     return systemsTree, ifc_file
 
 
+@profiled()
 def buildErrorDict(
     missingAHUsystems: dict, unassignedTerminals: dict, ifc_file: ifcopenshell.file
 ) -> dict:
@@ -849,6 +935,7 @@ def buildErrorDict(
     return elements_dict
 
 
+@profiled()
 def modulePipeline(console, MEP_file, space_file):
     # first function
     identifiedSystems, missingAHUsystems, table_AHUs = ahuFinder(
@@ -863,6 +950,7 @@ def modulePipeline(console, MEP_file, space_file):
         identifiedSystems=identifiedSystems,
         space_file_name="25-10-D-ARCH.ifc",
     )
+    terminalSpaces = buildTerminalSpaceIndex(space_file, spaceTerminals)
 
     systemsTree, ifc_file_new = getSystemTrees(
         console=console,
@@ -870,6 +958,7 @@ def modulePipeline(console, MEP_file, space_file):
         ifc_file=MEP_file,
         space_file=space_file,
         spaceTerminals=spaceTerminals,
+        terminalSpaces=terminalSpaces,
     )
 
     return (
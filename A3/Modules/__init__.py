@@ -6,3 +6,18 @@ from .BcfGenerator import *
 from .VentilationSystemAnalyzer import *
 from .menu import *
 from .setupFunctions import *
+from .SpatialIndex import *
+from .SystemGraph import *
+from .NetworkStore import *
+from .FittingLoss import *
+from .BatchRunner import *
+from .IfcScanner import *
+from .ModelSession import *
+from .IncrementalAnalysis import *
+from .PsetWriter import *
+from .PropertyIndex import *
+from .OccupancyIndex import *
+from .IssueClustering import *
+from .SnapshotRenderer import *
+from .Profiler import *
+from .SyntheticModelGenerator import *
@@ -6,31 +6,38 @@ from .setupFunctions import choose_ifc_pair_from_directory, choose_ifcElementTyp
 from .AirFlowEstimator import *
 from .VentilationSystemAnalyzer import *
 from .BcfGenerator import *
+from .ModelSession import modelSession
 from rich.panel import Panel
 from rich.table import Table
 from rich.prompt import Prompt, Confirm
 
 
-def menuFilePicker(console):
+def menuFilePicker(console, session: modelSession | None = None):
     # ask user to choose IFC file pair from directory
 
     ifc_filePath, ifc_SpacePath = choose_ifc_pair_from_directory(
         console=console, directory="A3/ifcFiles", extension=".ifc"
     )
+    if session is None:
+        session = modelSession()
 
+    # parsed models are reused from the session if the files have not changed
     if ifc_filePath != None:
         # console.print(ifc_filePath)
-        ifc_file = ifcopenshell.open(ifc_filePath)
+        ifc_file = session.open(ifc_filePath)
 
     else:
         ifc_file = None
-    space_file_beforeCheck = ifcopenshell.open(ifc_SpacePath)
+    space_file_beforeCheck = session.open(ifc_SpacePath)
 
-    return ifc_filePath or None, ifc_file or None, space_file_beforeCheck
+    return ifc_filePath or None, ifc_file or None, ifc_SpacePath, space_file_beforeCheck
 
 
 def menuIFCAnalysis(
-    console: Console, MEP_file: ifcopenshell.file | None, Space_file: ifcopenshell.file
+    console: Console,
+    MEP_file: ifcopenshell.file | None,
+    Space_file: ifcopenshell.file,
+    spaceIndex=None,
 ):
     ifc_file_Spaces, table_airflows = spaceAirFlowCalculator(
         console=console, space_file=Space_file, building_category=None
@@ -62,8 +69,10 @@ def menuIFCAnalysis(
                     space_file=ifc_file_Spaces,
                     identifiedSystems=identifiedSystems,
                     space_file_name="25-10-D-ARCH.ifc",
+                    spaceIndex=spaceIndex,
                 )
             )
+            terminalSpaces = buildTerminalSpaceIndex(ifc_file_Spaces, spaceTerminals)
 
         with console.status(
             status="Assigning air flows and pressure losses to air terminals..."
@@ -74,6 +83,7 @@ def menuIFCAnalysis(
                 ifc_file=MEP_file,
                 space_file=ifc_file_Spaces,
                 spaceTerminals=spaceTerminals,
+                terminalSpaces=terminalSpaces,
                 showChoice="n",
             )
 
@@ -127,6 +137,10 @@ def bigMenu(console):
     ARCH_path = None
     MEP_file = None
     ARCH_file = None
+    spaceIndex = None  # bounding box tree of the spaces in ARCH_file
+
+    # parsed models, kept between file selections and analysis runs
+    session = modelSession()
 
     # results / analysis state
     analysis_results = None
@@ -210,10 +224,20 @@ def bigMenu(console):
         # -----------------------------------------------------
         if choice == "1":
             console.print("\n[cyan]Selecting files...[/cyan]")
-            filePathMEP, MEP_file_new, ARCH_file_new = menuFilePicker(console)
+            filePathMEP, MEP_file_new, filePathARCH, ARCH_file_new = menuFilePicker(
+                console, session
+            )
             MEP_path = filePathMEP
+            ARCH_path = filePathARCH
             MEP_file = MEP_file_new
+
+            # the space geometry only changes with the ARCH file, so the space index is built once here
+            if ARCH_file_new is not ARCH_file:
+                spaceIndex = None
             ARCH_file = ARCH_file_new
+            if MEP_file and spaceIndex is None:
+                with console.status(status="Indexing spaces...", spinner="dots"):
+                    spaceIndex = buildSpaceIndex(console=console, space_file=ARCH_file)
 
             # reset states
             analysis_results = None
@@ -231,7 +255,13 @@ def bigMenu(console):
                 continue
 
             console.print("[cyan]Running analysis...[/cyan]")
-            result = menuIFCAnalysis(console, MEP_file, ARCH_file)
+            # working copies: the Psets added by the previous run are rolled back first
+            MEP_file = session.checkout(MEP_path) if MEP_path else None
+            ARCH_file_run = session.checkout(ARCH_path)
+            if ARCH_file_run is not ARCH_file:
+                spaceIndex = None  # the ARCH file has changed on disk
+            ARCH_file = ARCH_file_run
+            result = menuIFCAnalysis(console, MEP_file, ARCH_file, spaceIndex)
 
             # unpack based on whether MEP was provided
             if MEP_file is None:
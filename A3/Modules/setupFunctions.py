@@ -9,7 +9,8 @@ from ifcopenshell.util.element import copy_deep
 import ifcopenshell.util.shape
 from ifcopenshell.util.file import IfcHeaderExtractor
 
-# from .functions import get_element_bbox
+from .GeometryEngine import bboxTable, get_element_bbox, getElementBBoxes
+from .IfcScanner import scanIfcFiles
 from bcf.v3.bcfxml import BcfXml
 import bcf.v3.visinfo
 import bcf.v3.model
@@ -18,6 +19,23 @@ import sys
 import uuid
 
 
+def group_ifc_files(files: list[str], extension=".ifc") -> dict[str, dict]:
+    """Group file names by their prefix before -MEP or -ARCH: {prefix: {"MEP": file, "ARCH": file}}."""
+    groups = {}
+    for f in files:
+        name = f[: -len(extension)]
+        if name.endswith("-MEP"):
+            prefix = name.replace("-MEP", "")
+            groups.setdefault(prefix, {})["MEP"] = f
+        elif name.endswith("-ARCH"):
+            prefix = name.replace("-ARCH", "")
+            groups.setdefault(prefix, {})["ARCH"] = f
+        else:
+            # Other IFC files not following the pattern can still be listed
+            groups.setdefault(name, {})
+    return groups
+
+
 def choose_ifc_pair_from_directory(
     console: Console, directory: str, extension=".ifc"
 ) -> tuple[str | None, str | None]:
@@ -39,18 +57,7 @@ def choose_ifc_pair_from_directory(
         sys.exit(1)
 
     # Group files by prefix before -MEP or -ARCH
-    groups = {}
-    for f in files:
-        name = f[: -len(extension)]
-        if name.endswith("-MEP"):
-            prefix = name.replace("-MEP", "")
-            groups.setdefault(prefix, {})["MEP"] = f
-        elif name.endswith("-ARCH"):
-            prefix = name.replace("-ARCH", "")
-            groups.setdefault(prefix, {})["ARCH"] = f
-        else:
-            # Other IFC files not following the pattern can still be listed
-            groups.setdefault(name, {})
+    groups = group_ifc_files(files, extension)
 
     # Display in a table
     table = Table(
@@ -61,6 +68,18 @@ def choose_ifc_pair_from_directory(
     table.add_column("Prefix", style="green")
     table.add_column("MEP File", style="yellow")
     table.add_column("ARCH File", style="magenta")
+    table.add_column("Spaces", justify="right")
+    table.add_column("Systems", justify="right")
+    table.add_column("Air Terminals", justify="right")
+
+    # header and entity counts of all files, without opening them (cached until the files change)
+    scans = scanIfcFiles([os.path.join(directory, f) for f in files])
+
+    def entityCount(prefix: str, fileType: str, IfcType: str) -> int:
+        if fileType not in groups[prefix]:
+            return 0
+        scan = scans.get(os.path.join(directory, groups[prefix][fileType]))
+        return scan["entityCounts"][IfcType] if scan else 0
 
     prefixes = list(groups.keys())
     for i, prefix in enumerate(prefixes, start=1):
@@ -68,7 +87,18 @@ def choose_ifc_pair_from_directory(
         arch = (
             "✅ " + groups[prefix]["ARCH"] if "ARCH" in groups[prefix] else "❌ Missing"
         )
-        table.add_row(str(i), prefix, mep, arch)
+        table.add_row(
+            str(i),
+            prefix,
+            mep,
+            arch,
+            str(
+                entityCount(prefix, "ARCH", "IfcSpace")
+                or entityCount(prefix, "MEP", "IfcSpace")
+            ),
+            str(entityCount(prefix, "MEP", "IfcDistributionSystem")),
+            str(entityCount(prefix, "MEP", "IfcAirTerminal")),
+        )
 
     console.print(
         "\n[bold yellow]Please make sure to select a MEP/ARCH file pair or just an ARCH file from the list below:[/bold yellow]"
@@ -107,12 +137,7 @@ def choose_ifc_pair_from_directory(
 
         # if arch file missing, check if spaces are in mep file
         if "ARCH" not in groups[selected_prefix]:
-            mep_file_path = os.path.join(
-                directory, groups[selected_prefix].get("MEP", "")
-            )
-            mep_ifc = ifcopenshell.open(mep_file_path)
-            spaces = mep_ifc.by_type("IfcSpace")
-            if not spaces:
+            if not entityCount(selected_prefix, "MEP", "IfcSpace"):
                 console.print(
                     f"[red]The selected ARCH file is missing and no IfcSpaces found in the MEP file '{groups[selected_prefix].get('MEP', '')}'. Please select a different pair.[/red]"
                 )
@@ -238,12 +263,37 @@ def iso_now() -> str:
     )
 
 
+def getLevelElevation(
+    ifc_file: ifcopenshell.file, element: ifcopenshell.entity_instance
+) -> tuple[float | bool | None, str | None]:
+    rels = ifc_file.get_inverse(element)
+    for rel in rels:
+        if rel.is_a("IfcRelContainedInSpatialStructure"):
+            if rel.RelatingStructure.is_a("IfcBuildingStorey"):
+                return (
+                    rel.RelatingStructure.Elevation / 1000,
+                    rel.RelatingStructure.Name,
+                )  # Convert mm to m
+            if rel.RelatingStructure.is_a("IfcBuilding"):
+                return (
+                    False,
+                    rel.RelatingStructure.Name,
+                )  # assigned to the building, not a storey: no level elevation (False)
+
+    # not contained in a storey or building
+    return None, None
+
+
 def cameraSetup(
-    element: ifcopenshell.entity_instance, ifc_file: ifcopenshell.file
+    element: ifcopenshell.entity_instance,
+    ifc_file: ifcopenshell.file,
+    bboxes: bboxTable | None = None,
 ) -> tuple[list[float], list[float], list[float]]:
     if isinstance(element, list):
         element = element[0]
-    bbox = get_element_bbox(element)
+    bbox = bboxes.get(element) if bboxes is not None else None
+    if bbox is None:
+        bbox = get_element_bbox(element)
     center = [(bbox["min"][i] + bbox["max"][i]) / 2 for i in range(3)]
 
     camera_view_point = [
@@ -270,6 +320,7 @@ def add_issue(
     ifc_file: ifcopenshell.file,
     bcf_path: str,
     bcf_zip: bcf.v3.visinfo.ZipFileInterface,
+    bboxes: bboxTable | None = None,
 ) -> None:
     th = bcf_obj.add_topic(
         title,
@@ -287,7 +338,7 @@ def add_issue(
         visinfo_handler.set_selected_elements([element])
 
     camera_view_point, camera_direction, camera_up_vector = cameraSetup(
-        element=element, ifc_file=ifc_file
+        element=element, ifc_file=ifc_file, bboxes=bboxes
     )
     visinfo_handler.visualization_info.perspective_camera = (
         bcf.v3.visinfo.build_camera_from_vectors(
@@ -332,6 +383,23 @@ def generate_bcf_from_errors(
     bcf_project = BcfXml.create_new(project_name=header_info.get("name"))
     bcf_project.save(filename=output_bcf, keep_open=True)
     bcf_zip = bcf_project._zip_file
+
+    # bounding boxes of all elements the cameras look at, tessellated in one pass
+    bboxes = getElementBBoxes(
+        ifc_file,
+        [guid for elements in misplacedElements.values() for guid in elements]
+        + [
+            info["ElementIDs"][0]
+            for info in missingAHUsystems.values()
+            if info["ElementIDs"]
+        ]
+        + [
+            element
+            for element_list in unassignedTerminals.values()
+            for element in element_list
+        ],
+    )
+
     # misplaced elements
     console.print("🧱 Adding misplaced element topics...")
     for error_category, elements in misplacedElements.items():
@@ -364,6 +432,7 @@ def generate_bcf_from_errors(
                 ifc_file=ifc_file,
                 bcf_path=output_bcf,
                 bcf_zip=bcf_zip,
+                bboxes=bboxes,
             )
 
     # systems missing AHUs
@@ -390,6 +459,7 @@ def generate_bcf_from_errors(
                 ifc_file=ifc_file,
                 bcf_path=output_bcf,
                 bcf_zip=bcf_zip,
+                bboxes=bboxes,
             )
             # viewpoint.save()
 
@@ -409,6 +479,7 @@ def generate_bcf_from_errors(
                 ifc_file=ifc_file,
                 bcf_path=output_bcf,
                 bcf_zip=bcf_zip,
+                bboxes=bboxes,
             )
 
     # save the BCF file
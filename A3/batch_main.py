@@ -0,0 +1,108 @@
+########################################################
+"""
+AIR FLOW ESTIMATOR / VENTILATION SYSTEM ANALYZER / BCF GENERATOR - BATCH MODE
+
+Version: 17/10/26
+
+Runs the same analysis as main.py on every MEP/ARCH file pair in a directory tree, without any user input
+(i.e. for nightly checks of many projects).
+
+How to use:
+- Place the file pairs (xxx-MEP.ifc and xxx-ARCH.ifc) in a folder (subfolders are searched as well)
+- Run:
+    python A3/batch_main.py A3/ifcFiles --output A3/outputFiles/batch --workers 8
+- Each pair gets a folder in the output folder with a BCF file, the analyzed IFC files and a log.
+  summary.json and summary.csv contain the results and timings of all pairs.
+- Add --snapshots to include a rendered image of each issue in the BCF files (--snapshot-workers N renders
+  them in N processes per pair).
+
+The exit code is 1 if any pair failed.
+
+Authors: s214310, s203493, s201348
+
+"""
+
+########################################################
+
+from Modules.BatchRunner import runBatch
+
+import argparse
+import sys
+from datetime import datetime
+from rich.console import Console
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Analyse all MEP/ARCH IFC file pairs in a directory tree."
+    )
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default="A3/ifcFiles",
+        help="folder with -MEP.ifc/-ARCH.ifc pairs",
+    )
+    parser.add_argument(
+        "--output", default="A3/outputFiles/batch", help="output folder"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of pairs analysed at the same time (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--no-ifc",
+        action="store_true",
+        help="do not write the analyzed IFC files",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only rebuild the ventilation systems that changed since the previous run",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time the functions of each step (profile_trace.json/profile.json per pair)",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="like --profile, and also record the peak memory of each step (slower)",
+    )
+    parser.add_argument(
+        "--snapshots",
+        action="store_true",
+        help="add a PNG snapshot of each viewpoint to the BCF files (rendered on the CPU)",
+    )
+    parser.add_argument(
+        "--snapshot-workers",
+        type=int,
+        default=1,
+        help="number of processes the snapshots of each pair are rendered in (default: 1)",
+    )
+    args = parser.parse_args()
+
+    start_time = datetime.now()
+    console = Console()
+
+    summaries, table_Batch = runBatch(
+        console=console,
+        directory=args.directory,
+        outputDir=args.output,
+        workers=args.workers,
+        writeIfc=not args.no_ifc,
+        incremental=args.incremental,
+        profile=args.profile,
+        profileMemory=args.profile_memory,
+        snapshots=args.snapshots,
+        snapshotWorkers=args.snapshot_workers,
+    )
+    console.print(table_Batch)
+
+    elapsed_time = datetime.now() - start_time
+    console.print(
+        f"\n[bold cyan]Done!\nElapsed time: {round(elapsed_time.total_seconds(), 2)} seconds[/bold cyan]\n"
+    )
+
+    sys.exit(1 if any(summary["status"] == "failed" for summary in summaries) else 0)
@@ -0,0 +1,401 @@
+########################################################
+"""
+PIPELINE BENCHMARK
+
+Version: 17/10/26
+
+Times each stage of the analysis (the steps of main.py / modulePipeline()) and the BCF export on synthetic
+MEP/ARCH models (Modules/SyntheticModelGenerator.py) of increasing size, to see how the run time scales with the
+model size and to catch performance regressions.
+
+Stages:
+    open            ifcopenshell.open() of both files
+    airFlows        spaceAirFlowCalculator() (occupancy, air flows and Psets of the spaces)
+    ahuFinder       ahuFinder()
+    clashAnalysis   airTerminalSpaceClashAnalyzer() and buildTerminalSpaceIndex()
+    systemTrees     getSystemTrees() (system graphs, air flows and pressure losses)
+    bcfClustered    BCF export with every air terminal as an issue (clustered topics)
+    bcfTopics       BCF export with every air terminal as an issue (one topic per terminal)
+
+The results of each run are appended to benchmarks/results/pipelineBenchmark.jsonl (with the git commit and date),
+and compared with the last run of the same model: stages that got more than --threshold slower are marked as
+regressions (and the script exits with status 1 with --fail-on-regression). The timings depend on the machine, so
+the results folder is not tracked by git (see .gitignore) - use --results to keep the history somewhere else, i.e. on
+the machine that runs the nightly benchmark. The scaling table shows the time of
+each stage per size and the scaling exponent (time ~ elements^exponent, fitted over the sizes).
+
+How to use:
+    python A3/benchmarks/pipelineBenchmark.py --sizes 1000 10000
+    python A3/benchmarks/pipelineBenchmark.py --sizes 1000 10000 100000 1000000 --models A3/benchmarks/models
+    python A3/benchmarks/pipelineBenchmark.py --sizes 10000 --systems 8 --branching 3 --terminals 2 --profile
+    python A3/benchmarks/pipelineBenchmark.py --sizes 10000 --direct-fittings
+
+The models are generated in a temporary folder, or in --models (and reused from there on the next run).
+The pipeline is run once on a small model before the timed runs, so one-time start-up costs are not counted.
+
+"""
+
+########################################################
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules.AirFlowEstimator import spaceAirFlowCalculator
+from Modules.BcfGenerator import old_generate_bcf_from_errors
+from Modules.Profiler import profiling, reportProfile
+from Modules.SyntheticModelGenerator import (
+    generateSyntheticModels,
+    syntheticModelParameters,
+)
+from Modules.VentilationSystemAnalyzer import (
+    ahuFinder,
+    airTerminalSpaceClashAnalyzer,
+    buildTerminalSpaceIndex,
+    getSystemTrees,
+)
+
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import ifcopenshell
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+STAGES = [
+    "open",
+    "airFlows",
+    "ahuFinder",
+    "clashAnalysis",
+    "systemTrees",
+    "bcfClustered",
+    "bcfTopics",
+]
+# slowdowns smaller than this are timing noise, not regressions
+MIN_REGRESSION_SECONDS = 0.05
+RESULTS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "results", "pipelineBenchmark.jsonl"
+)
+
+
+def gitCommit() -> str:
+    """Short hash of the checked out commit (with "+" if there are uncommitted changes)."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=repo,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=repo,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("+" if dirty else "")
+
+
+def modelPaths(modelDir: str, parameters: dict) -> tuple[str, str]:
+    name = "synthetic_" + "_".join(
+        f"{key}{value}" for key, value in sorted(parameters.items())
+    )
+    return (
+        os.path.join(modelDir, f"{name}-MEP.ifc"),
+        os.path.join(modelDir, f"{name}-ARCH.ifc"),
+    )
+
+
+def runPipeline(
+    mepPath: str, archPath: str, outputDir: str, workers: int | None
+) -> tuple[dict, int]:
+    """Time of each stage (seconds) and the number of MEP elements of one run of the pipeline."""
+    console = Console(quiet=True)
+    times = {}
+
+    @contextlib.contextmanager
+    def stage(name: str):
+        start = time.perf_counter()
+        yield
+        times[name] = time.perf_counter() - start
+
+    with stage("open"):
+        mep_file = ifcopenshell.open(mepPath)
+        space_file = ifcopenshell.open(archPath)
+
+    with stage("airFlows"):
+        space_file, _ = spaceAirFlowCalculator(
+            console=console, space_file=space_file, building_category="II"
+        )
+
+    with stage("ahuFinder"):
+        identifiedSystems, missingAHUsystems, _ = ahuFinder(
+            console=console, ifc_file=mep_file, targetSystems="IfcDistributionSystem"
+        )
+
+    with stage("clashAnalysis"):
+        spaceTerminals, unassignedTerminals, _ = airTerminalSpaceClashAnalyzer(
+            console=console,
+            MEP_file=mep_file,
+            space_file=space_file,
+            identifiedSystems=identifiedSystems,
+            space_file_name=os.path.basename(archPath),
+        )
+        terminalSpaces = buildTerminalSpaceIndex(space_file, spaceTerminals)
+
+    with stage("systemTrees"):
+        getSystemTrees(
+            console=console,
+            identifiedSystems=identifiedSystems,
+            ifc_file=mep_file,
+            space_file=space_file,
+            spaceTerminals=spaceTerminals,
+            showChoice="n",
+            terminalSpaces=terminalSpaces,
+            workers=workers,
+            ifc_path=mepPath,
+        )
+
+    # worst case for the BCF export: every air terminal is reported
+    allTerminals = {
+        "Supply": [terminal.id() for terminal in mep_file.by_type("IfcAirTerminal")]
+    }
+    for name, clustering in (("bcfClustered", True), ("bcfTopics", False)):
+        with stage(name):
+            old_generate_bcf_from_errors(
+                console=console,
+                ifc_file=mep_file,
+                ifc_file_path=mepPath,
+                missingAHUsystems=missingAHUsystems,
+                unassignedTerminals=allTerminals,
+                output_bcf=os.path.join(outputDir, f"{name}.bcfzip"),
+                clustering=clustering,
+            )
+
+    elements = sum(
+        len(mep_file.by_type(ifcClass))
+        for ifcClass in (
+            "IfcUnitaryEquipment",
+            "IfcDuctSegment",
+            "IfcDuctFitting",
+            "IfcAirTerminal",
+        )
+    )
+    return times, elements
+
+
+def loadHistory(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previousRun(history: list[dict], parameters: dict) -> dict | None:
+    """Last recorded run of the same model."""
+    for record in reversed(history):
+        if record["parameters"] == parameters:
+            return record
+    return None
+
+
+def scalingExponent(elements: list[int], times: list[float]) -> float | None:
+    """Slope of log(time) over log(elements) - 1 is linear scaling, 2 quadratic."""
+    if len(elements) < 2 or min(times) <= 0:
+        return None
+    return float(np.polyfit(np.log(elements), np.log(times), 1)[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the analysis stages on synthetic models of increasing size."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000],
+        help="Approximate number of MEP elements of each model",
+    )
+    parser.add_argument("--systems", type=int, default=1, help="Supply/return pairs")
+    parser.add_argument(
+        "--branching", type=int, default=1, help="Main ducts per storey"
+    )
+    parser.add_argument("--terminals", type=int, default=1, help="Terminals per space")
+    parser.add_argument(
+        "--ducts", type=int, default=1, help="Duct segments between two tees"
+    )
+    parser.add_argument(
+        "--direct-fittings",
+        action="store_true",
+        help="Connect fittings directly to each other (no duct between them)",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Best of n runs")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--models", default=None, help="Folder to keep (and reuse) the models in"
+    )
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown that counts as a regression",
+    )
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write a profile (Profiler.py) of the last run of each size",
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not record the results"
+    )
+    args = parser.parse_args()
+
+    console = Console()
+    history = loadHistory(args.results)
+    commit = gitCommit()
+    tempDir = tempfile.TemporaryDirectory()
+    modelDir = args.models or tempDir.name
+    os.makedirs(modelDir, exist_ok=True)
+
+    # warm up (imports, lazy initialisation of ifcopenshell and the zeta tables) on a small model, not recorded
+    warmupParameters = syntheticModelParameters(100)
+    warmupPaths = modelPaths(tempDir.name, warmupParameters)
+    generateSyntheticModels(*warmupPaths, **warmupParameters)
+    runPipeline(*warmupPaths, tempDir.name, args.workers)
+
+    runs = []
+    regressions = []
+    for size in args.sizes:
+        parameters = syntheticModelParameters(
+            size,
+            systems=args.systems,
+            branchingFactor=args.branching,
+            terminalsPerSpace=args.terminals,
+            ductsPerFitting=args.ducts,
+            directFittings=args.direct_fittings,
+        )
+        mepPath, archPath = modelPaths(modelDir, parameters)
+        if not (os.path.exists(mepPath) and os.path.exists(archPath)):
+            with console.status(f"Generating a model with ~{size} elements..."):
+                start = time.perf_counter()
+                generateSyntheticModels(mepPath, archPath, **parameters)
+            console.print(
+                f"Generated '{os.path.basename(mepPath)}' in {time.perf_counter() - start:.1f} s"
+            )
+
+        best = None
+        for run in range(args.repeat):
+            with console.status(
+                f"Running the pipeline on ~{size} elements ({run + 1}/{args.repeat})..."
+            ):
+                profileContext = (
+                    profiling()
+                    if args.profile and run == args.repeat - 1
+                    else contextlib.nullcontext()
+                )
+                with profileContext as prof:
+                    times, elements = runPipeline(
+                        mepPath, archPath, tempDir.name, args.workers
+                    )
+            best = (
+                times
+                if best is None
+                else {stage: min(best[stage], times[stage]) for stage in STAGES}
+            )
+        if prof is not None:
+            reportProfile(
+                console,
+                prof,
+                os.path.dirname(args.results),
+                name=f"pipelineProfile_{elements}",
+            )
+
+        record = {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "ifcopenshell": ifcopenshell.version,
+            "parameters": parameters,
+            "elements": elements,
+            "stages": best,
+            "total": sum(best.values()),
+        }
+        previous = previousRun(history, parameters)
+        if previous is not None:
+            for stage in STAGES:
+                before = previous["stages"].get(stage)
+                if (
+                    before
+                    and best[stage] > before * (1 + args.threshold)
+                    and best[stage] - before > MIN_REGRESSION_SECONDS
+                ):
+                    regressions.append(
+                        (elements, stage, before, best[stage], previous["commit"])
+                    )
+        runs.append((record, previous))
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+        with open(args.results, "a", encoding="utf-8") as f:
+            for record, _ in runs:
+                f.write(json.dumps(record) + "\n")
+
+    table_Benchmark = Table(title=f"Pipeline benchmark ({commit})", show_lines=True)
+    table_Benchmark.add_column("Stage", style="cyan")
+    for record, _ in runs:
+        table_Benchmark.add_column(
+            f"{record['elements']} elements (s)", style="magenta"
+        )
+    table_Benchmark.add_column("Scaling exponent", style="green")
+
+    elementCounts = [record["elements"] for record, _ in runs]
+    regressed = {(elements, stage) for elements, stage, *_ in regressions}
+    for stage in STAGES + ["total"]:
+        stageTimes = [
+            record["total"] if stage == "total" else record["stages"][stage]
+            for record, _ in runs
+        ]
+        cells = []
+        for (record, previous), seconds in zip(runs, stageTimes):
+            cell = f"{seconds:.3f}"
+            if previous is not None:
+                before = (
+                    previous["total"]
+                    if stage == "total"
+                    else previous["stages"].get(stage)
+                )
+                if before:
+                    cell += f" ({100 * (seconds / before - 1):+.0f}%)"
+            if (record["elements"], stage) in regressed:
+                cell = f"[bold red]{cell}[/bold red]"
+            cells.append(cell)
+        exponent = scalingExponent(elementCounts, stageTimes)
+        table_Benchmark.add_row(
+            stage, *cells, "-" if exponent is None else f"{exponent:.2f}"
+        )
+    console.print(table_Benchmark)
+
+    for elements, stage, before, after, previousCommit in regressions:
+        console.print(
+            f"[bold red]Regression: {stage} on {elements} elements took {after:.3f} s "
+            f"(was {before:.3f} s at {previousCommit})[/bold red]"
+        )
+    tempDir.cleanup()
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
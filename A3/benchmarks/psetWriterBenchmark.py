@@ -0,0 +1,136 @@
+########################################################
+"""
+PSET WRITER BENCHMARK
+
+Version: 17/10/26
+
+Compares writing the air flow Psets of many spaces with ifcopenshell.api.pset (add_pset + edit_pset per space,
+as spaceAirFlowCalculator() did before) against the bulk writer in Modules/PsetWriter.py.
+
+Each run writes Pset_SpaceOccupancyRequirements and Pset_SpaceAirHandlingDimensioning to n new spaces, and
+then writes them again (the second pass updates the existing Psets). Both methods must give the same values.
+
+How to use:
+    python A3/benchmarks/psetWriterBenchmark.py --spaces 1000 10000 --repeat 3
+
+"""
+
+########################################################
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules.PsetWriter import writePsets
+
+import argparse
+import time
+import ifcopenshell
+import ifcopenshell.api.pset
+import ifcopenshell.guid
+import ifcopenshell.util.element
+from rich.console import Console
+from rich.table import Table
+
+
+def spacePsetValues(spaceCount: int, run: int) -> list[dict]:
+    """Pset values of each space (a few distinct values, like the rounded air flows of real spaces)."""
+    return [
+        {
+            "Pset_SpaceOccupancyRequirements": {
+                "OccupancyNumber": float((i + run) % 12)
+            },
+            "Pset_SpaceAirHandlingDimensioning": {
+                "DesignAirFlow": round(7 * ((i + run) % 12) + 0.7 * (i % 40), 2)
+            },
+        }
+        for i in range(spaceCount)
+    ]
+
+
+def newSpaceFile(spaceCount: int) -> tuple[ifcopenshell.file, list]:
+    ifc_file = ifcopenshell.file(schema="IFC4")
+    spaces = [
+        ifc_file.createIfcSpace(GlobalId=ifcopenshell.guid.new(), Name=str(i))
+        for i in range(spaceCount)
+    ]
+    return ifc_file, spaces
+
+
+def writeWithApi(ifc_file: ifcopenshell.file, spaces: list, values: list[dict]):
+    for space, psets in zip(spaces, values):
+        for psetName, properties in psets.items():
+            pset = ifcopenshell.api.pset.add_pset(
+                file=ifc_file, product=space, name=psetName
+            )
+            ifcopenshell.api.pset.edit_pset(
+                file=ifc_file, pset=pset, properties=properties
+            )
+
+
+def writeWithPsetWriter(ifc_file: ifcopenshell.file, spaces: list, values: list[dict]):
+    writePsets(ifc_file, dict(zip(spaces, values)))
+
+
+def readPsets(spaces: list) -> list[dict]:
+    return [
+        {
+            name: {prop: value for prop, value in pset.items() if prop != "id"}
+            for name, pset in ifcopenshell.util.element.get_psets(space).items()
+        }
+        for space in spaces
+    ]
+
+
+def benchmark(spaceCount: int, method, repeat: int) -> tuple[float, int, list]:
+    """Best time of writing the Psets twice, the entity count of the file, and the written values."""
+    best = None
+    for _ in range(repeat):
+        ifc_file, spaces = newSpaceFile(spaceCount)
+        start = time.perf_counter()
+        for run in range(2):
+            method(ifc_file, spaces, spacePsetValues(spaceCount, run))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(list(ifc_file)), readPsets(spaces)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the bulk Pset writer against ifcopenshell.api.pset."
+    )
+    parser.add_argument("--spaces", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    console = Console()
+    table_Benchmark = Table(title="Pset writer benchmark", show_lines=True)
+    table_Benchmark.add_column("Spaces", style="cyan")
+    table_Benchmark.add_column("api.pset (s)", style="magenta")
+    table_Benchmark.add_column("PsetWriter (s)", style="magenta")
+    table_Benchmark.add_column("Speedup", style="green")
+    table_Benchmark.add_column("Entities (api / PsetWriter)", style="blue")
+
+    for spaceCount in args.spaces:
+        apiTime, apiEntities, apiValues = benchmark(
+            spaceCount, writeWithApi, args.repeat
+        )
+        writerTime, writerEntities, writerValues = benchmark(
+            spaceCount, writeWithPsetWriter, args.repeat
+        )
+        if apiValues != writerValues:
+            console.print(
+                f"[bold red]The Psets written to {spaceCount} spaces are not the same![/bold red]"
+            )
+            sys.exit(1)
+
+        table_Benchmark.add_row(
+            str(spaceCount),
+            f"{apiTime:.3f}",
+            f"{writerTime:.3f}",
+            f"{apiTime / writerTime:.1f}x",
+            f"{apiEntities} / {writerEntities}",
+        )
+
+    console.print(table_Benchmark)
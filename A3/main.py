@@ -43,6 +43,8 @@ How to use:
         - One xxx_ARCH.ifc file containing spaces (and furniture for occupancy estimation)
 - Run main.py and follow the instructions in the CLI
 - Enjoy BCF files of failing checks and terminal output :)
+- Run "python A3/main.py --profile" to time each step (table in the terminal, trace in A3/outputFiles/profile)
+  ("--profile-memory" also records the peak memory of each step, but makes the run a lot slower)
 
 Future Work:
     small(er) stuff
@@ -69,12 +71,15 @@ Authors: s214310, s203493, s201348
 from Modules.AirFlowEstimator import spaceAirFlowCalculator
 from Modules.VentilationSystemAnalyzer import *
 from Modules.BcfGenerator import *
+from Modules.GeometryEngine import useGeometryCache
+from Modules.Profiler import reportProfile, startProfiling, stopProfiling
 from Modules.setupFunctions import *
 
 
 # from scripts import setupFunctions
 # from scripts import systemAnalyzer
 import os
+import sys
 from datetime import datetime
 import ifcopenshell
 from rich.console import Console
@@ -86,6 +91,8 @@ from rich.panel import Panel
 if __name__ == "__main__":
     start_time = datetime.now()
     console = Console()
+    if "--profile" in sys.argv or "--profile-memory" in sys.argv:
+        startProfiling(memory="--profile-memory" in sys.argv)
     console.print("\n")
     console.print(
         Panel.fit(
@@ -102,6 +109,8 @@ if __name__ == "__main__":
     )
     ifc_file = ifcopenshell.open(ifc_filePath)
     space_file_beforeCheck = ifcopenshell.open(ifc_SpacePath)
+    useGeometryCache(ifc_file, ifc_filePath)
+    useGeometryCache(space_file_beforeCheck, ifc_SpacePath)
     ifc_file_Spaces, table_AirFlows = spaceAirFlowCalculator(
         console=console, space_file=space_file_beforeCheck, building_category="II"
     )
@@ -130,6 +139,7 @@ if __name__ == "__main__":
                 space_file_name="25-10-D-ARCH.ifc",
             )
         )
+        terminalSpaces = buildTerminalSpaceIndex(ifc_file_Spaces, spaceTerminals)
 
     with console.status(
         status="Assigning air flows and pressure losses to air terminals..."
@@ -140,6 +150,7 @@ if __name__ == "__main__":
             ifc_file=ifc_file,
             space_file=ifc_file_Spaces,
             spaceTerminals=spaceTerminals,
+            terminalSpaces=terminalSpaces,
             showChoice="y",
         )
 
@@ -153,6 +164,10 @@ if __name__ == "__main__":
             output_bcf="A3/outputFiles/HVAC_Issues.bcfzip",
         )
 
+    prof = stopProfiling()
+    if prof is not None:
+        reportProfile(console, prof, "A3/outputFiles/profile")
+
     end_time = datetime.now()
     elapsed_time = end_time - start_time
     console.print(
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# the modules are imported as "Modules.xxx", as in main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules.SyntheticModelGenerator import generateSyntheticModels
+
+
+@pytest.fixture(scope="session")
+def syntheticModels(tmp_path_factory):
+    """A small synthetic MEP/ARCH pair, with fittings connected directly to each other."""
+    folder = tmp_path_factory.mktemp("synthetic")
+    return generateSyntheticModels(
+        str(folder / "synthetic-MEP.ifc"),
+        str(folder / "synthetic-ARCH.ifc"),
+        storeys=2,
+        spacesPerStorey=3,
+        systems=1,
+        branchingFactor=2,
+        terminalsPerSpace=1,
+        directFittings=True,
+    )
@@ -0,0 +1,100 @@
+import os
+import zipfile
+from pathlib import Path
+
+import ifcopenshell
+import pytest
+from bcf.v3.bcfxml import BcfXml
+
+from Modules.BcfGenerator import issueBBoxes, recoverBcfZip, write_bcf_issues
+
+TOPICS = 60
+
+
+@pytest.fixture(scope="module")
+def issues(syntheticModels):
+    mep = ifcopenshell.open(syntheticModels["MEP"])
+    terminals = mep.by_type("IfcAirTerminal")
+    issues = [
+        {
+            "title": f"Issue {i:02d}",
+            "message": f"Air terminal {terminals[i % len(terminals)].GlobalId}",
+            "elements": [terminals[i % len(terminals)]],
+        }
+        for i in range(TOPICS)
+    ]
+    return issues, issueBBoxes(mep, [issue["elements"][0] for issue in issues])
+
+
+def writeIssues(path, issues, bboxes, **kwargs) -> int:
+    return write_bcf_issues(
+        str(path), "Test", issues, author="test", bboxes=bboxes, **kwargs
+    )
+
+
+def topicTitles(path) -> list:
+    bcf_project = BcfXml.load(Path(path))
+    try:
+        return sorted(topic.topic.title for topic in bcf_project.topics.values())
+    finally:
+        bcf_project.close()
+
+
+def test_streamed_file_loads(tmp_path, issues):
+    issues, bboxes = issues
+    path = tmp_path / "issues.bcfzip"
+
+    assert writeIssues(path, issues, bboxes, flushEvery=7) == TOPICS
+
+    bcf_project = BcfXml.load(path)
+    try:
+        assert bcf_project.project.name == "Test"
+        assert len(bcf_project.topics) == TOPICS
+        for topic in bcf_project.topics.values():
+            assert len(topic.viewpoints) == 1
+            assert len(topic.comments) == 1
+    finally:
+        bcf_project.close()
+    assert topicTitles(path) == sorted(issue["title"] for issue in issues)
+
+
+def test_truncated_file_is_recovered(tmp_path, issues):
+    issues, bboxes = issues
+    path = tmp_path / "issues.bcfzip"
+    writeIssues(path, issues, bboxes)
+
+    # a crash halfway through the file: no zip directory, the last entry is cut off
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+    with pytest.raises(zipfile.BadZipFile):
+        zipfile.ZipFile(path)
+
+    recovered = recoverBcfZip(str(path))
+
+    assert 0 < recovered < TOPICS
+    titles = topicTitles(path)
+    assert len(titles) == recovered
+    # the topics are written in order, so the first topics are the complete ones
+    assert titles == sorted(issue["title"] for issue in issues[:recovered])
+    # topics without markup.bcf are left out
+    with zipfile.ZipFile(path) as bcf_zip:
+        folders = {name.split("/")[0] for name in bcf_zip.namelist() if "/" in name}
+    assert len(folders) == recovered
+
+
+def test_append_resumes_without_duplicates(tmp_path, issues):
+    issues, bboxes = issues
+    path = tmp_path / "issues.bcfzip"
+    writeIssues(path, issues, bboxes)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    # the truncated file is recovered when it is opened, and only the missing topics are added
+    written = writeIssues(path, issues, bboxes, append=True)
+
+    assert 0 < written < TOPICS
+    assert topicTitles(path) == sorted(issue["title"] for issue in issues)
+
+    # appending the same issues again adds nothing
+    assert writeIssues(path, issues, bboxes, append=True) == 0
+    assert len(topicTitles(path)) == TOPICS
@@ -0,0 +1,256 @@
+import math
+
+import ifcopenshell
+import numpy as np
+import pytest
+from rich.console import Console
+
+from Modules.AirFlowEstimator import spaceAirFlowCalculator
+from Modules.FittingLoss import (
+    bendZeta,
+    dynamicPressure,
+    teeZeta,
+    transitionZeta,
+    zetaTable,
+)
+from Modules.NetworkStore import (
+    DEFAULT_FITTING_PRESSURE_LOSS,
+    FITTING_TYPES,
+    networkStore,
+)
+from Modules.VentilationSystemAnalyzer import (
+    ahuFinder,
+    airTerminalSpaceClashAnalyzer,
+    getSystemTrees,
+)
+
+ROUND_AREA = math.pi * 0.05**2  # ø100 duct
+
+
+# zetaTable
+
+
+@pytest.fixture
+def table():
+    # 2 x 3 grid, (2, 30) is missing
+    rows = [
+        {"x": 1, "y": 10, "zeta": 1.0},
+        {"x": 1, "y": 20, "zeta": 2.0},
+        {"x": 1, "y": 30, "zeta": 3.0},
+        {"x": 2, "y": 10, "zeta": 5.0},
+        {"x": 2, "y": 20, "zeta": 6.0},
+    ]
+    return zetaTable(rows, "x", "y")
+
+
+def test_zetaTable_grid_points(table):
+    assert table(1, 20)[0] == pytest.approx(2.0)
+    assert table(2, 10)[0] == pytest.approx(5.0)
+
+
+def test_zetaTable_fills_missing_points_with_nearest_y(table):
+    assert table(2, 30)[0] == pytest.approx(6.0)
+
+
+def test_zetaTable_bilinear_interpolation(table):
+    assert table(1.5, 10)[0] == pytest.approx(3.0)
+    assert table(1, 15)[0] == pytest.approx(1.5)
+    assert table(1.5, 15)[0] == pytest.approx((1.0 + 2.0 + 5.0 + 6.0) / 4)
+
+
+def test_zetaTable_clamps_at_grid_edges(table):
+    assert table(0, 10)[0] == pytest.approx(1.0)
+    assert table(10, 10)[0] == pytest.approx(5.0)
+    assert table(1, 0)[0] == pytest.approx(1.0)
+    assert table(1, 100)[0] == pytest.approx(3.0)
+    assert table(-5, 1000)[0] == pytest.approx(3.0)
+
+
+def test_zetaTable_nan_input(table):
+    zeta = table([1, np.nan, 1], [10, 10, np.nan])
+    assert zeta[0] == pytest.approx(1.0)
+    assert np.isnan(zeta[1:]).all()
+
+
+def test_zetaTable_single_grid_line():
+    single = zetaTable([{"x": 1, "y": 10, "zeta": 0.5}], "x", "y")
+    assert single([0, 1, 5], [0, 10, 50]) == pytest.approx([0.5, 0.5, 0.5])
+
+
+# zeta values against pressureLossDB (r/d = r/h = 1 and a 30 degree transition angle)
+
+
+def test_bendZeta_round():
+    # bend_round r_d=1.0: 75 mm -> 0.44, 100 mm -> 0.37, 250 mm -> 0.24
+    assert bendZeta(0.1, np.nan, np.nan)[0] == pytest.approx(0.37)
+    assert bendZeta(0.0875, np.nan, np.nan)[0] == pytest.approx((0.44 + 0.37) / 2)
+    assert bendZeta(0.05, np.nan, np.nan)[0] == pytest.approx(0.44)
+    assert bendZeta(0.4, np.nan, np.nan)[0] == pytest.approx(0.24)
+
+
+def test_bendZeta_rectangular():
+    # bend_rectangular r_h=1.0: b_h=1.0 -> 0.21, b_h=2.0 -> 0.18, b_h=0.25 -> 0.27
+    assert bendZeta(np.nan, 0.4, 0.4)[0] == pytest.approx(0.21)
+    assert bendZeta(np.nan, 0.8, 0.4)[0] == pytest.approx(0.18)
+    assert bendZeta(np.nan, 0.1, 0.4)[0] == pytest.approx(0.27)
+
+
+def test_transitionZeta():
+    # expansion 30 degrees, A2_A1=2 -> 0.32 (velocity in the inlet)
+    zeta, referenceArea = transitionZeta(0.1, 0.2)
+    assert zeta[()] == pytest.approx(0.32)
+    assert referenceArea[()] == pytest.approx(0.1)
+
+    # reduction 30 degrees, A1_A2=0.25 -> 0.04 (velocity in the outlet)
+    zeta, referenceArea = transitionZeta(0.2, 0.05)
+    assert zeta[()] == pytest.approx(0.04)
+    assert referenceArea[()] == pytest.approx(0.05)
+
+    zeta, _ = transitionZeta(0.1, 0.1)
+    assert zeta[()] == 0
+
+
+def test_teeZeta():
+    # t_through A1_A2=0.5, qv1_qv=0.6 -> 0.14; t_branch_90 A2_Atot=0.3, qv2_qv=0.4 -> 0.81
+    zetaThrough, zetaBranch = teeZeta(0.1, 0.05, 0.03, 100, 60, 40)
+    assert zetaThrough[0] == pytest.approx(0.14)
+    assert zetaBranch[0] == pytest.approx(0.81)
+
+
+# networkStore.fittingPressureLosses
+
+
+def systemNetwork(systemName: str = "VI01") -> networkStore:
+    network = networkStore()
+    network.addElement("Root", None, "Root")
+    network.addElement(systemName, "Root", "IfcDistributionSystem")
+    network.addElement("AHU", systemName, "IfcUnitaryEquipment")
+    return network
+
+
+def addDuct(network, identifier, parent, airFlow, crossArea=ROUND_AREA, diameter=0.1):
+    row = network.addElement(identifier, parent, "IfcDuctSegment").row
+    network.airFlow[row] = airFlow
+    network.crossArea[row] = crossArea
+    network.diameter[row] = diameter
+    network.stepID[row] = 1000 + row
+    return row
+
+
+def addFitting(network, identifier, parent, airFlow, fittingType):
+    row = network.addElement(identifier, parent, "IfcDuctFitting").row
+    network.airFlow[row] = airFlow
+    # fittings have no cross section of their own
+    network.crossArea[row] = 0
+    network.fittingType[row] = FITTING_TYPES.index(fittingType)
+    network.stepID[row] = 1000 + row
+    return row
+
+
+def addTee(network, parent, systemName: str = "VI01") -> tuple:
+    """Inlet duct -> tee -> through duct (60 l/s, 0.05 m2) and branch duct (40 l/s, 0.03 m2)."""
+    addDuct(network, "inlet", parent, 100, crossArea=0.1)
+    tee = addFitting(network, "tee", "inlet", 100, "Tee")
+    addDuct(network, "through", "tee", 60, crossArea=0.05)
+    branch = addDuct(network, "branch", "tee", 40, crossArea=0.03)
+    network.branchStepID[tee] = network.stepID[branch]
+    return tee
+
+
+def test_bend_between_ducts():
+    network = systemNetwork()
+    addDuct(network, "d1", "AHU", 50)
+    bend = addFitting(network, "bend", "d1", 50, "Bend")
+    addDuct(network, "d2", "bend", 50)
+
+    loss = network.fittingPressureLosses(np.array([bend]))[0]
+    assert loss == pytest.approx(round(0.37 * dynamicPressure(50, ROUND_AREA), 2))
+
+
+def test_supply_tee():
+    network = systemNetwork()
+    tee = addTee(network, "AHU")
+
+    loss = network.fittingPressureLosses(np.array([tee]))[0]
+    expected = max(
+        0.14 * dynamicPressure(60, 0.05),
+        0.81 * dynamicPressure(40, 0.03),
+    )
+    assert loss == pytest.approx(round(expected, 2))
+
+
+def test_return_tee_gets_default_loss():
+    network = systemNetwork("VU01")
+    tee = addTee(network, "AHU")
+
+    loss = network.fittingPressureLosses(np.array([tee]))[0]
+    assert loss == DEFAULT_FITTING_PRESSURE_LOSS
+
+
+def test_fittings_next_to_fittings_use_the_nearest_duct():
+    # duct -> bend -> bend -> duct: both bends look through the other bend
+    network = systemNetwork()
+    addDuct(network, "d1", "AHU", 50)
+    bend1 = addFitting(network, "bend1", "d1", 50, "Bend")
+    bend2 = addFitting(network, "bend2", "bend1", 50, "Bend")
+    addDuct(network, "d2", "bend2", 50)
+
+    losses = network.fittingPressureLosses(np.array([bend1, bend2]))
+    expected = round(0.37 * dynamicPressure(50, ROUND_AREA), 2)
+    assert losses == pytest.approx([expected, expected])
+
+
+def test_fittings_without_ducts_get_default_loss():
+    # AHU -> bend -> straight -> terminal: no duct segments to look up
+    network = systemNetwork()
+    bend = addFitting(network, "bend", "AHU", 50, "Bend")
+    straight = addFitting(network, "straight", "bend", 50, "Straight")
+    network.addElement("terminal", "straight", "IfcAirTerminal")
+
+    losses = network.fittingPressureLosses(np.array([bend, straight]))
+    assert (losses == DEFAULT_FITTING_PRESSURE_LOSS).all()
+
+
+def test_fitting_losses_are_finite(syntheticModels):
+    console = Console(quiet=True)
+    mep = ifcopenshell.open(syntheticModels["MEP"])
+    arch = ifcopenshell.open(syntheticModels["ARCH"])
+    arch, _ = spaceAirFlowCalculator(console, arch, "II")
+    identifiedSystems, _, _ = ahuFinder(console, mep)
+    spaceTerminals, _, _ = airTerminalSpaceClashAnalyzer(
+        console, mep, arch, "synthetic", identifiedSystems
+    )
+    systemsTree, _ = getSystemTrees(
+        console, identifiedSystems, mep, arch, spaceTerminals, showChoice="n", workers=1
+    )
+
+    fittings = [
+        node.data
+        for node in systemsTree.all_nodes()
+        if node.data is not None and node.data.IfcType == "IfcDuctFitting"
+    ]
+    assert fittings
+    for fitting in fittings:
+        assert math.isfinite(fitting.elementPressureLoss)
+        assert math.isfinite(fitting.pathPressureLoss)
+
+    network = fittings[0].network
+    returnTees = [
+        fitting
+        for fitting in fittings
+        if fitting.fittingType == "Tee"
+        and "VU" in network.identifiers[network.system[fitting.row]]
+    ]
+    supplyTees = [
+        fitting
+        for fitting in fittings
+        if fitting.fittingType == "Tee" and fitting not in returnTees
+    ]
+    assert returnTees and supplyTees
+    assert all(
+        tee.elementPressureLoss == DEFAULT_FITTING_PRESSURE_LOSS for tee in returnTees
+    )
+    # the supply tees next to other fittings are looked up through them
+    assert any(
+        tee.elementPressureLoss != DEFAULT_FITTING_PRESSURE_LOSS for tee in supplyTees
+    )
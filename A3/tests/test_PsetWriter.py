@@ -0,0 +1,154 @@
+import ifcopenshell
+import ifcopenshell.api.pset
+import ifcopenshell.api.root
+import ifcopenshell.api.type
+import ifcopenshell.util.element
+import pytest
+
+from Modules.PropertyIndex import getPropertyIndex
+from Modules.PsetWriter import writePsets
+
+
+@pytest.fixture
+def model():
+    ifc_file = ifcopenshell.file(schema="IFC4")
+    ifcopenshell.api.root.create_entity(ifc_file, ifc_class="IfcProject", name="Test")
+    return ifc_file
+
+
+def newSpace(ifc_file, name: str):
+    return ifcopenshell.api.root.create_entity(
+        ifc_file, ifc_class="IfcSpace", name=name
+    )
+
+
+def addPset(ifc_file, element, name: str, properties: dict):
+    pset = ifcopenshell.api.pset.add_pset(ifc_file, product=element, name=name)
+    ifcopenshell.api.pset.edit_pset(ifc_file, pset=pset, properties=properties)
+    return pset
+
+
+def psetNames(element) -> list:
+    return [
+        rel.RelatingPropertyDefinition.Name
+        for rel in element.IsDefinedBy
+        if rel.is_a("IfcRelDefinesByProperties")
+    ]
+
+
+def getProperty(element, psetName: str, prop: str):
+    return ifcopenshell.util.element.get_pset(element, psetName, prop)
+
+
+def test_existing_pset_is_updated_not_duplicated(model):
+    space = newSpace(model, "A")
+    pset = addPset(model, space, "Airflow", {"DesignAirFlow": 10.0, "Note": "x"})
+    psetCount = len(model.by_type("IfcPropertySet"))
+
+    written = writePsets(model, {space: {"Airflow": {"DesignAirFlow": 25.0}}})
+    written = writePsets(model, {space: {"Airflow": {"ExtraFlow": 5.0}}})
+
+    assert written[space]["Airflow"] == pset
+    assert psetNames(space).count("Airflow") == 1
+    assert len(model.by_type("IfcPropertySet")) == psetCount
+    assert getProperty(space, "Airflow", "DesignAirFlow") == 25.0
+    assert getProperty(space, "Airflow", "ExtraFlow") == 5.0
+    assert getProperty(space, "Airflow", "Note") == "x"
+
+
+def test_shared_properties_are_replaced(model):
+    spaces = [newSpace(model, name) for name in "ABC"]
+
+    # the same value on all spaces: one shared property
+    writePsets(model, {space: {"Airflow": {"DesignAirFlow": 10.0}} for space in spaces})
+    assert len(model.by_type("IfcPropertySingleValue")) == 1
+
+    writePsets(model, {spaces[0]: {"Airflow": {"DesignAirFlow": 20.0}}})
+
+    assert getProperty(spaces[0], "Airflow", "DesignAirFlow") == 20.0
+    assert getProperty(spaces[1], "Airflow", "DesignAirFlow") == 10.0
+    assert getProperty(spaces[2], "Airflow", "DesignAirFlow") == 10.0
+
+
+def test_shared_property_from_another_tool_is_replaced(model):
+    spaceA, spaceB = newSpace(model, "A"), newSpace(model, "B")
+    shared = model.createIfcPropertySingleValue(
+        "DesignAirFlow", None, model.createIfcReal(10.0)
+    )
+    for space in (spaceA, spaceB):
+        pset = ifcopenshell.api.pset.add_pset(model, product=space, name="Airflow")
+        pset.HasProperties = [shared]
+
+    writePsets(model, {spaceA: {"Airflow": {"DesignAirFlow": 20.0}}})
+
+    assert getProperty(spaceA, "Airflow", "DesignAirFlow") == 20.0
+    assert getProperty(spaceB, "Airflow", "DesignAirFlow") == 10.0
+    assert shared.NominalValue.wrappedValue == 10.0
+
+
+def test_non_single_value_properties_are_replaced(model):
+    spaceA, spaceB = newSpace(model, "A"), newSpace(model, "B")
+    enumeration = model.createIfcPropertyEnumeration(
+        "Categories", [model.createIfcLabel("I"), model.createIfcLabel("II")]
+    )
+    own = model.createIfcPropertyEnumeratedValue(
+        "Category", None, [model.createIfcLabel("I")], enumeration
+    )
+    shared = model.createIfcPropertyEnumeratedValue(
+        "Class", None, [model.createIfcLabel("II")], enumeration
+    )
+    psetA = ifcopenshell.api.pset.add_pset(model, product=spaceA, name="Indoor")
+    psetA.HasProperties = [own, shared]
+    psetB = ifcopenshell.api.pset.add_pset(model, product=spaceB, name="Indoor")
+    psetB.HasProperties = [shared]
+    ownID = own.id()
+
+    writePsets(model, {spaceA: {"Indoor": {"Category": "II", "Class": "I"}}})
+
+    assert getProperty(spaceA, "Indoor", "Category") == "II"
+    assert getProperty(spaceA, "Indoor", "Class") == "I"
+    assert getProperty(spaceB, "Indoor", "Class") == ["II"]
+    assert all(prop.is_a("IfcPropertySingleValue") for prop in psetA.HasProperties)
+    assert psetB.HasProperties == (shared,)
+    # the replaced property is removed, the one still used by spaceB is kept
+    with pytest.raises(RuntimeError):
+        model.by_id(ownID)
+    assert model.by_id(shared.id()) == shared
+
+
+def test_property_index_matches_get_pset(model):
+    spaces = [newSpace(model, name) for name in "ABCD"]
+    spaceType = ifcopenshell.api.root.create_entity(
+        model, ifc_class="IfcSpaceType", name="Office"
+    )
+    ifcopenshell.api.type.assign_type(
+        model, related_objects=spaces[:2], relating_type=spaceType
+    )
+    addPset(model, spaceType, "Airflow", {"DesignAirFlow": 1.0, "Category": "I"})
+    addPset(model, spaces[0], "Airflow", {"DesignAirFlow": 2.0})
+    addPset(model, spaces[2], "Other", {"Note": "x"})
+    index = getPropertyIndex(model)
+
+    writePsets(
+        model,
+        {
+            spaces[0]: {"Airflow": {"DesignAirFlow": 3.0, "Extra": True}},
+            spaces[1]: {"Airflow": {"DesignAirFlow": 3.0}},
+            spaces[2]: {"Airflow": {"DesignAirFlow": 4.0}, "Other": {"Note": "y"}},
+            spaces[3]: {"Airflow": {"Category": "II", "Count": 2}},
+            spaceType: {"Airflow": {"Category": "III"}},
+        },
+    )
+    writePsets(model, {spaces[1]: {"Airflow": {"DesignAirFlow": 5.0}}})
+
+    for element in spaces + [spaceType]:
+        for psetName, props in (
+            ("Airflow", ("DesignAirFlow", "Category", "Extra", "Count")),
+            ("Other", ("Note",)),
+        ):
+            for prop in props:
+                assert index.get(element, psetName, prop) == getProperty(
+                    element, psetName, prop
+                ), (element.Name, psetName, prop)
+    assert getProperty(spaces[0], "Airflow", "Category") == "III"
+    assert getProperty(spaces[1], "Airflow", "DesignAirFlow") == 5.0